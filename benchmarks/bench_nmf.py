@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of the NMF model against the LDA model.
+
+It compares the fit time of the two comparison models at equal component
+counts, as well as how much the topics separate the search engines.
+"""
+
+import json
+import time
+import click
+import numpy as np
+from benchmarks.synthetic_corpus import synthetic_bows
+from seanalysis.models.lda import LDA
+from seanalysis.models.nmf import NMFCompare
+
+
+def evaluate(model):
+    start = time.time()
+    model.construct()
+    model.evaluate()
+    elapsed = time.time() - start
+    # Share of the dominant search engine of every topic, averaged over
+    # topics; 1 means that every topic contains a single search engine.
+    dominance = np.max(model.se_dist, axis=0).mean()
+    return elapsed, float(dominance), int(model.se_dist.shape[1])
+
+
+@click.command()
+@click.option('--search-engines', default=3, type=int)
+@click.option('--rows', default=3000, type=int,
+              help='Number of results per search engine')
+@click.option('--terms', default=20000, type=int)
+@click.option('--density', default=0.002, type=float)
+@click.option('--overlap', default=0.7, type=float,
+              help='Relative weight of the terms not preferred by a search'
+              ' engine')
+@click.option('--components', default='10,20,50', type=str)
+@click.option('--jobs', default=1, type=int, help='Processors used by LDA')
+@click.option('--seed', default=0, type=int)
+def main(search_engines, rows, terms, density, overlap, components, jobs,
+         seed):
+    bows = synthetic_bows(search_engines, rows, terms, density, overlap,
+                          seed)
+    queries = ['q%d' % (i % 50) for i in range(rows)]
+    report = []
+    for n in [int(c) for c in components.split(',')]:
+        lda_time, lda_dominance, lda_topics = evaluate(
+            LDA(bows, queries, components=n, jobs=jobs))
+        for loss in ['frobenius', 'kullback-leibler']:
+            nmf_time, nmf_dominance, nmf_topics = evaluate(
+                NMFCompare(bows, queries, components=n, loss=loss,
+                           seed=seed))
+            report.append({
+                'components': n, 'loss': loss,
+                'lda_time': lda_time, 'nmf_time': nmf_time,
+                'speedup': lda_time / nmf_time,
+                'lda_dominance': lda_dominance,
+                'nmf_dominance': nmf_dominance,
+                'lda_topics': lda_topics, 'nmf_topics': nmf_topics
+            })
+    click.echo(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of the dimensionality reduction stage of classification models.
+
+It compares the fit time and the AUC of the search engine classification
+model on the full feature space with the ones on the reduced feature space.
+"""
+
+import json
+import time
+import click
+import numpy as np
+from benchmarks.synthetic_corpus import synthetic_bows
+from seanalysis.algorithms.reduction import reduce_bows
+from seanalysis.models.se_clf import SEClassificationModel
+
+
+def evaluate(bows, queries, classifier, seed):
+    start = time.time()
+    model = SEClassificationModel(bows, queries, classifier=classifier,
+                                  metric='roc', seed=seed)
+    model.construct()
+    model.evaluate()
+    return time.time() - start, float(np.mean(
+        [result.metrics[2] for result in model.results]))
+
+
+@click.command()
+@click.option('--search-engines', default=3, type=int)
+@click.option('--rows', default=3000, type=int,
+              help='Number of results per search engine')
+@click.option('--terms', default=20000, type=int)
+@click.option('--density', default=0.002, type=float)
+@click.option('--overlap', default=0.7, type=float,
+              help='Relative weight of the terms not preferred by a search'
+              ' engine')
+@click.option('--components', default='50,100,200', type=str)
+@click.option('--classifier', default='LINSVC', type=str)
+@click.option('--seed', default=0, type=int)
+def main(search_engines, rows, terms, density, overlap, components,
+         classifier, seed):
+    bows = synthetic_bows(search_engines, rows, terms, density, overlap,
+                          seed)
+    queries = ['q%d' % (i % 50) for i in range(rows)]
+    full_time, full_auc = evaluate(bows, queries, classifier, seed)
+    report = [{'reduction': None, 'components': terms, 'time': full_time,
+               'auc': full_auc}]
+    for method in ['srp', 'svd']:
+        for n in [int(c) for c in components.split(',')]:
+            start = time.time()
+            reduced = reduce_bows(bows, method, n, random_state=seed)
+            reduction_time = time.time() - start
+            fit_time, auc = evaluate(reduced, queries, classifier, seed)
+            report.append({
+                'reduction': method, 'components': n,
+                'reduction_time': reduction_time, 'time': fit_time,
+                'speedup': full_time / (reduction_time + fit_time),
+                'auc': auc, 'auc_change': auc - full_auc
+            })
+    click.echo(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+#! /usr/bin/env python
+
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark suite of the stages of the analysis on a synthetic corpus.
+
+It times the loaders of results, every string comparison method (including
+the metric T), the bag of words representation, the construction and the
+evaluation of every model, the CP-APR algorithm and the import time of the
+tool. The timings are written
+to a JSON file along with the commit and the parameters of the corpus, so
+that the timings of two commits can be compared with `--compare`.
+"""
+
+from collections import OrderedDict
+from fnmatch import fnmatch
+import json
+from os.path import join
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import click
+import numpy as np
+from benchmarks.synthetic_corpus import SyntheticCorpus
+from seanalysis import utils
+from seanalysis.algorithms.bag_of_words import BagOfWords
+from seanalysis.compare_sorting import STRING_COMPARISON_METHODS, \
+    find_distance
+from seanalysis.controller.controller import Controller, SUPPORTED_MODELS, \
+    SUPPORTED_MODELS_PER_METHOD
+from seanalysis.corpus import Corpus
+from seanalysis.feature_store import Features
+from seanalysis.models.index_clf import IndexClassificationModel
+from seanalysis.models.tensor import cp_apr, cp_apr_sparse, random_model
+
+# Maximum number of outer iterations of CP-APR.
+OUTER_ITERATIONS = 50
+
+# Configuration of every model, as given to `sesim cont -c`.
+MODEL_CONFIGS = {
+    'tensor': ['components=5', 'outer_iter=%d' % OUTER_ITERATIONS, 'seed=0'],
+    'lda': ['components=10'],
+    'nmf': ['components=10', 'seed=0'],
+    'query': ['classifier=LINSVC', 'evaluation=hoc'],
+    'se': ['classifier=LINSVC', 'metric=roc', 'folds=3', 'seed=0'],
+    'stream': ['seed=0']
+}
+
+# Weights of the metric T, as given to `sesim metrict`.
+WEIGHTS = (np.array([0.8]), np.array([1.]), np.array([0.33]))
+
+# Registered benchmarks; every benchmark is a function which takes the
+# fixture and returns a tuple (setup, run), where `run(setup())` is timed.
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """ Register the decorated function as the given benchmark. """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class Fixture(object):
+    """
+    This class holds the synthetic corpus of the benchmarks and loads its
+    results lazily, so that only the data of the selected benchmarks are
+    loaded.
+    """
+    def __init__(self, results_dir, category, search_engines, N, vocabulary):
+        self.results_dir = results_dir
+        self.category = category
+        self.search_engines = search_engines
+        self.N = N
+        self.vocabulary = vocabulary
+        self._cache = {}
+
+    def _cached(self, key, load):
+        if key not in self._cache:
+            self._cache[key] = load()
+        return self._cache[key]
+
+    def snippets(self, per_day=False):
+        return self._cached(('snippets', per_day), lambda: utils.load_snippets(
+            self.results_dir, self.category, self.search_engines, self.N,
+            per_day))
+
+    def titles(self):
+        return self._cached('titles', lambda: utils.load_titles(
+            self.results_dir, self.category, self.search_engines, self.N,
+            per_day=False))
+
+    def urls(self):
+        return self._cached('urls', lambda: utils.load_urls(
+            self.results_dir, self.category, self.search_engines, self.N))
+
+    def batches(self):
+        return utils.DayBatches(self.results_dir, self.category,
+                                self.search_engines, self.N, per_day=False)
+
+    def features(self):
+        def build():
+            bow = BagOfWords(self.snippets())
+            bows = bow.build_bows(self.vocabulary)
+            return Features(bows, bow.get_queries(), bow.get_indexes(),
+                            bow.get_keys(), bow.terms)
+        return self._cached('features', build)
+
+
+def _model(fixture, name):
+    """
+    Create a model of the fixture as `Controller.fit_category` does.
+    """
+    if name == 'index':
+        features = fixture.features()
+        return IndexClassificationModel(features.bows, features.queries,
+                                        features.indexes, seed=0)
+    method = next(method for method, models in
+                  SUPPORTED_MODELS_PER_METHOD.items() if name in models)
+    models, config = Controller(method, name, MODEL_CONFIGS[name]).prepare(
+        False)
+    model_cls = models[0]
+    if getattr(model_cls, 'streaming', False):
+        return model_cls(fixture.batches(), **config)
+    features = fixture.features()
+    if getattr(model_cls, 'incremental', False):
+        return model_cls(features.bows, features.queries, keys=features.keys,
+                         terms=features.terms, category=fixture.category,
+                         **config)
+    return model_cls(features.bows, features.queries, **config)
+
+
+def _constructed(fixture, name):
+    model = _model(fixture, name)
+    model.construct()
+    return model
+
+
+@benchmark('load.document')
+def bench_load_document(fixture):
+    paths = utils.get_result_dirs(fixture.results_dir, fixture.category,
+                                  fixture.search_engines)
+    return lambda: paths, lambda paths: [utils.load_document(path)
+                                         for path in paths]
+
+
+@benchmark('load.snippets.per_day')
+def bench_load_snippets_per_day(fixture):
+    return lambda: None, lambda _: utils.load_snippets(
+        fixture.results_dir, fixture.category, fixture.search_engines,
+        fixture.N, per_day=True)
+
+
+@benchmark('load.snippets.per_result')
+def bench_load_snippets_per_result(fixture):
+    return lambda: None, lambda _: utils.load_snippets(
+        fixture.results_dir, fixture.category, fixture.search_engines,
+        fixture.N, per_day=False)
+
+
+@benchmark('load.titles')
+def bench_load_titles(fixture):
+    return lambda: None, lambda _: utils.load_titles(
+        fixture.results_dir, fixture.category, fixture.search_engines,
+        fixture.N, per_day=False)
+
+
+@benchmark('load.urls')
+def bench_load_urls(fixture):
+    return lambda: None, lambda _: utils.load_urls(
+        fixture.results_dir, fixture.category, fixture.search_engines,
+        fixture.N)
+
+
+@benchmark('load.corpus.last_day')
+def bench_load_corpus_last_day(fixture):
+    corpus = Corpus(fixture.results_dir, fixture.search_engines)
+    corpus = corpus.filter(since=corpus.dates()[-1])
+    return lambda: None, lambda _: corpus.urls(
+        fixture.category, N=fixture.N).load()
+
+
+@benchmark('load.day_batches')
+def bench_load_day_batches(fixture):
+    return fixture.batches, lambda batches: [day for day in batches]
+
+
+def _bench_distance(method):
+    def bench(fixture):
+        search_engines = fixture.search_engines[:2]
+        if method != 'T':
+            return fixture.urls, lambda urls: find_distance(
+                None, urls, None, None, search_engines, fixture.category,
+                method, False, fixture.N, None, None, None)
+
+        def setup():
+            return fixture.urls(), fixture.snippets(), fixture.titles()
+        return setup, lambda data: find_distance(
+            None, data[0], data[1], data[2], search_engines,
+            fixture.category, method, False, fixture.N, *WEIGHTS)
+    return bench
+
+
+for _method in STRING_COMPARISON_METHODS:
+    benchmark('distance.' + _method)(_bench_distance(_method))
+
+
+@benchmark('bag_of_words.build_bows')
+def bench_build_bows(fixture):
+    return fixture.snippets, lambda snippets: BagOfWords(
+        snippets).build_bows(fixture.vocabulary)
+
+
+def _bench_construct(name):
+    def bench(fixture):
+        return lambda: _model(fixture, name), lambda model: model.construct()
+    return bench
+
+
+def _bench_evaluate(name):
+    def bench(fixture):
+        return lambda: _constructed(fixture, name),\
+            lambda model: model.evaluate()
+    return bench
+
+
+for _name in list(SUPPORTED_MODELS) + ['index']:
+    benchmark('model.%s.construct' % _name)(_bench_construct(_name))
+    benchmark('model.%s.evaluate' % _name)(_bench_evaluate(_name))
+
+
+def _bench_cp_apr(tensor_format, algorithm):
+    def bench(fixture):
+        def setup():
+            model = _model(fixture, 'tensor')
+            model.format = tensor_format
+            model.construct()
+            return model.X, model.components, random_model(
+                model.X.shape, model.components, np.random.RandomState(0))
+        return setup, lambda args: algorithm(
+            *args[:2], M=args[2], outer_iter=OUTER_ITERATIONS)
+    return bench
+
+
+benchmark('cp_apr')(_bench_cp_apr('dense', cp_apr))
+benchmark('cp_apr_sparse')(_bench_cp_apr('coo', cp_apr_sparse))
+
+
+def _bench_import(code):
+    def bench(fixture):
+        command = [sys.executable, '-c', code]
+        return lambda: command, lambda command: subprocess.check_call(
+            command, stdout=subprocess.DEVNULL)
+    return bench
+
+
+# Startup of the tool in a new interpreter; `import.python` is the startup
+# of the interpreter alone.
+benchmark('import.python')(_bench_import('pass'))
+benchmark('import.cli')(_bench_import('import seanalysis.cli.cmd'))
+benchmark('import.cli.help')(_bench_import(
+    'import sys; sys.argv = ["seanlz", "--help"]\n'
+    'from seanalysis.cli.cmd import main; main()'))
+benchmark('import.controller')(_bench_import(
+    'import seanalysis.controller.controller'))
+
+
+def measure(setup, run, repeat):
+    """
+    Time a benchmark.
+
+    :param setup: Function preparing the input of a run, which is not timed.
+    :param run: Function timed.
+    :param repeat: Number of timed runs.
+
+    :return: Dictionary with the timings (in seconds) of the runs.
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        run(args)
+        times.append(time.perf_counter() - start)
+    return {'repeat': repeat, 'min': min(times),
+            'median': float(np.median(times)), 'mean': float(np.mean(times))}
+
+
+def commit():
+    """ The commit of the benchmarked tree, or `None` outside a git tree. """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, report, threshold):
+    """
+    Compare the minimum timings of two reports.
+
+    :param baseline: Report of the baseline run.
+    :param report: Report of the current run.
+    :param threshold: Ratio of timings above which a benchmark regressed.
+
+    :return: List of tuples (benchmark, baseline time, current time, ratio,
+    True if the benchmark regressed).
+    """
+    rows = []
+    for name, timings in report['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+        before = baseline['benchmarks'][name]['min']
+        ratio = timings['min'] / before if before else float('inf')
+        rows.append((name, before, timings['min'], ratio, ratio > threshold))
+    return rows
+
+
+@click.command()
+@click.option('--corpus', type=click.Path(exists=True, file_okay=False),
+              help='Directory of a generated corpus; a temporary one is'
+              ' generated otherwise')
+@click.option('--search-engines', default='google,bing,duckduckgo', type=str)
+@click.option('--queries', default=20, type=int)
+@click.option('--days', default=10, type=int)
+@click.option('-N', default=10, type=int)
+@click.option('--overlap', default=0.5, type=float)
+@click.option('--vocabulary', default=1000, type=int,
+              help='Length of the vocabulary of the bag of words')
+@click.option('--seed', default=0, type=int)
+@click.option('--repeat', default=3, type=int)
+@click.option('--select', 'patterns', default='*', type=str,
+              help='Comma-separated patterns of the benchmarks to run,'
+              ' e.g. "load.*,cp_apr"')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='JSON file where the report is written')
+@click.option('--compare', 'baseline_file',
+              type=click.Path(exists=True, dir_okay=False),
+              help='JSON report of a baseline run to compare with')
+@click.option('--threshold', default=1.2, type=float,
+              help='Slowdown ratio reported as regression')
+def main(corpus, search_engines, queries, days, n, overlap, vocabulary, seed,
+         repeat, patterns, output, baseline_file, threshold):
+    search_engines = search_engines.split(',')
+    results_dir = corpus or tempfile.mkdtemp(prefix='seanalysis-bench-')
+    parameters = {'search_engines': search_engines, 'queries': queries,
+                  'days': days, 'N': n, 'overlap': overlap, 'seed': seed}
+    try:
+        if corpus is None:
+            SyntheticCorpus(search_engines, 1, queries, days, n, overlap,
+                            seed=seed).generate(results_dir)
+        category = sorted(utils.load_config(
+            join(results_dir, utils.CONFIG_FILE))['categories'])[0]
+        fixture = Fixture(results_dir, category, search_engines, n,
+                          vocabulary)
+        report = {
+            'commit': commit(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'corpus': None if corpus else parameters,
+            'vocabulary': vocabulary, 'benchmarks': OrderedDict()
+        }
+        for name, bench in BENCHMARKS.items():
+            if not any(fnmatch(name, pattern)
+                       for pattern in patterns.split(',')):
+                continue
+            report['benchmarks'][name] = measure(*bench(fixture),
+                                                 repeat=repeat)
+            click.echo('%-32s %10.4fs' % (
+                name, report['benchmarks'][name]['min']), err=True)
+    finally:
+        if corpus is None:
+            shutil.rmtree(results_dir, ignore_errors=True)
+    if output is not None:
+        with open(output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        click.echo(json.dumps(report, indent=2))
+    if baseline_file is not None:
+        with open(baseline_file) as f:
+            rows = compare(json.load(f), report, threshold)
+        for name, before, after, ratio, regressed in rows:
+            click.echo('%-32s %10.4fs %10.4fs %6.2fx%s' % (
+                name, before, after, ratio, '  REGRESSION' if regressed
+                else ''), err=True)
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#! /usr/bin/env python
+
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Generator of synthetic corpora of search engine results.
+
+The generated directory of results has the layout read by `seanalysis.utils`,
+i.e. `<date>/<query category>/<search engine>/<query>-<n>`, and every
+document follows the schema of its search engine:
+
+    - Google: the Custom Search `items` schema (`link`, `title`, `snippet`),
+      or a list of `url`, `title`, `abstract` results for News.
+    - Bing: a list of `url`, `title`, `description` results, or a list of
+      `name`, `url`, `description` results for News.
+    - DuckDuckGo (and any other search engine): a list of `url`, `title`,
+      `description` results.
+
+For every query and day, `overlap` of the results of every search engine come
+from a pool of results shared by all search engines, which changes by `churn`
+every day. Snippets and titles are drawn from a Zipf distribution over a
+synthetic vocabulary, while `bias` of their words come from a vocabulary
+preferred by the search engine, so that the search engines are (partially)
+separable.
+
+The bag of words matrices of the model benchmarks are generated directly, by
+`synthetic_bows`.
+"""
+
+from datetime import date, timedelta
+import io
+import json
+import os
+from os.path import join
+import zlib
+import click
+import numpy as np
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput, \
+    BINARY_DTYPE
+from seanalysis.utils import CONFIG_FILE
+
+SYLLABLES = [c + v for c in 'bcdfgklmnprstvz' for v in 'aeiou']
+
+# Result fields of every document schema.
+WEB_FIELDS = ('url', 'title', 'description')
+
+
+def google_document(results, query_category):
+    if query_category == 'News':
+        return [{'url': url, 'title': title, 'abstract': snippet}
+                for url, title, snippet in results]
+    return {'kind': 'customsearch#search', 'items': [
+        {'kind': 'customsearch#result', 'link': url, 'title': title,
+         'snippet': snippet} for url, title, snippet in results]}
+
+
+def bing_document(results, query_category):
+    if query_category == 'News':
+        return [{'name': title, 'url': url, 'description': snippet}
+                for url, title, snippet in results]
+    return list_document(results, query_category)
+
+
+def list_document(results, query_category):
+    return [dict(zip(WEB_FIELDS, result)) for result in results]
+
+
+# Document schema of every search engine; search engines which are not
+# listed follow the list schema.
+DOCUMENT_SCHEMAS = {
+    'google': google_document,
+    'bing': bing_document,
+    'duckduckgo': list_document
+}
+
+
+def document_schema(se):
+    """
+    Find the function creating a document in the schema of a search engine.
+
+    As in `utils`, a search engine is matched by name, e.g. `google-news`
+    follows the Google schema.
+    """
+    for name, schema in DOCUMENT_SCHEMAS.items():
+        if name in se:
+            return schema
+    return list_document
+
+
+def synthetic_vocabulary(size, rng):
+    """
+    Generate a vocabulary of distinct pronounceable words.
+
+    :param size: Number of words.
+    :param rng: `RandomState` object.
+
+    :return: List of words.
+    """
+    words, seen = [], set()
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES, rng.randint(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def synthetic_bows(search_engines, rows, terms, density, overlap, seed):
+    """
+    Generate binary bag of words matrices, where every search engine
+    prefers a different (partially overlapping) subset of terms.
+    """
+    rng = np.random.RandomState(seed)
+    bows = []
+    for i in range(search_engines):
+        weights = np.full(terms, 1.0 - overlap)
+        weights[rng.choice(terms, terms // search_engines,
+                           replace=False)] = 1.0
+        p = np.minimum(density * weights / weights.mean(), 1.0)
+        bows.append(BagOfWordsOutput(
+            (rng.rand(rows, terms) < p).astype(BINARY_DTYPE), 'se%d' % i))
+    return bows
+
+
+class SyntheticCorpus(object):
+    """
+    This class generates a synthetic directory of results.
+
+    :param search_engines: List of search engines.
+    :param categories: Number of query categories, or list of names of query
+    categories (a category named `News` uses the News schemas).
+    :param queries: Number of queries of every query category.
+    :param days: Number of days when results were retrieved.
+    :param N: Number of results of every query.
+    :param overlap: Share of the results of a search engine which come from
+    the pool of results shared by all search engines.
+    :param churn: Share of the shared pool replaced every day.
+    :param vocabulary: Number of words of the snippet vocabulary.
+    :param snippet_length: Number of words of a snippet.
+    :param title_length: Number of words of a title.
+    :param bias: Share of the words of a snippet drawn from the vocabulary
+    preferred by its search engine.
+    :param zipf: Exponent of the Zipf distribution of words.
+    :param start: First date (YYYY-MM-DD) of results.
+    :param seed: Seed of the generator.
+    """
+    def __init__(self, search_engines=('google', 'bing', 'duckduckgo'),
+                 categories=2, queries=10, days=7, N=10, overlap=0.5,
+                 churn=0.1, vocabulary=5000, snippet_length=25,
+                 title_length=6, bias=0.2, zipf=1.1, start='2016-10-01',
+                 seed=0):
+        self.search_engines = list(search_engines)
+        self.categories = ['category%d' % i for i in range(categories)]\
+            if isinstance(categories, int) else list(categories)
+        self.queries = queries
+        self.days = days
+        self.N = N
+        self.overlap = overlap
+        self.churn = churn
+        self.snippet_length = snippet_length
+        self.title_length = title_length
+        self.bias = bias
+        self.start = start
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        self.words = synthetic_vocabulary(vocabulary, rng)
+        ranks = np.arange(1, vocabulary + 1, dtype=float)
+        self._p = ranks ** -zipf / (ranks ** -zipf).sum()
+        # Every search engine prefers a distinct slice of the vocabulary.
+        preferred = np.array_split(rng.permutation(vocabulary),
+                                   len(self.search_engines))
+        self._preferred = dict(zip(self.search_engines, preferred))
+        phrases = set()
+        while len(phrases) < queries * len(self.categories):
+            phrases.add(' '.join(rng.choice(self.words, 2)))
+        phrases = sorted(phrases)
+        self._queries = {
+            category: phrases[i * queries:(i + 1) * queries]
+            for i, category in enumerate(self.categories)}
+
+    def dates(self):
+        """ Dates (YYYY-MM-DD) of results. """
+        first = date(*map(int, self.start.split('-')))
+        return [(first + timedelta(days=d)).isoformat()
+                for d in range(self.days)]
+
+    def config(self, results_dir):
+        """
+        Configuration of the generated corpus, as read by `utils.load_config`.
+        """
+        return {'categories': self._queries, 'results': results_dir}
+
+    def _text(self, url, se, field, length):
+        """
+        Words of a field (title or snippet) of a result; the same result gets
+        the same words from every search engine, except for the words
+        preferred by the search engine.
+        """
+        rng = np.random.RandomState(
+            zlib.crc32(('%s %s' % (field, url)).encode('utf-8')))
+        words = rng.choice(len(self.words), length, p=self._p)
+        biased = rng.rand(length) < self.bias
+        words[biased] = rng.choice(self._preferred[se], biased.sum())
+        return ' '.join(self.words[w] for w in words)
+
+    def results(self, query, se, pool, rng):
+        """
+        Generate the results of a search engine for a query of a day.
+
+        :param query: Query.
+        :param se: Search engine.
+        :param pool: List of the URL identifiers of the shared pool; its
+        first results are returned by every search engine.
+        :param rng: `RandomState` object.
+
+        :return: List of tuples (url, title, snippet).
+        """
+        slug = query.replace(' ', '-')
+        shared = int(round(self.overlap * self.N))
+        urls = ['http://www.site%d.com/%s' % (i, slug) for i in pool[:shared]]
+        urls += ['http://www.%s-site%d.com/%s' % (se, i, slug)
+                 for i in rng.choice(3 * self.N, self.N - shared,
+                                     replace=False)]
+        rng.shuffle(urls)
+        return [(url, self._text(url, se, 'title', self.title_length),
+                 self._text(url, se, 'snippet', self.snippet_length))
+                for url in urls]
+
+    def generate(self, results_dir):
+        """
+        Write the documents of results and the configuration file of corpus.
+
+        :param results_dir: Directory of results.
+
+        :return: Path of configuration file.
+        """
+        rng = np.random.RandomState(self.seed + 1)
+        pools = {(category, query): list(range(self.N))
+                 for category, queries in self._queries.items()
+                 for query in queries}
+        next_url = self.N
+        for day in self.dates():
+            for (category, query), pool in sorted(pools.items()):
+                for i in np.flatnonzero(rng.rand(len(pool)) < self.churn):
+                    pool[i] = next_url
+                    next_url += 1
+                for se in self.search_engines:
+                    directory = join(results_dir, day, category, se)
+                    if not os.path.isdir(directory):
+                        os.makedirs(directory)
+                    document = document_schema(se)(
+                        self.results(query, se, pool, rng), category)
+                    with io.open(join(directory, '%s-1' % query), 'w',
+                                 encoding='utf-8') as document_file:
+                        document_file.write(json.dumps(document))
+        config_path = join(results_dir, CONFIG_FILE)
+        with open(config_path, 'w') as config_file:
+            json.dump(self.config(results_dir), config_file, indent=2)
+        return config_path
+
+
+@click.command()
+@click.argument('results_dir', type=click.Path(file_okay=False))
+@click.option('--search-engines', '-s', default='google,bing,duckduckgo',
+              type=str)
+@click.option('--categories', default='2', type=str,
+              help='Number of query categories or comma-separated names')
+@click.option('--queries', default=10, type=int,
+              help='Number of queries of every category')
+@click.option('--days', default=7, type=int)
+@click.option('-N', default=10, type=int,
+              help='Number of results of every query')
+@click.option('--overlap', default=0.5, type=float,
+              help='Share of results shared by all search engines')
+@click.option('--churn', default=0.1, type=float,
+              help='Share of shared results replaced every day')
+@click.option('--vocabulary', default=5000, type=int)
+@click.option('--snippet-length', default=25, type=int)
+@click.option('--bias', default=0.2, type=float,
+              help='Share of snippet words preferred by the search engine')
+@click.option('--start', default='2016-10-01', type=str)
+@click.option('--seed', default=0, type=int)
+def main(results_dir, search_engines, categories, queries, days, n, overlap,
+         churn, vocabulary, snippet_length, bias, start, seed):
+    corpus = SyntheticCorpus(
+        search_engines.split(','),
+        int(categories) if categories.isdigit() else categories.split(','),
+        queries, days, n, overlap, churn, vocabulary, snippet_length,
+        bias=bias, start=start, seed=seed)
+    click.echo(corpus.generate(results_dir))
+
+
+if __name__ == '__main__':
+    main()
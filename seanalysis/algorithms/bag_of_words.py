@@ -17,8 +17,11 @@
 from collections import namedtuple
 import string
 import numpy as np
+from scipy import sparse
 from nltk.tokenize import word_tokenize
-from sklearn.feature_extraction.text import CountVectorizer, ENGLISH_STOP_WORDS
+from sklearn.feature_extraction.text import CountVectorizer, \
+    HashingVectorizer, ENGLISH_STOP_WORDS
+from seanalysis import profiling
 
 # A special character used to identify the query associated with
 # a string of concatenated snippets, e.g. Athens~foo bar blah blah...
@@ -32,6 +35,14 @@ punctuation.append('...')
 stops = list(ENGLISH_STOP_WORDS) + punctuation
 
 
+# Bag of words matrices are binary and sparse (CSR), so the narrowest
+# integer type is used for their stored cells. Models consume the sparse
+# matrices directly; only the dense tensor format densifies them.
+BINARY_DTYPE = np.uint8
+
+# Number of set bits of every byte value.
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
 BagOfWordsOutput = namedtuple('BagOfWordsOutput', ['matrix', 'se'])
 
 
@@ -40,12 +51,12 @@ def get_top_words(bow, words, N=100):
     Calculate the `N` most frequent words of a search engine
     bag of words representation matrix.
 
-    :param bow: Bag of words matrix of search engine.
+    :param bow: Bag of words matrix (dense or sparse) of search engine.
     :param words: List with feature names of Bag of words.
     :param N: Number of top words.
     :return: Top `N` words list.
     """
-    sum_of_columns = np.array(bow.sum(axis=0))
+    sum_of_columns = np.asarray(bow.sum(axis=0)).ravel()
     indexes = np.argsort(sum_of_columns)[::-1][:N]
 
     return [words[index] for index in indexes]
@@ -56,21 +67,73 @@ def transform(bow, words, union):
     Construct the new bag of words with union of these two
     top 100 words list as feature space.
 
-    :param bow: Bag of words of search engine.
+    :param bow: Bag of words (dense or sparse) of search engine.
     :param words: List with feature names of Bag of words.
     :param union: Union of these two top words list.
 
-    :return: Bag of words binary array with new feature space.
+    :return: Sparse (CSR) binary bag of words matrix (`BINARY_DTYPE`) with
+    new feature space.
+    """
+    vocabulary = {word: i for i, word in enumerate(words)}
+    columns = [(vocabulary[word], i) for i, word in enumerate(union)
+               if word in vocabulary]
+    source, target = zip(*columns) if columns else ((), ())
+    projection = sparse.csr_matrix(
+        (np.ones(len(columns), dtype=BINARY_DTYPE), (source, target)),
+        shape=(len(words), len(union)))
+    return (sparse.csr_matrix(bow) > 0).astype(BINARY_DTYPE).dot(projection)
+
+
+def pack_bits(matrix):
+    """
+    Pack the rows of a binary bag of words matrix into bits, i.e. every byte
+    of the packed matrix holds eight terms.
+
+    :param matrix: Binary bag of words matrix (dense or sparse).
+
+    :return: Bit-packed `uint8` array with shape
+    (rows, ceil(terms / 8)).
+    """
+    if sparse.issparse(matrix):
+        matrix = matrix.toarray()
+    return np.packbits(np.asarray(matrix) > 0, axis=1)
+
+
+def binary_overlap(X, Y):
+    """
+    Count the common terms of every pair of rows of two bit-packed bag of
+    words matrices, using a popcount lookup table.
+
+    :param X: Bit-packed matrix with shape (n, bytes).
+    :param Y: Bit-packed matrix with shape (m, bytes).
+
+    :return: Array with shape (n, m) with the number of common terms.
+    """
+    X, Y = np.atleast_2d(X), np.atleast_2d(Y)
+    return POPCOUNT[np.bitwise_and(X[:, np.newaxis, :], Y[np.newaxis, :, :])]\
+        .sum(axis=2, dtype=np.int64)
+
+
+def binary_cosine(X, Y):
     """
-    train = np.zeros((bow.shape[0], len(union)))
-    for i, word in enumerate(union):
-        try:
-            index = words.index(word)
-            train[:, i] = bow[:, index]
-        except ValueError:
-            pass
+    Compute the cosine similarity of every pair of rows of two bit-packed
+    bag of words matrices.
+
+    For binary vectors, cosine similarity is the number of common terms
+    divided by the square root of the product of the number of terms of each
+    vector. Rows without any term have a similarity equal to 0.
 
-    return (train > 0).astype(int)
+    :param X: Bit-packed matrix with shape (n, bytes).
+    :param Y: Bit-packed matrix with shape (m, bytes).
+
+    :return: Array with shape (n, m) with the cosine similarities.
+    """
+    X, Y = np.atleast_2d(X), np.atleast_2d(Y)
+    norms = np.sqrt(np.outer(POPCOUNT[X].sum(axis=1, dtype=np.int64),
+                             POPCOUNT[Y].sum(axis=1, dtype=np.int64)))
+    overlap = binary_overlap(X, Y).astype(float)
+    return np.divide(overlap, norms, out=np.zeros_like(overlap),
+                     where=norms > 0)
 
 
 def add_query_term(se_snippet):
@@ -101,6 +164,18 @@ class BagOfWords:
         self.se_snippets = se_snippets
         self.remove_query_term = remove_query_term
         self.se_bows = self._vectorize_snippets()
+        self.terms = None
+
+    def get_keys(self):
+        """
+        Gets the list of the keys, i.e. tuples ([index,] date, query), which
+        identify the retrieved documents associated with the rows of the bag
+        of words representation.
+
+        :return: List of keys.
+        """
+        random_se = next(iter(self.se_snippets.keys()))
+        return list(self.se_snippets[random_se].keys())
 
     def get_queries(self):
         """
@@ -137,10 +212,12 @@ class BagOfWords:
                                          binary=False,
                                          tokenizer=self.tokenize)
             edit_se_snippet = add_query_term(se_snippet)
-            X = vectorizer.fit_transform(edit_se_snippet.values())
-            bow_se.append((X.toarray(), se, vectorizer))
+            with profiling.stage('vectorize'):
+                X = vectorizer.fit_transform(edit_se_snippet.values())
+            bow_se.append((X.tocsc(), se, vectorizer))
         return bow_se
 
+    @profiling.profiled('tokenize')
     def tokenize(self, query_sentence):
         """
         Get tokens of a sentence, after eliminating all stop words.
@@ -169,6 +246,7 @@ class BagOfWords:
 
         return words if words else [u" "]
 
+    @profiling.profiled('build_bows')
     def build_bows(self, N=100):
         """
         This method represents the results of search engine associated with
@@ -178,9 +256,12 @@ class BagOfWords:
         `N` top words of each search engine. This means that all terms are
         taken account of
 
+        The terms of the union (i.e. the columns of the bag of words
+        representation) are kept in the `terms` attribute.
+
         :param N: Number of top words.
 
-        :return List of bag of words representation arrays.
+        :return List of sparse binary bag of words representation matrices.
         """
         union = []
 
@@ -193,6 +274,59 @@ class BagOfWords:
 
         union = list(set(union))
         union.sort()
+        self.terms = union
         return [BagOfWordsOutput(
             transform(bow, vectorizer.get_feature_names(), union), se)
             for bow, se, vectorizer in self.se_bows]
+
+
+class HashingBagOfWords(BagOfWords):
+    """
+    Bag of words representation with a fixed feature space.
+
+    Terms are mapped to `n_features` columns with the hashing trick, so the
+    representation of results does not depend on any other results. This
+    allows results (e.g. the results of different days) to be represented
+    independently of each other.
+    """
+
+    def __init__(self, se_snippets, n_features=2 ** 18,
+                 remove_query_term=True):
+        self.n_features = n_features
+        BagOfWords.__init__(self, se_snippets, remove_query_term)
+
+    def _vectorize_snippets(self):
+        """
+        This function vectorizes the snippets associated with every search
+        engine into the hashed feature space.
+
+        :return: List of Bag of words representation objects.
+        One for each search engine.
+        """
+        bow_se = []
+        for se, se_snippet in self.se_snippets.items():
+            vectorizer = HashingVectorizer(stop_words='english',
+                                           analyzer='word',
+                                           binary=True, norm=None,
+                                           alternate_sign=False,
+                                           n_features=self.n_features,
+                                           tokenizer=self.tokenize)
+            edit_se_snippet = add_query_term(se_snippet)
+            with profiling.stage('vectorize'):
+                X = vectorizer.transform(edit_se_snippet.values()) \
+                    if edit_se_snippet else sparse.csr_matrix(
+                        (0, self.n_features))
+            bow_se.append((X, se, vectorizer))
+        return bow_se
+
+    def build_bows(self, N=None):
+        """
+        This method represents the results of every search engine in the
+        hashed feature space.
+
+        :param N: Unused, the feature space is fixed.
+
+        :return List of sparse binary bag of words representation matrices.
+        """
+        return [BagOfWordsOutput(bow.astype(BINARY_DTYPE).tocsr(), se)
+                for bow, se, _ in self.se_bows]
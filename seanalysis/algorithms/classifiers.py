@@ -12,19 +12,83 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from sklearn.linear_model import LogisticRegression
+from functools import partial
+from joblib import Parallel, delayed
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.model_selection import KFold
 from sklearn.multiclass import OneVsRestClassifier
-from sklearn.svm import SVC
+from sklearn.svm import SVC, LinearSVC
+from seanalysis.utils import SEAnalysisException
 
 
+# Factories of the supported classifiers. Every call returns a new
+# estimator, so estimators are never shared between fits.
+#
+# `LINSVC` (liblinear) and `SGD` are linear classifiers without probability
+# estimates; their scores are taken from `decision_function`, which is
+# enough for ROC analysis and avoids the internal cross validation of
+# `SVC(probability=True)`.
 CLASSIFIERS = {
-    'SVC': SVC(probability=True, kernel='linear'),
-    'LOGREG': LogisticRegression()
+    'SVC': partial(SVC, probability=True, kernel='linear'),
+    'LOGREG': LogisticRegression,
+    'LINSVC': LinearSVC,
+    'SGD': partial(SGDClassifier, loss='hinge', tol=1e-3)
 }
 
 
+def get_classifier(classifier, random_state=None):
+    """
+    Create a new estimator of the given classifier.
+
+    :param classifier: Classifier name.
+    :param random_state: Seed of the classifier.
+
+    :return: A new (unfitted) estimator.
+    """
+    try:
+        return CLASSIFIERS[classifier](random_state=random_state)
+    except KeyError:
+        raise SEAnalysisException(
+            'Unsupported classifier: %s' % repr(classifier))
+
+
+def scores(clf, test_set):
+    """
+    Get the scores of a fitted classifier for every class, i.e. the
+    estimated probabilities if the classifier supports them or the values
+    of its decision function otherwise.
+
+    :param clf: Fitted classifier.
+    :param test_set: Set of data to test the classifier.
+
+    :return: Scores for every class.
+    """
+    if hasattr(clf, 'predict_proba'):
+        return clf.predict_proba(test_set)
+    return clf.decision_function(test_set)
+
+
+def fit(train_set, train_labels, classifier, oneVSrest=False,
+        random_state=None):
+    """
+    Fit a new estimator of the given classifier.
+
+    :param train_et: Set of data to train the classifier.
+    :param train_label: Labels of train set.
+    :param classifier: Classifier name which is going to be used to train data.
+    :param oneVSrest: True if a One vs Rest Strategy is going to be used on
+    the classification process.
+    :param random_state: Seed of the classifier.
+
+    :return: Fitted classifier.
+    """
+    clf = get_classifier(classifier, random_state)
+    clf = OneVsRestClassifier(clf) if oneVSrest else clf
+    return clf.fit(train_set, train_labels)
+
+
 def classify(train_set, train_labels, test_set, classifier, oneVSrest=False,
-             prob=True):
+             prob=True, random_state=None):
     """
     Predict label with linear SVC.
 
@@ -34,13 +98,57 @@ def classify(train_set, train_labels, test_set, classifier, oneVSrest=False,
     :param classifier: Classifier name which is going to be used to train data.
     :param oneVSrest: True if a One vs Rest Strategy is going to be used on
     the classification process.
-    :param prob: True if estimated probabilities for each class are returned;
-    False if classifier predictions are returned
+    :param prob: True if scores (estimated probabilities or values of the
+    decision function) for each class are returned; False if classifier
+    predictions are returned
+    :param random_state: Seed of the classifier.
+
+    :return: Predicted labels of classifier or scores for every class.
+    """
+    clf = fit(train_set, train_labels, classifier, oneVSrest, random_state)
+    return scores(clf, test_set) if prob else clf.predict(test_set)
+
+
+def _classify_fold(X, Y, train_index, test_index, classifier, oneVSrest,
+                   prob, random_state):
+    """ Fit and predict a single fold of cross validation. """
+    return classify(X[train_index], Y[train_index], X[test_index],
+                    classifier=classifier, oneVSrest=oneVSrest, prob=prob,
+                    random_state=random_state)
+
+
+def cross_validate(X, Y, classifier, folds=3, jobs=1, seed=None,
+                   oneVSrest=False, prob=True):
+    """
+    Fit and predict every fold of a K-fold cross validation.
+
+    Folds are fitted by `jobs` worker processes. The train set and its
+    labels are not copied to every worker, they are shared through memory
+    mapping instead.
+
+    The results are deterministic for a given seed, since the seed
+    determines both the split of folds and the state of the classifier of
+    every fold.
+
+    :param X: Train set.
+    :param Y: Labels of train set.
+    :param classifier: Classifier name which is going to be used to train data.
+    :param folds: Number of folds.
+    :param jobs: Number of worker processes. `-1` uses all processors.
+    :param seed: Seed used for the split of folds and the classifiers.
+    :param oneVSrest: True if a One vs Rest Strategy is going to be used on
+    the classification process.
+    :param prob: True if scores for each class are returned; False if
+    classifier predictions are returned
 
-    :return: Predicted labels of classifier or estimated probabilities
-    for every class.
+    :return: List of tuples (test indexes, predictions), one for each fold in
+    the order of folds.
     """
-    clf = OneVsRestClassifier(CLASSIFIERS[classifier]) if oneVSrest\
-        else CLASSIFIERS[classifier]
-    clf.fit(train_set, train_labels)
-    return clf.predict_proba(test_set) if prob else clf.predict(test_set)
+    kf = KFold(n_splits=folds, shuffle=True, random_state=seed)
+    splits = list(kf.split(X))
+    predictions = Parallel(n_jobs=jobs, mmap_mode='r')(
+        delayed(_classify_fold)(X, Y, train_index, test_index, classifier,
+                                oneVSrest, prob, seed)
+        for train_index, test_index in splits)
+    return [(test_index, pred)
+            for (_, test_index), pred in zip(splits, predictions)]
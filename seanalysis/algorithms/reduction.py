@@ -0,0 +1,57 @@
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from functools import partial
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+from sklearn.random_projection import SparseRandomProjection
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput
+from seanalysis.utils import SEAnalysisException
+
+
+REDUCTIONS = {
+    'srp': partial(SparseRandomProjection, dense_output=True),
+    'svd': TruncatedSVD
+}
+
+
+def reduce_bows(bows, method, components, random_state=None):
+    """
+    Reduce the dimensionality of the bag of words representation of search
+    engines.
+
+    The reduction is fitted once with the results of all search engines, so
+    the reduced matrices share the same feature space and can be used by any
+    classification model and any fold of cross validation.
+
+    :param bows: List of bag of words representation objects.
+    :param method: Reduction method; `srp` (sparse random projection) or
+    `svd` (truncated SVD).
+    :param components: Number of components of the reduced feature space.
+    :param random_state: Seed of the reduction.
+
+    :return: List of bag of words representation objects with the reduced
+    matrices.
+    """
+    try:
+        reduction = REDUCTIONS[method](n_components=components,
+                                       random_state=random_state)
+    except KeyError:
+        raise SEAnalysisException(
+            'Unsupported reduction: %s' % repr(method))
+    reduction.fit(sparse.vstack(
+        [sparse.csr_matrix(bow.matrix) for bow in bows]))
+    return [BagOfWordsOutput(
+        reduction.transform(sparse.csr_matrix(bow.matrix)), bow.se)
+        for bow in bows]
@@ -0,0 +1,27 @@
+import unittest
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+import seanalysis.algorithms.bag_of_words as bw
+
+
+class TestBagOfWords(unittest.TestCase):
+    def test_transform(self):
+        bow = sparse.csc_matrix(np.array([[2, 0, 1], [0, 3, 0]]))
+        train = bw.transform(bow, ['a', 'b', 'c'], ['a', 'c', 'd'])
+        self.assertTrue(sparse.isspmatrix_csr(train))
+        self.assertEqual(train.dtype, bw.BINARY_DTYPE)
+        np.testing.assert_array_equal(train.toarray(), [[1, 1, 0], [0, 0, 0]])
+        empty = bw.transform(bow, ['a', 'b', 'c'], ['x'])
+        np.testing.assert_array_equal(empty.toarray(), [[0], [0]])
+
+    def test_binary_cosine(self):
+        X = np.array([[1, 0, 1, 1, 0, 0, 0, 0, 1],
+                      [0, 0, 0, 0, 0, 0, 0, 0, 0]], dtype=bw.BINARY_DTYPE)
+        Y = np.array([[1, 1, 1, 0, 0, 0, 0, 0, 1]], dtype=bw.BINARY_DTYPE)
+        packed_x, packed_y = bw.pack_bits(X), bw.pack_bits(Y)
+        self.assertEqual(packed_x.shape, (2, 2))
+        np.testing.assert_array_equal(
+            bw.binary_overlap(packed_x, packed_y), [[3], [0]])
+        np.testing.assert_allclose(bw.binary_cosine(packed_x, packed_y),
+                                   cosine_similarity(X, Y))
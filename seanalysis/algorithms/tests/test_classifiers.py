@@ -0,0 +1,21 @@
+import unittest
+import numpy as np
+import seanalysis.algorithms.classifiers as clfs
+from seanalysis.utils import SEAnalysisException
+
+
+class TestClassifiers(unittest.TestCase):
+    def test_get_classifier(self):
+        clf = clfs.get_classifier('LOGREG', random_state=1)
+        self.assertIsNot(clf, clfs.get_classifier('LOGREG', random_state=1))
+        self.assertEqual(clf.random_state, 1)
+        self.assertRaises(SEAnalysisException, clfs.get_classifier, 'foo')
+
+    def test_classify(self):
+        X = np.array([[1, 0], [1, 0], [0, 1], [0, 1]])
+        Y = np.array([[1, 0], [1, 0], [0, 1], [0, 1]])
+        for classifier in ['LOGREG', 'LINSVC', 'SGD']:
+            pred = clfs.classify(X, Y, X, classifier, oneVSrest=True,
+                                 random_state=0)
+            self.assertEqual(pred.shape, (4, 2))
+            self.assertTrue(np.all(pred[:2, 0] > pred[2:, 0]))
@@ -12,13 +12,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+from datetime import datetime
 from functools import wraps
-import numpy as np
+import json
+import os
 import click
-from seanalysis import utils
-from seanalysis.controller import controller as ctrl
-from seanalysis.compare_sorting import find_distance
-from seanalysis.drawing.visualization import Visualization
+from seanalysis import profiling, utils
+from seanalysis.corpus import Corpus
+from seanalysis.drawing import visualization
+
+# Modules depending on heavy libraries (e.g. the models on sklearn, nltk and
+# sktensor) are imported by the sub-commands using them, so that the startup
+# of the tool (e.g. `--help`, shell completion, `rank`) does not pay for them.
 
 
 def handle_exception(func):
@@ -42,6 +47,20 @@ def validate_query_categories(categories, all_categories):
     return categories
 
 
+def validate_dates(since, until):
+    for option, date in (('--from-date', since), ('--to-date', until)):
+        if date is None:
+            continue
+        try:
+            datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            raise click.UsageError('%s should be a date (YYYY-MM-DD).' %
+                                   option)
+    if since is not None and until is not None and since > until:
+        raise click.UsageError('--from-date should not be after --to-date.')
+    return since, until
+
+
 def validate_index_option(index, per_day, model):
     if index and per_day:
         raise click.UsageError('--index is not supported by --per-day option.')
@@ -51,7 +70,66 @@ def validate_index_option(index, per_day, model):
     return index, per_day, model
 
 
+def validate_models(method, models, config):
+    """
+    Create a controller for every model and every combination of the
+    (comma separated) values of its configuration.
+
+    A configuration value prefixed by "model:" is used only by this model.
+    Unprefixed values of several models are used by the models which accept
+    their key.
+    """
+    from seanalysis.controller import controller as ctrl
+    models = [model.lower() for model in models]
+    if 'stream' in models and len(set(models)) > 1:
+        raise click.UsageError('"stream" model cannot be combined with other'
+                               ' models.')
+    methods = [method.lower() if method is not None else next(
+        (m for m, method_models in ctrl.SUPPORTED_MODELS_PER_METHOD.items()
+         if model in method_models), None) for model in models]
+    # Schema of every model; `None` if the model is invalid, so that all
+    # values are passed to its controller which reports it.
+    schemas = [ctrl.CONFIGURATION_SCHEMA.get(model_method, {}).get(model)
+               for model_method, model in zip(methods, models)]
+    shared_config, model_config = [], {}
+    for conf in config:
+        key = conf.split('=', 1)[0]
+        if ':' not in key:
+            if len(set(models)) > 1 and not any(
+                    schema is None or key in schema for schema in schemas):
+                raise click.UsageError(
+                    'Config %s is not accepted by any model' % repr(conf))
+            shared_config.append(conf)
+            continue
+        model, model_conf = conf.split(':', 1)
+        if model.lower() not in models:
+            raise click.UsageError('Config %s refers to unknown model %s' % (
+                repr(conf), repr(model)))
+        model_config.setdefault(model.lower(), []).append(model_conf)
+    controllers = []
+    for model, model_method, schema in zip(models, methods, schemas):
+        accepted = [conf for conf in shared_config
+                    if schema is None or len(set(models)) == 1 or
+                    conf.split('=', 1)[0] in schema]
+        for model_conf in ctrl.expand_config(
+                accepted + model_config.get(model, [])):
+            controllers.append(ctrl.Controller(model_method, model,
+                                               model_conf))
+    return controllers
+
+
+def write_profile(profiler, path, cprofile_path):
+    profiling.disable()
+    profiler.dump(path)
+    if cprofile_path is not None:
+        stage = profiler.dump_cprofile(cprofile_path)
+        if stage is not None:
+            click.echo('cProfile statistics of stage %s are written to %s' % (
+                stage, cprofile_path), err=True)
+
+
 def validate_weights(weights):
+    import numpy as np
     for i, w in enumerate(weights):
         weights[i] = (
             np.asarray(w.split(','), dtype=np.float)
@@ -75,9 +153,42 @@ def validate_weights(weights):
               type=int)
 @click.option('--merge', help='Display analysis of query categories in a'
               ' single diagram', default=False, is_flag=True)
+@click.option('--output-dir', help='Directory where diagrams are rendered'
+              ' with a non-interactive backend, instead of being displayed',
+              type=click.Path(file_okay=False), default=None)
+@click.option('--format', help='Format of rendered diagrams',
+              type=click.Choice(visualization.FORMATS), default='png')
+@click.option('--render-jobs', help='Number of processes rendering diagrams',
+              default=1, type=int)
+@click.option('--profile', help='JSON file where the wall time, the CPU time,'
+              ' the number of calls and the peak memory of every stage of the'
+              ' analysis are written', type=click.Path(dir_okay=False),
+              default=None)
+@click.option('--cprofile', help='File where the cProfile statistics of the'
+              ' slowest stage are written (requires --profile)',
+              type=click.Path(dir_okay=False), default=None)
+@click.option('--from-date', help='Date (YYYY-MM-DD) of the first results to'
+              ' be analyzed. Documents of earlier results are not opened',
+              type=str, default=None)
+@click.option('--to-date', help='Date (YYYY-MM-DD) of the last results to be'
+              ' analyzed. Documents of later results are not opened',
+              type=str, default=None)
+@click.option('--queries', help='Comma separated queries to be analyzed.'
+              ' Documents of other queries are not opened', type=str,
+              default=None)
 @click.pass_context
 @handle_exception
-def sesim(ctx, config, search_engines, categories, n, merge):
+def sesim(ctx, config, search_engines, categories, n, merge, output_dir,
+          format, render_jobs, profile, cprofile, from_date, to_date,
+          queries):
+    if cprofile is not None and profile is None:
+        raise click.UsageError('--cprofile option requires --profile option.')
+    if profile is not None:
+        profiler = profiling.enable(cprofile is not None)
+        ctx.call_on_close(lambda: write_profile(profiler, profile, cprofile))
+    if output_dir is not None:
+        visualization.set_output(output_dir, format, render_jobs)
+    since, until = validate_dates(from_date, to_date)
     conf = utils.load_config(config)
     query_categories = conf['categories']
     context = {
@@ -87,7 +198,11 @@ def sesim(ctx, config, search_engines, categories, n, merge):
         'categories': validate_query_categories(
             categories, query_categories.keys()),
         'N': n,
-        'merge': merge
+        'merge': merge,
+        'corpus': Corpus(conf['results'], search_engines.split(','),
+                         since=since, until=until,
+                         queries=None if queries is None
+                         else queries.split(','))
     }
     ctx.obj = context
 
@@ -102,15 +217,22 @@ def _extract_context(ctx):
     return (query_categories, search_engines, results_dir, merge, n, config)
 
 
+def _extract_corpus(ctx):
+    return ctx.obj.get('corpus')
+
+
 @sesim.command()
 @click.option('--method', help='Method to use for analyzing search engines'
-              ' similarity', type=click.Choice(['cmp', 'clf']), required=True)
+              ' similarity. If not specified, it is inferred by every model',
+              type=click.Choice(['cmp', 'clf']), default=None)
 @click.option('--model', '-m', help='The model in which data will be'
-              ' transformed',
-              type=click.Choice(['tensor', 'lda', 'query', 'se']),
-              required=True)
-@click.option('config', '-c', help='The model specific configuration',
-              type=str, required=True, multiple=True)
+              ' transformed. It can be specified multiple times',
+              type=click.Choice(['tensor', 'lda', 'nmf', 'query', 'se',
+                                 'stream']),
+              required=True, multiple=True)
+@click.option('config', '-c', help='The model specific configuration. Comma'
+              ' separated values are analyzed one by one and a "model:"'
+              ' prefix limits a value to a model', type=str, multiple=True)
 @click.option('--vocabulary', help='Number of words of vocabulary to be used'
               ' for the' 'analysis. If not specified all terms compose'
               ' vocabulary (top terms)', default=None, type=int)
@@ -119,21 +241,114 @@ def _extract_context(ctx):
               ' classification problem. It is only available with'
               ' --per-result option and "se" model.', default=False,
               is_flag=True)
+@click.option('--reduction', help='Reduce the dimensionality of the bag of'
+              ' words representation before classification, using sparse'
+              ' random projection (srp) or truncated SVD (svd)',
+              type=click.Choice(['srp', 'svd']), default=None)
+@click.option('--components', help='Number of components of the reduced'
+              ' bag of words representation', default=100, type=int)
+@click.option('--store', help='Directory where the bag of words'
+              ' representation of query categories is stored and reused by'
+              ' subsequent runs', type=click.Path(file_okay=False),
+              envvar='SESIM_STORE', default=None)
+@click.option('--jobs', help='Maximum number of query categories analyzed in'
+              ' parallel processes', default=1, type=int)
+@click.option('--sweep', help='Comma separated numbers of components of the'
+              ' model fitted in parallel processes. The score, the fit time'
+              ' and the peak memory of every fit are reported and only the'
+              ' selected fit is plotted', type=str, default=None)
+@click.option('--select', help='Number of components of the plotted fit of a'
+              ' sweep. If not specified, the fit with the best score is'
+              ' plotted', type=int, default=None)
+@click.option('--save', help='Directory where the fitted model of every query'
+              ' category is saved, so that it scores new results without'
+              ' being fitted again', type=click.Path(file_okay=False),
+              default=None)
 @click.pass_context
 @handle_exception
-def cont(ctx, method, model, config, vocabulary, per_day, index):
+def cont(ctx, method, model, config, vocabulary, per_day, index, reduction,
+         components, store, jobs, sweep, select, save):
+    from seanalysis.controller import controller as ctrl
+    from seanalysis.feature_store import FeatureStore
     (query_categories, search_engines, results_dir, merge,
             n, conf_file) = _extract_context(ctx)
-    index, per_day, model = validate_index_option(index, per_day, model)
+    controllers = validate_models(method, model, config)
+    for model_name in model:
+        validate_index_option(index, per_day, model_name)
+    if sweep is not None:
+        if len(controllers) > 1:
+            raise click.UsageError('--sweep option is only supported with a'
+                                   ' single model and configuration.')
+        if index or reduction is not None:
+            raise click.UsageError('--sweep option is not supported with'
+                                   ' --index or --reduction options.')
+    if save is not None:
+        unsaved = [c.model for c in controllers
+                   if c.model in ctrl.SUPPORTED_MODELS and
+                   not ctrl.SUPPORTED_MODELS[c.model].fitted]
+        if unsaved or index or reduction is not None:
+            raise click.UsageError(
+                '--save option is not supported with %s.' % (
+                    '"%s" model' % unsaved[0] if unsaved
+                    else '--index option' if index
+                    else '--reduction option'))
+        if len({c.model for c in controllers}) < len(controllers):
+            raise click.UsageError('--save option is only supported with a'
+                                   ' single configuration per model.')
+        if not os.path.isdir(save):
+            os.makedirs(save)
+    corpus = _extract_corpus(ctx)
+    feature_store = None if store is None else FeatureStore(
+        store, results_dir, search_engines, N=n, per_day=per_day,
+        corpus=corpus)
     snippets = {}
     queries = {}
     for category in query_categories:
         queries[category] = conf_file['categories'][
             category]
-        snippets[category] = utils.load_snippets(
-            results_dir, category, search_engines, N=n, per_day=per_day)
-    controller = ctrl.Controller(method.lower(), model.lower(), config)
-    controller.analyze(snippets, index, vocabulary, merge)
+        if 'stream' in model:
+            snippets[category] = corpus.batches(category, N=n,
+                                                per_day=per_day)
+            continue
+        if feature_store is not None and feature_store.contains(
+                category, vocabulary):
+            snippets[category] = None
+            continue
+        with profiling.category(category):
+            snippets[category] = corpus.snippets(
+                category, N=n, per_day=per_day).load()
+    if sweep is not None:
+        report = controllers[0].sweep(
+            snippets, [int(c) for c in sweep.split(',')], vocabulary, merge,
+            feature_store, jobs, select)
+        click.echo(json.dumps(report, indent=2))
+        return
+    ctrl.analyze_many(controllers, snippets, index, vocabulary, merge,
+                      feature_store,
+                      None if reduction is None else (reduction, components),
+                      jobs, save)
+
+
+@sesim.command()
+@click.option('--model', '-m', help='The saved model which scores the results',
+              type=click.Choice(['tensor', 'lda', 'nmf', 'query', 'se']),
+              required=True)
+@click.option('--models', help='Directory of the models saved by "cont'
+              ' --save"', type=click.Path(exists=True, file_okay=False),
+              required=True)
+@click.option('--per-day/--per-result', default=False)
+@click.pass_context
+@handle_exception
+def score(ctx, model, models, per_day):
+    (query_categories, search_engines, results_dir, merge,
+            n, _) = _extract_context(ctx)
+    controller = validate_models(None, [model], [])[0]
+    corpus = _extract_corpus(ctx)
+    snippets = {
+        category: corpus.snippets(category, N=n, per_day=per_day).load()
+        for category in query_categories
+    }
+    controller.score(snippets, models, merge)
 
 
 @sesim.command()
@@ -144,15 +359,16 @@ def cont(ctx, method, model, config, vocabulary, per_day, index):
 @click.pass_context
 @handle_exception
 def rank(ctx, metric):
+    from seanalysis.compare_sorting import find_distance
     (query_categories, search_engines, results_dir, merge,
             n, _) = _extract_context(ctx)
-    visual = Visualization(merge, len(query_categories))
+    visual = visualization.Visualization(merge, len(query_categories))
     for query_category in query_categories:
-        urls = utils.load_urls(
-            results_dir, query_category, search_engines, N=n)
-        find_distance(visual, urls, None, None, search_engines,
-                      query_category, metric, None, n, None,
-                      None, None)
+        with profiling.category(query_category):
+            urls = _extract_corpus(ctx).urls(query_category, N=n)
+            find_distance(visual, urls, None, None, search_engines,
+                          query_category, metric, None, n, None,
+                          None, None)
     visual.show()
 
 
@@ -168,26 +384,70 @@ def rank(ctx, metric):
 @click.pass_context
 @handle_exception
 def metrict(ctx, evol, weight_a, weight_b, weight_c):
+    from seanalysis.compare_sorting import find_distance
     (query_categories, search_engines, results_dir, merge,
             n, _) = _extract_context(ctx)
+    corpus = _extract_corpus(ctx)
     categories = '*' if evol else query_categories
     weight_a, weight_b, weight_c = validate_weights([weight_a, weight_b,
                                                      weight_c])
-    visual = Visualization(merge, len(query_categories))
+    visual = visualization.Visualization(merge, len(query_categories))
     for query_category in categories:
-        urls = utils.load_urls(
-            results_dir, query_category, search_engines, N=n)
-        snippets = utils.load_snippets(
-                results_dir, query_category, search_engines, N=n,
-                per_day=False)
-        titles = utils.load_titles(
-            results_dir, query_category, search_engines, N=n,
-            per_day=False)
-        find_distance(visual, urls, snippets, titles, search_engines,
-                      query_category, 'T', evol, n, weight_a,
-                      weight_b, weight_c)
+        with profiling.category(query_category):
+            urls = corpus.urls(query_category, N=n)
+            snippets = corpus.snippets(query_category, N=n, per_day=False)
+            titles = corpus.titles(query_category, N=n, per_day=False)
+            find_distance(visual, urls, snippets, titles, search_engines,
+                          query_category, 'T', evol, n, weight_a,
+                          weight_b, weight_c)
     visual.show()
 
 
+@sesim.command()
+@click.argument('plan_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--jobs', help='Maximum number of stages executed in parallel'
+              ' processes', default=1, type=int)
+@click.option('--output', help='JSON file where the outputs of analyses are'
+              ' exported', type=click.Path(dir_okay=False), default=None)
+@click.option('--no-plot', help='Do not plot the outputs of analyses',
+              default=False, is_flag=True)
+@click.pass_context
+@handle_exception
+def plan(ctx, plan_file, jobs, output, no_plot):
+    from seanalysis.plan import Plan, load_plan
+    (query_categories, search_engines, results_dir, merge,
+            n, _) = _extract_context(ctx)
+    analysis_plan = Plan(load_plan(plan_file), results_dir, search_engines,
+                         query_categories, N=n, merge=merge,
+                         corpus=_extract_corpus(ctx))
+    analysis_plan.compile()
+    results = analysis_plan.run(jobs)
+    if output is not None:
+        analysis_plan.export(results, output)
+    if not no_plot:
+        analysis_plan.plot(results)
+
+
+@sesim.command()
+@click.option('--bind', help='host:port of the local HTTP service or path of'
+              ' a Unix socket', default='127.0.0.1:8765', type=str)
+@click.option('--refresh', help='Seconds after which new results are loaded'
+              ' before a request is answered; 0 to load them only on'
+              ' /refresh requests', default=60, type=float)
+@click.pass_context
+@handle_exception
+def serve(ctx, bind, refresh):
+    from seanalysis import service
+    (query_categories, search_engines, results_dir, merge,
+            n, _) = _extract_context(ctx)
+    corpus = service.ResidentCorpus(results_dir, query_categories,
+                                    search_engines, N=n,
+                                    corpus=_extract_corpus(ctx))
+    loaded = corpus.refresh()
+    click.echo('%d documents loaded, serving on %s' % (
+        sum(loaded.values()), bind), err=True)
+    service.serve(corpus, bind, refresh)
+
+
 def main():
     sesim()
@@ -20,7 +20,8 @@ from difflib import SequenceMatcher
 import numpy as np
 from jellyfish import levenshtein_distance, damerau_levenshtein_distance, \
     hamming_distance, jaro_distance, jaro_winkler
-from seanalysis import metrics
+from seanalysis import metrics, profiling
+from seanalysis.utils import SEAnalysisException
 
 
 def normalize_levenshtein_distance(se1, se2):
@@ -55,6 +56,7 @@ STRING_COMPARISON_METHODS = {
 }
 
 
+@profiling.profiled('find_distance')
 def find_distance(visual, urls, snippets, titles, search_engines,
                   query_category, method, evolution, N, weight_a,
                   weight_b, weight_c):
@@ -83,6 +85,9 @@ def find_distance(visual, urls, snippets, titles, search_engines,
     :param weight_c: The weight of titles.
     """
     days = urls[search_engines[0]].keys()
+    if not days:
+        raise SEAnalysisException('There are no results of query category %s'
+                                  % repr(query_category))
     number_of_days = len(days)
     random_day = next(iter(days))
     number_of_queries = len(urls[search_engines[0]][random_day])
@@ -134,6 +139,27 @@ def find_distance(visual, urls, snippets, titles, search_engines,
     if visual is None:
         return distances
 
+    plot_distance(visual, distances, search_engines, query_category,
+                  evolution, weight_a, weight_b, weight_c)
+    return distances
+
+
+def plot_distance(visual, distances, search_engines, query_category,
+                  evolution, weight_a, weight_b, weight_c):
+    """
+    Plot the "distance" of sorting of results of two search engines, as
+    calculated by `find_distance`.
+
+    :param visual: A object of Visualization class.
+    :param distances: Array (days, queries, weights) with the distances.
+    :param search_engines: List with exactly two search engines.
+    :param query_category: The category of queries.
+    :param evolution: If True, display the similarity of two search engines
+     over time.
+    :param weight_a: The weight of transpositions.
+    :param weight_b: The weight of snippets.
+    :param weight_c: The weight of titles.
+    """
     if evolution:
         visual.plot_day_similarity(distances, search_engines[0] + '-'
                                    + search_engines[1], weight_a,
@@ -142,4 +168,3 @@ def find_distance(visual, urls, snippets, titles, search_engines,
         visual.plot_heatmap(distances[:, :, 0], ['Queries', 'Days'],
                             search_engines[0] + '-' + search_engines[1]
                             + '(' + query_category + ')')
-    return distances
@@ -12,53 +12,267 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+from itertools import compress, product
+from os.path import join, isfile
+import re
+import time
+import tracemalloc
+import numpy as np
+from joblib import Parallel, delayed
+from seanalysis import profiling
+from seanalysis.models import align_features
 from seanalysis.models.query_clf import QueryClassificationModel
 from seanalysis.models.index_clf import IndexClassificationModel
 from seanalysis.models.lda import LDA
 from seanalysis.models.se_clf import SEClassificationModel
+from seanalysis.models.stream_clf import StreamingClassificationModel
 from seanalysis.models.tensor import TensorCompare
+from seanalysis.models.nmf import NMFCompare
 from seanalysis.algorithms.bag_of_words import BagOfWords
+from seanalysis.algorithms.reduction import reduce_bows
 from seanalysis.drawing.visualization import Visualization
+from seanalysis.feature_store import Features
 from seanalysis.utils import SEAnalysisException
 
 
+# File of a saved model, i.e. query category and model.
+MODEL_FILE = '%s.%s.model'
+
 SUPPORTED_MODELS = {
     "tensor": TensorCompare,
     "lda": LDA,
+    "nmf": NMFCompare,
     "query": QueryClassificationModel,
-    "se": SEClassificationModel
+    "se": SEClassificationModel,
+    "stream": StreamingClassificationModel
 }
 
 SUPPORTED_METHODS = ["cmp", "clf"]
 
 SUPPORTED_MODELS_PER_METHOD = {
-    "cmp": ["tensor", "lda"],
-    "clf": ["query", "se"]
+    "cmp": ["tensor", "lda", "nmf"],
+    "clf": ["query", "se", "stream"]
 }
 
+# The fields of a model configuration are required, unless a tuple
+# (type, default value) is specified for them.
 CONFIGURATION_SCHEMA = {
     "cmp": {
         'lda': {
-            "components": int
+            "components": int,
+            'jobs': (int, 1),
+            'state': (str, None)
         },
         'tensor': {
-            'components': int
+            'components': int,
+            'format': (str, 'dense'),
+            'starts': (int, 1),
+            'jobs': (int, 1),
+            'seed': (int, None),
+            'outer_iter': (int, 1000),
+            'inner_iter': (int, 10),
+            'state': (str, None),
+            'refine': (int, 7)
+        },
+        'nmf': {
+            'components': int,
+            'loss': (str, 'frobenius'),
+            'max_iter': (int, 200),
+            'seed': (int, None)
         }
     },
     "clf": {
         'query': {
             "classifier": str,
-            "evaluation": str
+            "evaluation": str,
+            'jobs': (int, 1)
         },
         'se': {
             'classifier': str,
             'metric': str,
-            'folds': int
+            'folds': int,
+            'jobs': (int, 1),
+            'seed': (int, None)
+        },
+        'stream': {
+            'classifier': (str, 'SGD'),
+            'target': (str, 'se'),
+            'metric': (str, 'roc'),
+            'features': (int, 2 ** 18),
+            'seed': (int, None)
         }
     }
 }
 
 
+# Seed of the dimensionality reduction, so that the reduced representation
+# of a query category is the same in every run (and for every model).
+REDUCTION_SEED = 1
+
+# Fraction of the dates of results which are held out of the fits of a
+# sweep in order to score them.
+HELD_OUT = 0.2
+
+# Score reported for every number of components of a sweep, i.e. (name of
+# score, function computing the score of a fitted model on the held-out
+# `Features`, True if higher scores are better).
+SWEEP_SCORES = {
+    'lda': ('perplexity', lambda model, features: model.held_out_perplexity(
+        features.bows), False),
+    'tensor': ('log_likelihood',
+               lambda model, features: model.held_out_log_likelihood(
+                   features.bows, features.queries, features.keys), True),
+    'nmf': ('reconstruction_error',
+            lambda model, features: model.held_out_error(features.bows),
+            False)
+}
+
+
+def expand_config(config):
+    """
+    Expand a configuration whose values may be comma separated lists to all
+    the combinations of values, e.g. `['a=1,2', 'b=3']` is expanded to
+    `[['a=1', 'b=3'], ['a=2', 'b=3']]`. An escaped comma (`\\,`) is part of
+    a value.
+
+    :param config: List of key-value pairs.
+
+    :return: List of configurations.
+    """
+    keys, values = [], []
+    for conf in config:
+        key, separator, value = conf.partition('=')
+        if not separator:
+            raise SEAnalysisException('Invalid config %s' % repr(conf))
+        keys.append(key)
+        values.append([item.replace('\\,', ',')
+                       for item in re.split(r'(?<!\\),', value)])
+    return [['%s=%s' % pair for pair in zip(keys, combination)]
+            for combination in product(*values)]
+
+
+def split_features(features, held_out=HELD_OUT):
+    """
+    Split the bag of words representation of results by date; the results
+    of the last dates are held out.
+
+    :param features: `Features` object.
+    :param held_out: Fraction of the dates which are held out; at least one
+    date is held out.
+
+    :return: `Features` objects of the first and of the held-out dates.
+    """
+    if features.keys is None:
+        raise SEAnalysisException(
+            'Held-out results require the keys of results')
+    dates = [key[-2] for key in features.keys]
+    unique = sorted(set(dates))
+    if len(unique) < 2:
+        raise SEAnalysisException(
+            'Held-out results require results of at least two dates')
+    first = unique[-max(1, int(round(len(unique) * held_out)))]
+
+    def subset(rows):
+        return features._replace(
+            bows=[bow._replace(matrix=bow.matrix[rows])
+                  for bow in features.bows],
+            queries=list(compress(features.queries, rows)),
+            indexes=None if features.indexes is None
+            else list(compress(features.indexes, rows)),
+            keys=list(compress(features.keys, rows)))
+    test = np.array([date >= first for date in dates], dtype=bool)
+    return subset(~test), subset(test)
+
+
+def analyze_many(controllers, data, index, N, merge, store=None,
+                 reduction=None, jobs=1, save=None):
+    """
+    Analyze data with several controllers, i.e. several models or several
+    configurations of a model.
+
+    The bag of words representation of every query category is built once
+    and it is shared by the models of all controllers. Models are fitted in
+    parallel processes and they are plotted afterwards, controller by
+    controller, in the order of query categories.
+
+    :param controllers: List of `Controller` objects.
+    :param data: Dictionary keyed by query category which contains the
+    snippets for every query result of every search engine. For
+    streaming models, it contains the `DayBatches` of query category.
+    :param index: True to run a classifier for the index classification
+    problem along with every model.
+    :param N: Length of vocabulary. If `None` uses all terms for
+    the vocabulary.
+    :param merge: True to produce a single diagram for the analysis of
+    all query categories; False otherwise.
+    :param store: `FeatureStore` object or `None`.
+    :param reduction: Tuple (method, components) or `None`.
+    :param jobs: Maximum number of models fitted in parallel.
+    :param save: Directory where the fitted models are saved or `None`.
+    """
+    prepared = [controller.prepare(index, reduction)
+                for controller in controllers]
+    features = dict.fromkeys(data)
+    if len(controllers) > 1 and not any(
+            getattr(model_cls, 'streaming', False)
+            for models, _ in prepared for model_cls in models):
+        built = profiling.gather(Parallel(n_jobs=min(jobs, len(data)) or 1)(
+            delayed(profiling.remote(controllers[0].build_features))(
+                query_category, snippets, N, store, reduction)
+            for query_category, snippets in data.items()))
+        features = dict(zip(data, built))
+    tasks = [(controller, models, config, query_category)
+             for controller, (models, config) in zip(controllers, prepared)
+             for query_category in data]
+    fitted = iter(profiling.gather(Parallel(
+        n_jobs=min(jobs, len(tasks)) or 1)(
+        delayed(profiling.remote(controller.fit_category))(
+            query_category, data[query_category]
+            if features[query_category] is None else None,
+            models, config, N, store, reduction, features[query_category],
+            save)
+        for controller, models, config, query_category in tasks)))
+    for models, _ in prepared:
+        visual = Visualization(merge, len(data) * len(models))
+        for query_category in data:
+            for model_obj in next(fitted):
+                model_obj.plot(visual, query_category)
+        visual.show()
+        visual.close()
+
+
+def _sweep_fit(controller, query_category, features, held_out, config):
+    """
+    Fit the model of controller with the given configuration, measuring
+    the fit time and the peak memory allocated by the fit, and score the
+    fitted model on the held-out results.
+
+    :return: Report of the fit.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.time()
+        model_obj = controller.fit_category(
+            query_category, None, [SUPPORTED_MODELS[controller.model]],
+            config, None, features=features)[0]
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        if started:
+            tracemalloc.stop()
+    name, score, _ = SWEEP_SCORES[controller.model]
+    return {
+        'category': query_category, 'components': config['components'],
+        'time': elapsed, 'peak_memory': peak,
+        name: float(score(model_obj, held_out))
+    }
+
+
 class Controller(object):
     """
     This class controls the analysis of the similarity of search engines based
@@ -123,18 +337,26 @@ class Controller(object):
                 raise SEAnalysisException('Invalid config %s for model %s' % (
                     repr(conf), repr(self.model)))
             value_type = required_config.pop(key)
+            if isinstance(value_type, tuple):
+                value_type, _ = value_type
             try:
                 parsed_config[key] = value_type(value)
             except ValueError:
                 raise SEAnalysisException(
                     'Invalid value type for field %s' % repr(key))
 
+        for key, value_type in list(required_config.items()):
+            if isinstance(value_type, tuple):
+                parsed_config[key] = value_type[1]
+                del required_config[key]
+
         if required_config:
             raise SEAnalysisException('Config (%s) for model %s is required' % (
                 ', '.join(required_config.keys()), repr(self.model)))
         return parsed_config
 
-    def analyze(self, data, index, N, merge):
+    def analyze(self, data, index, N, merge, store=None, reduction=None,
+                jobs=1):
         """
         This method triggers the analysis of data given as parameter.
 
@@ -144,31 +366,253 @@ class Controller(object):
         to construct and fit these data, as well as plots the results
         of the analysis of model.
 
+        Query categories are independent, so they are built and fitted in
+        parallel processes. The fitted models are plotted afterwards in the
+        order of query categories.
+
+        :param data: Dictionary keyed by query category which contains the
+        snippets for every query result of every search engine. For
+        streaming models, it contains the `DayBatches` of query category.
+        :param N: Length of vocabulary. If `None` uses all terms for
+        the vocabulary.
+        :param merge: True to produce a single diagram for the analysis of
+        all query categories; False otherwise.
+        :param store: `FeatureStore` used to load the bag of words
+        representation of a query category instead of building it. Snippets
+        of a query category may be `None` if it is already stored.
+        :param reduction: Tuple (method, components) specifying the
+        dimensionality reduction of the bag of words representation, e.g.
+        `('svd', 100)`. `None` for no reduction.
+        :param jobs: Maximum number of query categories processed in
+        parallel.
+
+        """
+        analyze_many([self], data, index, N, merge, store, reduction, jobs)
+
+    def sweep(self, data, components, N, merge, store=None, jobs=1,
+              select=None):
+        """
+        Fit the model with every given number of components and report the
+        score, the fit time and the peak memory of every fit.
+
+        The bag of words representation of every query category is built
+        once and the fits run in parallel processes, where the (large)
+        arrays of the representation are shared through memory mapping.
+        Models are fitted without the results of the last dates (see
+        `split_features`) and they are scored on these held-out results,
+        since the scores of the fitted results keep improving as components
+        are added. The selected number of components, the one with the best
+        score by default, is then fitted with all results of every query
+        category and plotted.
+
         :param data: Dictionary keyed by query category which contains the
         snippets for every query result of every search engine.
+        :param components: List of numbers of components.
         :param N: Length of vocabulary. If `None` uses all terms for
         the vocabulary.
         :param merge: True to produce a single diagram for the analysis of
         all query categories; False otherwise.
+        :param store: `FeatureStore` object or `None`.
+        :param jobs: Maximum number of fits run in parallel.
+        :param select: Number of components of the plotted fits. `None` for
+        the fits with the best score.
 
+        :return: List of dictionaries; the report of every fit.
+        """
+        self.validate()
+        if self.model not in SWEEP_SCORES:
+            raise SEAnalysisException(
+                'Model %s does not support sweeps' % repr(self.model))
+        if select is not None and select not in components:
+            raise SEAnalysisException(
+                'Selected components %d are not swept' % select)
+        config = [conf for conf in self.config
+                  if conf.split('=', 1)[0] != 'components']
+        configs = [Controller(self.method, self.model, config + [
+            'components=%d' % n]).parse_config() for n in components]
+        features = profiling.gather(Parallel(
+            n_jobs=min(jobs, len(data)) or 1)(
+            delayed(profiling.remote(self.build_features))(
+                query_category, snippets, N, store)
+            for query_category, snippets in data.items()))
+        tasks = [(query_category,) + split_features(category_features) +
+                 (model_config,)
+                 for query_category, category_features in zip(
+                     data, features) for model_config in configs]
+        reports = profiling.gather(Parallel(
+            n_jobs=min(jobs, len(tasks)) or 1)(
+            delayed(profiling.remote(_sweep_fit))(self, *task)
+            for task in tasks))
+        name, _, higher = SWEEP_SCORES[self.model]
+        selected = []
+        for query_category in data:
+            candidates = [(task[-1], report)
+                          for task, report in zip(tasks, reports)
+                          if report['category'] == query_category]
+            if select is None:
+                config, report = (max if higher else min)(
+                    candidates, key=lambda candidate: candidate[1][name])
+            else:
+                config, report = next(
+                    candidate for candidate in candidates
+                    if candidate[1]['components'] == select)
+            report['selected'] = True
+            selected.append(config)
+        fitted = profiling.gather(Parallel(n_jobs=min(jobs, len(data)) or 1)(
+            delayed(profiling.remote(self.fit_category))(
+                query_category, None, [SUPPORTED_MODELS[self.model]], config,
+                None, features=category_features)
+            for query_category, category_features, config in zip(
+                data, features, selected)))
+        visual = Visualization(merge, len(data))
+        for query_category, model_objs in zip(data, fitted):
+            model_objs[0].plot(visual, query_category)
+        visual.show()
+        return reports
+
+    def score(self, data, directory, merge):
+        """
+        Apply the models saved by a previous analysis to new results of
+        every query category without fitting them again, and plot the
+        analysis of the new results.
+
+        The bag of words representation of the new results is mapped to the
+        terms of the saved model; new terms are ignored.
+
+        :param data: Dictionary keyed by query category which contains the
+        snippets for every query result of every search engine.
+        :param directory: Directory of the saved models.
+        :param merge: True to produce a single diagram for the analysis of
+        all query categories; False otherwise.
+        """
+        self.validate()
+        model_cls = SUPPORTED_MODELS[self.model]
+        visual = Visualization(merge, len(data))
+        for query_category, snippets in data.items():
+            path = join(directory, MODEL_FILE % (query_category, self.model))
+            if not isfile(path):
+                raise SEAnalysisException(
+                    'There is not any saved %s model of %s' % (
+                        self.model, query_category))
+            model_obj = model_cls.load(path)
+            features = align_features(self.build_features(
+                query_category, snippets, None), model_obj.vocabulary)
+            model_obj.score(features.bows, features.queries, features.keys)
+            model_obj.plot(visual, query_category)
+        visual.show()
+
+    def prepare(self, index, reduction=None):
+        """
+        Validate the method, the model and the configuration of controller
+        and find the models used for the analysis.
+
+        :param index: True to run a classifier for the index classification
+        problem along with the model.
+        :param reduction: Tuple (method, components) or `None`.
+
+        :return: List of model classes and parsed configuration.
         """
         self.validate()
         config = self.parse_config()
+        if reduction is not None and self.method != 'clf':
+            raise SEAnalysisException(
+                'Dimensionality reduction is not supported by method %s' % (
+                    repr(self.method)))
         models = [SUPPORTED_MODELS[self.model], IndexClassificationModel]\
             if index else [SUPPORTED_MODELS[self.model]]
-        visual = Visualization(merge, len(data) * len(models))
-        for query_category, snippets in data.items():
-            bow = BagOfWords(snippets)
-            bow_obj = bow.build_bows(N)
-            for model_cls in models:
-                model_obj = (
-                    model_cls(bow_obj, bow.get_queries(), **config)
-                    if model_cls is not IndexClassificationModel
-                    else model_cls(
-                        bow_obj, bow.get_queries(), bow.get_indexes(),
+        return models, config
+
+    def fit_category(self, query_category, snippets, models, config, N,
+                     store=None, reduction=None, features=None, save=None):
+        """
+        Construct and fit the models of a query category.
+
+        :param query_category: Category of queries.
+        :param snippets: Snippets for every query result of every search
+        engine (or `DayBatches` for streaming models).
+        :param models: List of model classes.
+        :param config: Parsed configuration of models.
+        :param N: Length of vocabulary. If `None` uses all terms for
+        the vocabulary.
+        :param store: `FeatureStore` object or `None`.
+        :param reduction: Tuple (method, components) or `None`.
+        :param features: `Features` object, if the bag of words
+        representation is already built.
+        :param save: Directory where the fitted model of controller is saved
+        along with the terms of the bag of words representation or `None`.
+
+        :return: List of fitted models.
+        """
+        model_objs = []
+        for model_cls in models:
+            if getattr(model_cls, 'streaming', False):
+                model_obj = model_cls(snippets, **config)
+            else:
+                if features is None:
+                    features = self.build_features(
+                        query_category, snippets, N, store, reduction)
+                if model_cls is IndexClassificationModel:
+                    model_obj = model_cls(features.bows, features.queries,
+                                          features.indexes, **config)
+                elif getattr(model_cls, 'incremental', False):
+                    model_obj = model_cls(
+                        features.bows, features.queries, keys=features.keys,
+                        terms=features.terms, category=query_category,
                         **config)
-                )
-                model_obj.construct()
-                model_obj.evaluate()
-                model_obj.plot(visual, query_category)
-        visual.show()
+                else:
+                    model_obj = model_cls(features.bows, features.queries,
+                                          **config)
+            name = model_cls.__name__
+            with profiling.category(query_category):
+                with profiling.stage(name + '.construct'):
+                    model_obj.construct()
+                with profiling.stage(name + '.evaluate'):
+                    model_obj.evaluate()
+            if save is not None and model_cls is SUPPORTED_MODELS[self.model]:
+                model_obj.save(
+                    join(save, MODEL_FILE % (query_category, self.model)),
+                    None if features is None else features.terms)
+            model_objs.append(model_obj)
+        return model_objs
+
+    def build_features(self, query_category, snippets, N, store=None,
+                       reduction=None):
+        """
+        Get the bag of words representation of the results of a query
+        category along with the queries, the indexes and the keys of results
+        and the terms of the representation.
+
+        If a store is given, the representation is loaded from the store,
+        or it is built and then saved to the store. The dimensionality
+        reduction (if any) is applied after the representation is loaded, so
+        stored representation is never reduced, and it is seeded with
+        `REDUCTION_SEED`.
+
+        :param query_category: Category of queries.
+        :param snippets: Snippets for every query result of every search
+        engine.
+        :param N: Length of vocabulary. If `None` uses all terms for
+        the vocabulary.
+        :param store: `FeatureStore` object or `None`.
+        :param reduction: Tuple (method, components) or `None`.
+
+        :return: `Features` object.
+        """
+        with profiling.category(query_category):
+            features = None if store is None\
+                else store.load(query_category, N)
+            if features is None:
+                bow = BagOfWords(snippets)
+                bow_obj = bow.build_bows(N)
+                features = Features(bow_obj, bow.get_queries(),
+                                    bow.get_indexes(), bow.get_keys(),
+                                    bow.terms)
+                if store is not None:
+                    store.save(query_category, N, features)
+            if reduction is not None:
+                with profiling.stage('reduce_bows'):
+                    features = features._replace(
+                        bows=reduce_bows(features.bows, *reduction,
+                                         random_state=REDUCTION_SEED),
+                        terms=None)
+        return features
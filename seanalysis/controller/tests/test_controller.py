@@ -1,6 +1,9 @@
 import unittest
 import mock
+import numpy as np
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput
 from seanalysis.controller import controller as ctrl
+from seanalysis.feature_store import Features
 from seanalysis.utils import SEAnalysisException
 
 SUPPORTED_MODELS = {
@@ -21,6 +24,12 @@ CONFIGURATION_SCHEMA = {
             "a": int,
             'b': int
         }
+    },
+    "method2": {
+        'model2': {
+            "a": int,
+            'c': (int, 3)
+        }
     }
 }
 
@@ -71,6 +80,28 @@ class TestController(unittest.TestCase):
         config = controller.parse_config()
         self.assertEqual(config, {'a': 1, 'b': 2})
 
+    def test_parse_config_default(self):
+        controller = ctrl.Controller('method2', 'model2', ['a=1'])
+        self.assertEqual(controller.parse_config(), {'a': 1, 'c': 3})
+
+        controller.config = ['a=1', 'c=5']
+        self.assertEqual(controller.parse_config(), {'a': 1, 'c': 5})
+
+        controller.config = ['a=1', 'c=invalid_value']
+        self.assertRaises(SEAnalysisException, controller.parse_config)
+
+        controller.config = ['c=5']
+        self.assertRaises(SEAnalysisException, controller.parse_config)
+
+    def test_expand_config(self):
+        self.assertEqual(ctrl.expand_config(['a=1,2', 'b=3', 'c=x,y']), [
+            ['a=1', 'b=3', 'c=x'], ['a=1', 'b=3', 'c=y'],
+            ['a=2', 'b=3', 'c=x'], ['a=2', 'b=3', 'c=y']])
+        self.assertEqual(ctrl.expand_config([]), [[]])
+        self.assertEqual(ctrl.expand_config(['a=x\\,y,z']),
+                         [['a=x,y'], ['a=z']])
+        self.assertRaises(SEAnalysisException, ctrl.expand_config, ['a'])
+
     @mock.patch.object(ctrl.Controller, 'validate')
     @mock.patch.object(ctrl.Controller, 'parse_config')
     @mock.patch('seanalysis.controller.controller.BagOfWords.build_bows')
@@ -87,3 +118,109 @@ class TestController(unittest.TestCase):
         self.assertEqual(mock_bow.call_count, 2)
         self.assertEqual(mock_queries.call_count, 2)
         self.assertEqual(mock_visual.call_count, 1)
+
+    @mock.patch.object(ctrl.Controller, 'validate')
+    @mock.patch.object(ctrl.Controller, 'parse_config')
+    @mock.patch.object(ctrl.Controller, 'fit_category')
+    @mock.patch('seanalysis.controller.controller.Visualization')
+    def test_analyze_plot_order(self, mock_visual, mock_fit, mock_parse,
+                                mock_validate):
+        controller = ctrl.Controller('method1', 'model1', [])
+        mock_parse.return_value = {}
+        models = {category: mock.MagicMock() for category in 'abc'}
+        mock_fit.side_effect = lambda category, *args: [models[category]]
+        manager = mock.MagicMock()
+        for category, model in models.items():
+            manager.attach_mock(model.plot, category)
+        controller.analyze({'a': {}, 'b': {}, 'c': {}}, None, None, True)
+        mock_visual.assert_called_once_with(True, 3)
+        visual = mock_visual.return_value
+        self.assertEqual(manager.mock_calls, [
+            mock.call.a(visual, 'a'), mock.call.b(visual, 'b'),
+            mock.call.c(visual, 'c')])
+        visual.show.assert_called_once_with()
+
+    @mock.patch.dict(ctrl.SWEEP_SCORES, {'model1': (
+        'perplexity', lambda model, features: model.perplexity(
+            features.bows), False)})
+    @mock.patch.object(ctrl.Controller, 'validate')
+    @mock.patch.object(ctrl.Controller, 'parse_config', autospec=True)
+    @mock.patch.object(ctrl.Controller, 'build_features')
+    @mock.patch.object(ctrl.Controller, 'fit_category')
+    @mock.patch('seanalysis.controller.controller.Visualization')
+    def test_sweep(self, mock_visual, mock_fit, mock_features, mock_parse,
+                   mock_validate):
+        controller = ctrl.Controller('method1', 'model1',
+                                     ['components=3', 'a=1'])
+        mock_parse.side_effect = lambda self: {
+            'components': int(self.config[-1].split('=')[1])}
+        mock_features.return_value = Features(
+            [BagOfWordsOutput(np.eye(5), 'x')], ['q'] * 5, [1] * 5,
+            [('d%d' % i, 'q') for i in range(5)], None)
+        perplexities = {5: 30.0, 10: 20.0, 20: 25.0}
+        models = {}
+
+        def fit(query_category, snippets, models_cls, config, N,
+                features=None):
+            model = mock.MagicMock()
+            model.perplexity.return_value = perplexities[
+                config['components']]
+            models[config['components']] = (model, features)
+            return [model]
+        mock_fit.side_effect = fit
+        report = controller.sweep({'a': {}}, [5, 10, 20], None, False)
+        self.assertEqual(mock_features.call_count, 1)
+        # Fits are scored on the results of the last date.
+        self.assertEqual(models[5][1].keys, [('d%d' % i, 'q')
+                                             for i in range(4)])
+        held_out = models[5][0].perplexity.call_args[0][0]
+        np.testing.assert_array_equal(held_out[0].matrix, np.eye(5)[4:])
+        self.assertEqual([r['components'] for r in report], [5, 10, 20])
+        self.assertEqual([r['perplexity'] for r in report],
+                         [30.0, 20.0, 25.0])
+        self.assertEqual([r.get('selected', False) for r in report],
+                         [False, True, False])
+        for r in report:
+            self.assertGreaterEqual(r['time'], 0)
+            self.assertGreaterEqual(r['peak_memory'], 0)
+        # The selected number of components is fitted with all results.
+        visual = mock_visual.return_value
+        model, features = models[10]
+        self.assertEqual(len(features.keys), 5)
+        model.plot.assert_called_once_with(visual, 'a')
+        models[5][0].plot.assert_not_called()
+        report = controller.sweep({'a': {}}, [5, 10, 20], None, False,
+                                  select=20)
+        self.assertTrue(report[2]['selected'])
+        with self.assertRaises(SEAnalysisException):
+            controller.sweep({'a': {}}, [5, 10], None, False, select=20)
+        controller.model = 'model2'
+        with self.assertRaises(SEAnalysisException):
+            controller.sweep({'a': {}}, [5, 10], None, False)
+
+    def test_split_features(self):
+        features = Features(
+            [BagOfWordsOutput(np.arange(6).reshape(3, 2), 'x')],
+            ['q', 'q', 'p'], [1, 1, 2],
+            [(1, 'd2', 'q'), (1, 'd1', 'q'), (2, 'd2', 'p')], ['t', 'u'])
+        train, held_out = ctrl.split_features(features)
+        self.assertEqual(train.keys, [(1, 'd1', 'q')])
+        np.testing.assert_array_equal(held_out.bows[0].matrix,
+                                      [[0, 1], [4, 5]])
+        self.assertEqual(held_out.queries, ['q', 'p'])
+        self.assertEqual(held_out.indexes, [1, 2])
+        self.assertRaises(SEAnalysisException, ctrl.split_features,
+                          features._replace(keys=[(1, 'd1', 'q')] * 3))
+
+    def test_build_features_reduction(self):
+        rng = np.random.RandomState(0)
+        store = mock.MagicMock()
+        store.load.return_value = Features(
+            [BagOfWordsOutput(rng.randint(3, size=(4, 50)), 'x')],
+            ['q'] * 4, None, None, None)
+        controller = ctrl.Controller('method1', 'model1', [])
+        reduced = [controller.build_features('a', None, None, store,
+                                             ('srp', 5)).bows[0].matrix
+                   for _ in range(2)]
+        self.assertEqual(reduced[0].shape, (4, 5))
+        np.testing.assert_array_equal(reduced[0], reduced[1])
@@ -0,0 +1,266 @@
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import partial
+from os import listdir
+from os.path import join, isdir
+from seanalysis import profiling, utils
+from seanalysis.utils import SEAnalysisException
+
+
+def _names(directory):
+    """ Sorted names of a directory, except for hidden ones. """
+    if not isdir(directory):
+        return []
+    return sorted(name for name in listdir(directory)
+                  if not name.startswith('.'))
+
+
+def _bound(select, *dates):
+    """ Select one of the given dates, or `None` if there is none. """
+    dates = [date for date in dates if date is not None]
+    return select(dates) if dates else None
+
+
+class View(Mapping):
+    """
+    This class is a mapping whose items are loaded on first access.
+
+    A view is accepted wherever the dictionaries returned by the loaders of
+    `utils` are, e.g. by `compare_sorting.find_distance` or by the
+    `Controller`. It is loaded once, so it can be passed around (or to other
+    processes) before the documents of results are needed.
+    """
+    def __init__(self, load):
+        self._load = load
+        self._data = None
+
+    def load(self):
+        """
+        Load the items of view, if they have not been loaded yet.
+
+        :return: The loaded dictionary.
+        """
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+class CorpusBatches(utils.DayBatches):
+    """
+    `utils.DayBatches` of the documents of results included by a corpus.
+    """
+    def __init__(self, corpus, query_category, search_engines, N=10,
+                 per_day=True):
+        utils.DayBatches.__init__(self, corpus.results_dir, query_category,
+                                  search_engines, N=N, per_day=per_day)
+        self.corpus = corpus
+
+    def _scan(self):
+        paths = OrderedDict()
+        for path in self.corpus.paths(self.query_category,
+                                      self.search_engines):
+            date = utils.get_query_se(
+                path.replace(self.results_dir, '', 1))[1]
+            paths.setdefault(date, []).append(path)
+        return OrderedDict(sorted(paths.items()))
+
+
+class Corpus(object):
+    """
+    This class represents the results directory, optionally restricted to a
+    range of dates, to some search engines, query categories and queries.
+
+    Filters are applied while the directories of results are scanned, i.e.
+    day directories out of the range, directories of other search engines or
+    query categories and documents of other queries are skipped, so the
+    documents of excluded results are never opened. The range of dates
+    (YYYY-MM-DD) is inclusive and a `None` filter includes everything.
+
+    The snippets, the titles and the urls of a query category are returned
+    as views (see `View`) equal to the outputs of `utils.load_snippets`,
+    `utils.load_titles` and `utils.load_urls` for the included documents.
+    """
+    def __init__(self, results_dir, search_engines=None, categories=None,
+                 since=None, until=None, queries=None):
+        self.results_dir = results_dir
+        self.search_engines = None if search_engines is None\
+            else list(search_engines)
+        self.categories = None if categories is None else list(categories)
+        self.since = since
+        self.until = until
+        self.queries = None if queries is None else set(queries)
+
+    def filter(self, search_engines=None, categories=None, since=None,
+               until=None, queries=None):
+        """
+        Restrict the corpus further.
+
+        :return: New `Corpus` object which includes the results included by
+        both this corpus and the given filters.
+        """
+        def narrow(included, values):
+            if values is None:
+                return included
+            if included is None:
+                return list(values)
+            return [value for value in values if value in included]
+        return Corpus(
+            self.results_dir,
+            narrow(self.search_engines, search_engines),
+            narrow(self.categories, categories),
+            _bound(max, self.since, since), _bound(min, self.until, until),
+            narrow(self.queries, queries))
+
+    def dates(self):
+        """
+        Get the included dates.
+
+        :return: Sorted list of dates.
+        """
+        return [date for date in _names(self.results_dir)
+                if self._included_date(date)]
+
+    def engines(self, query_category, search_engines=None):
+        """
+        Get the included search engines of a query category.
+
+        :param search_engines: Requested search engines; `None` for the
+        included ones or, if the corpus includes every search engine, for
+        the search engines found in the results directory.
+
+        :return: List of search engines.
+        """
+        self._validate_category(query_category)
+        if search_engines is None:
+            if self.search_engines is not None:
+                return list(self.search_engines)
+            return sorted({se for date in self.dates()
+                           for category in self._categories(date,
+                                                            query_category)
+                           for se in _names(join(self.results_dir, date,
+                                                 category))})
+        if self.search_engines is not None:
+            excluded = [se for se in search_engines
+                        if se not in self.search_engines]
+            if excluded:
+                raise SEAnalysisException(
+                    'Search engine %s is not included' % repr(excluded[0]))
+        return list(search_engines)
+
+    @profiling.profiled('corpus.scan')
+    def paths(self, query_category, search_engines=None, dates=None):
+        """
+        Get the paths of the included documents of a query category.
+
+        :param query_category: Category of queries, or `'*'` for every
+        included query category.
+        :param search_engines: List of search engines; `None` for the
+        included ones.
+        :param dates: Scanned dates; `None` for every included date.
+
+        :return: Sorted list of paths, as `utils.get_result_dirs` returns.
+        """
+        engines = self.engines(query_category, search_engines)
+        dates = self.dates() if dates is None else [
+            date for date in dates if self._included_date(date)]
+        paths = []
+        for date in dates:
+            for category in self._categories(date, query_category):
+                for se in engines:
+                    directory = join(self.results_dir, date, category, se)
+                    paths.extend(
+                        join(directory, name) for name in _names(directory)
+                        if self.queries is None or
+                        name.rsplit('-', 1)[0] in self.queries)
+        return sorted(paths)
+
+    def snippets(self, query_category, search_engines=None, N=10,
+                 per_day=True):
+        """
+        Get the snippets of a query category, as `utils.load_snippets` does.
+
+        :return: `View` of the snippets.
+        """
+        engines = self.engines(query_category, search_engines)
+        return View(partial(self._load, utils._load_snippets, query_category,
+                            engines, N, per_day))
+
+    def titles(self, query_category, search_engines=None, N=10,
+               per_day=True):
+        """
+        Get the titles of a query category, as `utils.load_titles` does.
+
+        :return: `View` of the titles.
+        """
+        engines = self.engines(query_category, search_engines)
+        return View(partial(self._load, utils._load_titles, query_category,
+                            engines, N, per_day))
+
+    def urls(self, query_category, search_engines=None, N=10):
+        """
+        Get the urls of a query category, as `utils.load_urls` does.
+
+        :return: `View` of the urls.
+        """
+        engines = self.engines(query_category, search_engines)
+        return View(partial(self._load_urls, query_category, engines, N))
+
+    def batches(self, query_category, search_engines=None, N=10,
+                per_day=True):
+        """
+        Get the snippets of a query category as a sequence of batches; one
+        for each included date (see `utils.DayBatches`).
+
+        :return: `CorpusBatches` object.
+        """
+        return CorpusBatches(self, query_category,
+                             self.engines(query_category, search_engines),
+                             N=N, per_day=per_day)
+
+    def _load(self, load, query_category, search_engines, N, per_day):
+        return load(self.paths(query_category, search_engines),
+                    self.results_dir, query_category, search_engines, N,
+                    per_day)
+
+    def _load_urls(self, query_category, search_engines, N):
+        return utils._load_urls(self.paths(query_category, search_engines),
+                                self.results_dir, query_category, N)
+
+    def _included_date(self, date):
+        return (self.since is None or date >= self.since) and \
+            (self.until is None or date <= self.until)
+
+    def _categories(self, date, query_category):
+        if query_category != '*':
+            return [query_category]
+        return [category for category in _names(join(self.results_dir, date))
+                if self.categories is None or category in self.categories]
+
+    def _validate_category(self, query_category):
+        if query_category != '*' and self.categories is not None and \
+                query_category not in self.categories:
+            raise SEAnalysisException(
+                'Query category %s is not included' % repr(query_category))
@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+import numpy as np
+import seanalysis.drawing.visualization as vsl
+
+
+class TestVisualization(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        output = mock.patch.dict(vsl.OUTPUT)
+        output.start()
+        self.addCleanup(output.stop)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    @mock.patch('seanalysis.drawing.visualization._figure_serials')
+    def test_output(self, mock_serials):
+        mock_serials.__next__.side_effect = [1, 2, 3]
+        vsl.set_output(self.directory, 'svg')
+        visual = vsl.Visualization(False, 2)
+        visual.plot_heatmap(np.eye(2), ['a', 'b'], 'x/y')
+        visual.draw_se_clusters(np.array([[0.5, 1], [0.5, 0]]), 'z',
+                                ['a', 'b'])
+        # Figures are only rendered when they are shown.
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(visual.fig_serial, 2)
+        visual.show()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['001-x_y.svg', '002-z.svg'])
+        visual = vsl.Visualization(True, 2)
+        visual.plot_heatmap(np.eye(2), ['a', 'b'], 'x')
+        visual.plot_heatmap(np.eye(2), ['a', 'b'], 'y')
+        visual.show()
+        self.assertIn('003-merged.svg', os.listdir(self.directory))
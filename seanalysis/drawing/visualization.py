@@ -12,12 +12,98 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+from functools import wraps
+import inspect
+from itertools import count, cycle
 import math
-from itertools import cycle
+import os
+from os.path import join, isdir
+import re
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import seaborn as sns
+from seanalysis import profiling
+
+# Plotting libraries (matplotlib, seaborn) are imported by the methods which
+# draw (see `_pyplot`), so that commands which never plot do not pay for
+# importing them.
+
+# Batch rendering of figures, i.e. the directory where figures are written
+# (`None` to show them interactively), their format and the number of
+# processes rendering them.
+OUTPUT = {
+    'directory': None,
+    'format': 'png',
+    'jobs': 1
+}
+
+FORMATS = ['png', 'svg']
+
+# File of a rendered figure, i.e. serial number, analysis identifier and
+# format. Serial numbers are unique within a run, so figures of different
+# `Visualization` objects never overwrite each other.
+FIGURE_FILE = '%03d-%s.%s'
+
+_figure_serials = count(1)
+
+
+def _pyplot():
+    """ Import `matplotlib.pyplot` on first use. """
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def set_output(directory, format='png', jobs=1):
+    """
+    Render the figures of every subsequent `Visualization` object to files
+    with a non-interactive backend, instead of showing them.
+
+    :param directory: Directory where figures are written.
+    :param format: Format of figures; `png` or `svg`.
+    :param jobs: Number of processes rendering figures.
+    """
+    import matplotlib
+    if not isdir(directory):
+        os.makedirs(directory)
+    matplotlib.use('agg')
+    OUTPUT.update(directory=directory, format=format, jobs=jobs)
+
+
+def deferred(method):
+    """
+    Record the calls of a plotting method when figures are rendered to files,
+    so that all figures are rendered in batch by `Visualization.show`.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.output['directory'] is None:
+            return method(self, *args, **kwargs)
+        figure = 0 if self.merge else self.fig_serial
+        identifier = inspect.signature(method).bind(
+            self, *args, **kwargs).arguments['analysis_identifier']
+        self._figures.setdefault(figure, []).append(
+            (method.__name__, identifier, args, kwargs))
+        self.next_figure()
+    return wrapper
+
+
+@profiling.profiled('render')
+def _render(merge, N, geometry, calls, path):
+    """
+    Render a figure to a file and close it.
+
+    :param merge: True if analyses are drawn in subplots of the figure.
+    :param N: Number of analyses.
+    :param geometry: Geometry of the subplots.
+    :param calls: List of the recorded calls of plotting methods.
+    :param path: Path of the rendered figure.
+    """
+    plt = _pyplot()
+    plt.switch_backend('agg')
+    visual = Visualization(merge, N, geometry)
+    for name, _, args, kwargs in calls:
+        getattr(Visualization, name).__wrapped__(visual, *args, **kwargs)
+    fig = plt.gcf()
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
 
 
 def gridspec_shape(N):
@@ -33,11 +119,16 @@ class Visualization(object):
     """
     def __init__(self, merge, N, geometry=False):
         self.merge = merge
+        self.N = N
+        self.geometry = geometry
+        self.output = dict(OUTPUT)
+        self._figures = {}
         self.fig_serial = 0
         x, y = (N / 10, N % 10) if geometry else gridspec_shape(N)
         self.gridspec = None
         self.subplot_serial = None
         if merge:
+            from matplotlib import gridspec
             self.gridspec = gridspec.GridSpec(x, y, wspace=0.1, hspace=0.0)
             self.subplot_serial = 0
 
@@ -48,6 +139,8 @@ class Visualization(object):
         else:
             self.fig_serial += 1
 
+    @deferred
+    @profiling.profiled('plot')
     def draw_se_clusters(self, se_dist, analysis_identifier, search_engines):
         """
         Plot the contribtion of every search engine to every cluster specified
@@ -71,6 +164,7 @@ class Visualization(object):
         :param analysis_identifier: Identifier for the current analysis.
         :param search_engines: List of search engines.
         """
+        plt = _pyplot()
         fig = plt.figure(self.fig_serial)
         grid = self.gridspec[self.subplot_serial] if self.merge else 111
         ax = fig.add_subplot(grid, projection='3d')
@@ -93,6 +187,7 @@ class Visualization(object):
         :param analysis_identifier: Identifier for the current analysis.
         :param search_engines: List of search engines.
         """
+        plt = _pyplot()
         fig = plt.figure(self.fig_serial)
         if self.merge:
             ax = plt.Subplot(fig, self.gridspec[self.subplot_serial])
@@ -113,6 +208,7 @@ class Visualization(object):
         contribution of each day when results were collected.
         :param analysis_identifier: Category of query.
         """
+        plt = _pyplot()
         fig = plt.figure(self.fig_serial)
         if self.merge:
             ax = plt.Subplot(fig, self.gridspec[self.subplot_serial])
@@ -125,6 +221,8 @@ class Visualization(object):
         plt.ylabel('Activity of cluster')
         plt.title('Day clusters(%s)' % (analysis_identifier))
 
+    @deferred
+    @profiling.profiled('plot')
     def plot_roc(self, roc_metrics, labels, analysis_identifier):
         """
         Plot the given ROC curves.
@@ -134,6 +232,7 @@ class Visualization(object):
         :param labels: List of labels for each ROC curve.
         :param analysis_identifier: Identifier for the analysis.
         """
+        plt = _pyplot()
         fig = plt.figure(self.fig_serial)
         if self.merge:
             ax = plt.Subplot(fig, self.gridspec[self.subplot_serial])
@@ -153,6 +252,8 @@ class Visualization(object):
         plt.legend(loc="lower right")
         self.next_figure()
 
+    @deferred
+    @profiling.profiled('plot')
     def plot_heatmap(self, data, matrix_labels, analysis_identifier):
         """
         Plot a heatmap.
@@ -161,6 +262,8 @@ class Visualization(object):
         :param matrix_labels: List of matrix labels.
         :param analysis_identifier: Identifier for the analysis.
         """
+        plt = _pyplot()
+        import seaborn as sns
         fig = plt.figure(self.fig_serial)
         if self.merge:
             ax = plt.Subplot(fig, self.gridspec[self.subplot_serial])
@@ -171,6 +274,8 @@ class Visualization(object):
         plt.title(analysis_identifier, fontsize=14)
         self.next_figure()
 
+    @deferred
+    @profiling.profiled('plot')
     def plot_day_similarity(self, data, analysis_identifier, weight_a,
                             weight_b, weight_c):
         """
@@ -178,6 +283,7 @@ class Visualization(object):
 
         :param data: A matrix with the data to be plotted.
         """
+        plt = _pyplot()
         fig = plt.figure(self.fig_serial)
         if self.merge:
             ax = plt.Subplot(fig, self.gridspec[self.subplot_serial])
@@ -188,7 +294,7 @@ class Visualization(object):
             d = np.mean(data[:, :, i], axis=1)
             label = 'a=' + str(weight_a[i]) + ', ' + 'b=' + str(weight_b[i])\
                     + ', ' + 'c=' + str(weight_c[i])
-            plt.plot(d, marker=markers.next(), label=label, alpha=0.6,
+            plt.plot(d, marker=next(markers), label=label, alpha=0.6,
                      linewidth=2, ms=7)
         plt.ylim([0, 1.0])
         a = plt.legend(fancybox=True, loc='best', prop={'size': 10})
@@ -198,6 +304,65 @@ class Visualization(object):
         plt.title(analysis_identifier, fontsize=16)
         self.next_figure()
 
+    @deferred
+    @profiling.profiled('plot')
+    def plot_day_metric(self, data, dates, labels, metric_label,
+                        analysis_identifier):
+        """
+        Plot a metric of every day, e.g. the AUC of a classifier evaluated
+        with the results of every day.
+
+        :param data: A matrix (days, curves) with the data to be plotted.
+        :param dates: List of dates.
+        :param labels: List of labels for each curve.
+        :param metric_label: Label of the metric.
+        :param analysis_identifier: Identifier for the analysis.
+        """
+        plt = _pyplot()
+        fig = plt.figure(self.fig_serial)
+        if self.merge:
+            ax = plt.Subplot(fig, self.gridspec[self.subplot_serial])
+            fig.add_subplot(ax)
+        markers = cycle(('o', '>', 'v', 's', '<', '^'))
+        for i, label in enumerate(labels):
+            plt.plot(data[:, i], marker=next(markers), label=label,
+                     alpha=0.6, linewidth=2, ms=7)
+        plt.xticks(range(len(dates)), dates, rotation=90)
+        plt.ylim([0, 1.05])
+        plt.legend(loc='best', prop={'size': 10})
+        plt.ylabel(metric_label, fontsize=14)
+        plt.xlabel('Day', fontsize=14)
+        plt.title(analysis_identifier, fontsize=16)
+        self.next_figure()
+
     def show(self):
-        """ Show existed plots. """
-        plt.show()
+        """
+        Show existed plots.
+
+        If figures are rendered to files, every figure is rendered in a pool
+        of processes and it is closed as soon as it is written.
+        """
+        if self.output['directory'] is None:
+            plt = _pyplot()
+            plt.show()
+            return
+        from joblib import Parallel, delayed
+        tasks = []
+        for figure in sorted(self._figures):
+            calls = self._figures[figure]
+            identifier = 'merged' if self.merge else str(calls[0][1])
+            path = join(self.output['directory'], FIGURE_FILE % (
+                next(_figure_serials), re.sub(r'[^\w.-]+', '_', identifier),
+                self.output['format']))
+            tasks.append((calls, path))
+        profiling.gather(Parallel(
+            n_jobs=min(self.output['jobs'], len(tasks)) or 1)(
+            delayed(profiling.remote(_render))(
+                self.merge, self.N, self.geometry, calls, path)
+            for calls, path in tasks))
+        self._figures = {}
+
+    def close(self):
+        """ Close existed plots, so that next plots start from scratch. """
+        plt = _pyplot()
+        plt.close('all')
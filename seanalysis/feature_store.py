@@ -0,0 +1,171 @@
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+import hashlib
+import json
+import os
+from os.path import join, isdir, isfile
+from scipy import sparse
+from seanalysis import profiling, utils
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput
+
+META_FILE = 'meta.json'
+
+MATRIX_FILE = '%d.npz'
+
+# The bag of words representation of a query category, i.e. the list of
+# bag of words representation objects (one for each search engine) along
+# with the queries, the indexes and the keys associated with their rows and
+# the terms associated with their columns.
+Features = namedtuple('Features', ['bows', 'queries', 'indexes', 'keys',
+                                   'terms'])
+
+
+def corpus_fingerprint(results_dir, query_category, search_engines,
+                       corpus=None):
+    """
+    Compute a fingerprint of the documents of results of a query category.
+
+    The fingerprint is based on the path, the size and the modification time
+    (in nanoseconds, so that rewrites within a second are detected) of every
+    document, so documents are not opened (and parsed) at all.
+
+    :param results_dir: Directory where results for every query and search
+    engine are located.
+    :param query_category: Category of queries.
+    :param search_engines: List of search engines.
+    :param corpus: `Corpus` object whose included documents are
+    fingerprinted; `None` for every document.
+
+    :return: Hex digest identifying the current state of the documents.
+    """
+    digest = hashlib.sha1()
+    paths = utils.get_result_dirs(results_dir, query_category, search_engines)\
+        if corpus is None else corpus.paths(query_category, search_engines)
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(('%s:%d:%d\n' % (
+            path.replace(results_dir, '', 1), stat.st_size,
+            stat.st_mtime_ns)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FeatureStore(object):
+    """
+    This class persists the bag of words representation of query categories.
+
+    Building the bag of words matrices requires the parsing of every document
+    and the tokenization of every snippet, so this store keeps the built
+    matrices (one for each search engine) along with the queries, the indexes
+    and the keys associated with their rows and the terms associated with
+    their columns as compressed sparse files.
+
+    An entry of the store is identified by the query category, the search
+    engines, the number of results per query, the length of vocabulary, the
+    dataset design (per day or per result) and the fingerprint of the
+    documents of results (only of the documents included by `corpus`, if
+    given). Therefore, any change on the corpus invalidates the stored
+    entries. The keys are computed once for the lifetime of the store, so the
+    documents are fingerprinted once for each query category and length of
+    vocabulary.
+    """
+    def __init__(self, directory, results_dir, search_engines, N=10,
+                 per_day=False, corpus=None):
+        self.directory = directory
+        self.results_dir = results_dir
+        self.search_engines = search_engines
+        self.N = N
+        self.per_day = per_day
+        self.corpus = corpus
+        self._keys = {}
+
+    def key(self, query_category, vocabulary):
+        """
+        Compute the key of the entry associated with the given query category
+        and length of vocabulary.
+
+        :param query_category: Category of queries.
+        :param vocabulary: Length of vocabulary. `None` for all terms.
+
+        :return: Key of entry.
+        """
+        if (query_category, vocabulary) not in self._keys:
+            identifier = json.dumps([
+                query_category, list(self.search_engines), self.N,
+                vocabulary, self.per_day, corpus_fingerprint(
+                    self.results_dir, query_category, self.search_engines,
+                    self.corpus)
+            ])
+            self._keys[query_category, vocabulary] = hashlib.sha1(
+                identifier.encode('utf-8')).hexdigest()
+        return self._keys[query_category, vocabulary]
+
+    def contains(self, query_category, vocabulary):
+        """
+        Check if there is a stored entry for the given query category and
+        length of vocabulary.
+        """
+        return isfile(join(self.directory, self.key(
+            query_category, vocabulary), META_FILE))
+
+    @profiling.profiled('feature_store.load')
+    def load(self, query_category, vocabulary):
+        """
+        Load the bag of words representation of a query category.
+
+        :param query_category: Category of queries.
+        :param vocabulary: Length of vocabulary. `None` for all terms.
+
+        :return: `Features` object, whose bag of words matrices are sparse
+        (CSR), or `None` if there is not any stored entry.
+        """
+        entry = join(self.directory, self.key(query_category, vocabulary))
+        if not isfile(join(entry, META_FILE)):
+            return None
+        with open(join(entry, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        bows = [BagOfWordsOutput(
+            sparse.load_npz(join(entry, MATRIX_FILE % i)).tocsr(), se)
+            for i, se in enumerate(meta['search_engines'])]
+        keys = meta.get('keys')
+        return Features(bows, meta['queries'], meta['indexes'],
+                        None if keys is None else [tuple(k) for k in keys],
+                        meta.get('terms'))
+
+    @profiling.profiled('feature_store.save')
+    def save(self, query_category, vocabulary, features):
+        """
+        Store the bag of words representation of a query category.
+
+        :param query_category: Category of queries.
+        :param vocabulary: Length of vocabulary. `None` for all terms.
+        :param features: `Features` object.
+        """
+        entry = join(self.directory, self.key(query_category, vocabulary))
+        if not isdir(entry):
+            os.makedirs(entry)
+        for i, bow in enumerate(features.bows):
+            sparse.save_npz(join(entry, MATRIX_FILE % i),
+                            sparse.csr_matrix(bow.matrix), compressed=True)
+        # Meta file is written last, so that an interrupted save is never
+        # treated as a stored entry.
+        with open(join(entry, META_FILE), 'w') as meta_file:
+            json.dump({
+                'search_engines': [bow.se for bow in features.bows],
+                'queries': list(features.queries),
+                'indexes': list(features.indexes),
+                'keys': [list(key) for key in features.keys],
+                'terms': list(features.terms)
+            }, meta_file)
@@ -14,9 +14,7 @@
 
 import numpy as np
 from itertools import combinations
-from sklearn.metrics.pairwise import cosine_similarity as cosine
 from seanalysis import utils
-from seanalysis.algorithms import bag_of_words as bw
 
 
 def metric_g(u, v):
@@ -106,6 +104,8 @@ def _extract_item_from_dict(dict_value):
 
 def metric_T(u, v, snippets_u, snippets_v, titles_u, titles_v, a, b, c,
              W=[0.15, 0.1, 0.07, 0.04, 0.01], threshold=0.1):
+    # Bag of words (nltk, sklearn) is imported only by the metric using it.
+    from seanalysis.algorithms import bag_of_words as bw
     u_len, v_len = len(u), len(v)
     if not u_len or not v_len:
         return 0
@@ -149,7 +149,8 @@ def metric_T(u, v, snippets_u, snippets_v, titles_u, titles_v, a, b, c,
             }
         }
         bows = bw.BagOfWords(titles, False).build_bows()
-        k += (1 - cosine(bows[0].matrix, bows[1].matrix).flatten()[0])
+        k += (1 - bw.binary_cosine(bw.pack_bits(bows[0].matrix),
+                                   bw.pack_bits(bows[1].matrix)).flatten()[0])
 
 
         snippet1 = snippet_u_val[x]
@@ -169,7 +170,8 @@ def metric_T(u, v, snippets_u, snippets_v, titles_u, titles_v, a, b, c,
             }
         }
         bows = bw.BagOfWords(snippets).build_bows()
-        s += (1 - cosine(bows[0].matrix, bows[1].matrix).flatten()[0])
+        s += (1 - bw.binary_cosine(bw.pack_bits(bows[0].matrix),
+                                   bw.pack_bits(bows[1].matrix)).flatten()[0])
 
     tr = _transpositions_penalty(u, v)
 
@@ -14,11 +14,165 @@
 
 from abc import ABCMeta, abstractmethod
 from collections import namedtuple
+import joblib
+import numpy as np
+from scipy import sparse
+from seanalysis.utils import SEAnalysisException
 
 
 Evaluation = namedtuple('Evaluation', ['labels', 'metrics', 'type'])
 
 
+def query_codes(queries):
+    """
+    Encode the queries associated with the rows of bag of words matrices.
+
+    The code of a query is the position of its first occurrence in the
+    given list, so the codes are computed in a single pass.
+
+    :param queries: List of queries.
+
+    :return: Array with the code of every query.
+    """
+    first_occurrence = {}
+    for i, query in enumerate(queries):
+        first_occurrence.setdefault(query, i)
+    return np.fromiter((first_occurrence[query] for query in queries),
+                       dtype=np.min_scalar_type(len(queries)),
+                       count=len(queries))
+
+
+def stack_matrices(matrices):
+    """
+    Stack bag of words matrices vertically.
+
+    :param matrices: List of matrices (dense or sparse).
+
+    :return: Stacked matrix; sparse (CSR) if any of the matrices is sparse.
+    """
+    if any(sparse.issparse(matrix) for matrix in matrices):
+        return sparse.vstack(matrices, format='csr')
+    return np.vstack(matrices)
+
+
+def stack_train_set(bows, codes):
+    """
+    Stack the bag of words matrices of search engines into a single train
+    set, where the last column contains the code of the query associated
+    with every row.
+
+    Sparse matrices are stacked into a sparse (CSR) train set, while dense
+    ones into a train set which is allocated once.
+
+    :param bows: List of bag of words representation objects.
+    :param codes: Array with the query code of every row of a matrix.
+
+    :return: Matrix with shape (search engines x rows, terms + 1).
+    """
+    if any(sparse.issparse(bow.matrix) for bow in bows):
+        return sparse.hstack((
+            stack_matrices([bow.matrix for bow in bows]),
+            np.tile(codes, len(bows))[:, np.newaxis]), format='csr')
+    rows, terms = bows[0].matrix.shape
+    X = np.empty((rows * len(bows), terms + 1),
+                 dtype=np.promote_types(bows[0].matrix.dtype, codes.dtype))
+    for i, bow in enumerate(bows):
+        X[i * rows:(i + 1) * rows, :-1] = bow.matrix
+        X[i * rows:(i + 1) * rows, -1] = codes
+    return X
+
+
+def topic_distributions(topics, components, se_codes, n_se, q_codes,
+                        query_labels):
+    """
+    Find the query and search engine frequency distribution on each topic.
+
+    :param topics: Array with the topic of every document.
+    :param components: Number of topics.
+    :param se_codes: Array with the search engine code of every document.
+    :param n_se: Number of search engines.
+    :param q_codes: Array with the query code of every document.
+    :param query_labels: Array with the query of every query code.
+
+    :return: 1) Numpy array (search_engines, non-empty topics) with frequency
+             distribution of each search engine on each topic.
+             2) List of list of tuples (query, dist) with the frequency
+             distribution of each query on each topic.
+    """
+    n_queries = len(query_labels)
+    doc_len = np.bincount(topics, minlength=components)
+    non_empty_topics = np.flatnonzero(doc_len)
+    doc_len = doc_len[non_empty_topics, np.newaxis].astype(float)
+    se_counts = np.bincount(
+        topics * n_se + se_codes,
+        minlength=components * n_se).reshape(
+            components, n_se)[non_empty_topics]
+    q_counts = np.bincount(
+        topics * n_queries + q_codes,
+        minlength=components * n_queries).reshape(
+            components, n_queries)[non_empty_topics]
+    query_dist = [
+        list(zip(query_labels[np.flatnonzero(counts)],
+                 counts[np.flatnonzero(counts)] / length))
+        for counts, length in zip(q_counts, doc_len[:, 0])]
+    return (se_counts / doc_len).transpose(), query_dist
+
+
+def map_terms(matrix, terms, vocabulary):
+    """
+    Map the columns of a bag of words matrix to the terms of another
+    vocabulary. Terms which are not included in the vocabulary are ignored.
+
+    :param matrix: Bag of words matrix (dense or sparse).
+    :param terms: List of terms associated with the columns of matrix.
+    :param vocabulary: List of terms associated with the columns of the
+    mapped matrix.
+
+    :return: Mapped matrix (dense or sparse as the given matrix).
+    """
+    index = {term: i for i, term in enumerate(vocabulary)}
+    source = [i for i, term in enumerate(terms) if term in index]
+    target = [index[terms[i]] for i in source]
+    projection = sparse.csr_matrix(
+        (np.ones(len(source), dtype=matrix.dtype), (source, target)),
+        shape=(len(terms), len(vocabulary)))
+    mapped = sparse.csr_matrix(matrix).dot(projection)
+    return mapped if sparse.issparse(matrix) else mapped.toarray()
+
+
+def completion_terms(n_terms):
+    """
+    Split the terms for the document completion of held-out results, i.e.
+    the weights of a held-out document are fitted to half of its terms and
+    the model is scored on the other half, so that the score does not
+    reward models which simply have more free parameters.
+
+    :param n_terms: Number of terms.
+
+    :return: Boolean mask of the terms to which held-out documents are
+    fitted; the others are scored.
+    """
+    return np.arange(n_terms) % 2 == 0
+
+
+def align_features(features, vocabulary):
+    """
+    Map the bag of words representation of new results to the vocabulary of
+    a fitted model.
+
+    :param features: `Features` object.
+    :param vocabulary: List of terms of the fitted model.
+
+    :return: `Features` object whose matrices refer to the vocabulary.
+    """
+    if features.terms is None or vocabulary is None:
+        raise SEAnalysisException(
+            'Scoring requires the terms of the bag of words representation')
+    return features._replace(bows=[
+        bow._replace(matrix=map_terms(bow.matrix, features.terms, vocabulary))
+        for bow in features.bows], terms=list(vocabulary))
+
+
 class Model(object):
     """
     This class defines models for the analysis of search engines.
@@ -31,6 +185,16 @@ class Model(object):
 
     __metaclass__ = ABCMeta
 
+    # True if model is constructed by a `DayBatches` object, i.e. the
+    # results are streamed instead of being represented as a whole.
+    streaming = False
+
+    # Attributes composing the fitted state of model, i.e. its configuration
+    # and its fitted estimators or factor matrices. Only these attributes
+    # are persisted by `save`, so the train data are never stored. Models
+    # without any such attribute cannot be saved.
+    fitted = ()
+
     @abstractmethod
     def construct(self):
         """ Constucts the train data to be used by model. """
@@ -52,3 +216,53 @@ class Model(object):
         :param title: Title to identify the diagram of analysis.
         """
         pass
+
+    def save(self, path, vocabulary=None):
+        """
+        Persist the fitted state of model.
+
+        :param path: Path of the persisted model.
+        :param vocabulary: List of terms associated with the columns of the
+        bag of words representation which model was fitted with.
+        """
+        if not self.fitted:
+            raise SEAnalysisException(
+                'Model %s cannot be saved' % type(self).__name__)
+        joblib.dump({
+            'model': type(self).__name__, 'vocabulary': vocabulary,
+            'fitted': {name: getattr(self, name) for name in self.fitted}
+        }, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a persisted model without fitting it again.
+
+        :param path: Path of the persisted model.
+
+        :return: Model object whose `vocabulary` attribute contains the terms
+        of the persisted model.
+        """
+        saved = joblib.load(path)
+        if saved['model'] != cls.__name__:
+            raise SEAnalysisException('%s is a persisted %s, not %s' % (
+                path, saved['model'], cls.__name__))
+        model = cls.__new__(cls)
+        model.__dict__.update(saved['fitted'])
+        model.vocabulary = saved['vocabulary']
+        return model
+
+    def score(self, bows, queries, keys=None):
+        """
+        Apply the fitted model to the bag of words representation of new
+        results, e.g. of the days collected after the fit, without fitting
+        it again. The results of model are replaced, so that `plot` draws
+        the analysis of the new results.
+
+        :param bows: List of bag of words representation objects, whose
+        columns refer to the vocabulary of model.
+        :param queries: List of queries associated with the rows of matrices.
+        :param keys: List of keys associated with the rows of matrices.
+        """
+        raise SEAnalysisException(
+            'Model %s does not support scoring' % type(self).__name__)
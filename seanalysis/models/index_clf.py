@@ -13,10 +13,10 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import numpy as np
-from sklearn.model_selection import KFold
 from sklearn.metrics import confusion_matrix
-from seanalysis.models import Evaluation, Model
-from seanalysis.algorithms.classifiers import classify
+from seanalysis.models import Evaluation, Model, query_codes,\
+    stack_train_set
+from seanalysis.algorithms.classifiers import cross_validate
 
 
 class IndexClassificationModel(Model):
@@ -44,11 +44,13 @@ class IndexClassificationModel(Model):
     """
     # TODO Support more evaluation metrics.
     def __init__(self, bows, queries, indexes, classifier='LOGREG',
-                 metric=None, folds=3):
+                 metric=None, folds=3, jobs=1, seed=None):
         self.bows = bows
         self._queries = queries
         self.classifier = classifier
         self.folds = folds
+        self.jobs = jobs
+        self.seed = seed
         self.indexes, self._classes = indexes, set(indexes)
 
     def construct(self):
@@ -62,17 +64,8 @@ class IndexClassificationModel(Model):
 
         Classes of this model are the indexes of the results.
         """
-        train_set = []
-        Y = []
-        query_set = list(set(self._queries))
-        for bow in self.bows:
-            se_train = bow.matrix
-            query_column = np.array(
-                [query_set.index(q) for q in self._queries]).reshape(
-                    se_train.shape[0], 1)
-            train_set += [np.append(se_train, query_column, 1)]
-            Y += self.indexes
-        self.X, self.Y = np.vstack(train_set), np.vstack(Y).ravel()
+        self.X = stack_train_set(self.bows, query_codes(self._queries))
+        self.Y = np.tile(self.indexes, len(self.bows))
 
     def evaluate(self):
         """
@@ -80,18 +73,17 @@ class IndexClassificationModel(Model):
         problem.
 
         It uses cross validation along with the specified classifer and the
-        number of folds. To evaluate the performance of the classifier
-        confusion matrix is used.
+        number of folds. Folds are fitted by `jobs` worker processes.
+        To evaluate the performance of the classifier confusion matrix is
+        used.
         """
         N = len(self._classes)
+        labels = sorted(self._classes)
         total_cm = np.zeros((N, N), dtype=float)
-        kf = KFold(self.X.shape[0], n_folds=self.folds, shuffle=True,
-                   random_state=None)
-        for train_index, test_index in kf:
-            pred = classify(self.X[train_index], self.Y[train_index],
-                            self.X[test_index], classifier=self.classifier,
-                            oneVSrest=False, prob=False)
-            cm = confusion_matrix(self.Y[test_index], pred)
+        for test_index, pred in cross_validate(
+                self.X, self.Y, self.classifier, folds=self.folds,
+                jobs=self.jobs, seed=self.seed, prob=False):
+            cm = confusion_matrix(self.Y[test_index], pred, labels=labels)
             total_cm += cm
         norm_cm = total_cm.astype('float') / total_cm.sum(
             axis=1)[:, np.newaxis]
@@ -12,9 +12,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+from os.path import join, isfile
 import numpy as np
+import joblib
+from scipy import sparse
 from sklearn.decomposition import LatentDirichletAllocation
-from seanalysis.models import Model
+from seanalysis.models import Model, completion_terms, map_terms, \
+    topic_distributions
+from seanalysis.utils import SEAnalysisException
+
+STATE_FILE = '%s.lda'
 
 
 class LDA(Model):
@@ -30,17 +37,41 @@ class LDA(Model):
     On the other hand, when results produced by different search engines are
     allocated to different topics, then we can infer that search engines are
     not similar.
+
+    If a state directory is given, the fitted model along with the topic
+    allocation of every result is persisted per query category. Then, the
+    next analysis of the query category only updates the persisted model
+    with the results of the new days (via online learning) and allocates
+    only these results to topics.
+
+    A saved model allocates the results of new days to the topics of the
+    fitted LDA, without updating it.
     """
-    def __init__(self, bows, queries, components=20):
+    incremental = True
+
+    fitted = ('components', 'jobs', 'lda', '_lda_terms')
+
+    def __init__(self, bows, queries, components=20, jobs=1, state=None,
+                 keys=None, terms=None, category=None):
         self.X = None
         self.se_dist = None
         self.query_dist = None
         self.bows = bows
         self.components = components
+        self.jobs = jobs
+        self.state = state
+        self.topics = None
+        self.lda = None
         self._search_engines = [bow.se for bow in bows]
-        self._se_query = None
         self._documents = None
         self._queries = queries
+        self._keys = keys
+        self._terms = terms
+        self._category = category
+        self._se_codes = None
+        self._query_codes = None
+        self._query_labels = None
+        self._lda_terms = None
 
     def construct(self):
         """
@@ -49,12 +80,13 @@ class LDA(Model):
         Dataset contains the bag of words representation of a result produced
         by a specific search engine on a specific date.
         """
-        self._documents = np.vstack([bow.matrix for bow in self.bows])
-        se_query = []
-        for bow in self.bows:
-            se = [bow.se] * bow.matrix.shape[0]
-            se_query += zip(se, self._queries)
-        self._se_query = np.asarray(se_query)
+        self._documents = sparse.vstack(
+            [sparse.csr_matrix(bow.matrix) for bow in self.bows]).tocsr()
+        rows = self.bows[0].matrix.shape[0]
+        self._query_labels, query_codes = np.unique(
+            self._queries, return_inverse=True)
+        self._se_codes = np.repeat(np.arange(len(self.bows)), rows)
+        self._query_codes = np.tile(query_codes, len(self.bows))
 
     def evaluate(self):
         """
@@ -68,14 +100,24 @@ class LDA(Model):
                  2) List of list of tuples (query, dist) with the frequency
                  distribution of each query on each topic.
         """
-        lda = LatentDirichletAllocation(n_components=self.components, max_iter=20,
-                                        learning_method='online',
-                                        learning_offset=10., random_state=1)
-        self.X = lda.fit_transform(self._documents)
-        doc_allocation = np.argmax(self.X.transpose(), axis=0)
-        docs = [np.where(doc_allocation == topic_id)[0].tolist()
-                for topic_id in range(self.components)]
-        self.se_dist, self.query_dist = self._topic_dist(docs)
+        state = self._load_state()
+        if state is None:
+            lda = LatentDirichletAllocation(
+                n_components=self.components, max_iter=20,
+                learning_method='online', learning_offset=10.,
+                random_state=1, n_jobs=self.jobs)
+            self.X = lda.fit_transform(self._documents)
+            self.topics = np.argmax(self.X, axis=1)
+            state = {'lda': lda, 'terms': self._terms, 'topics': {},
+                     'search_engines': self._search_engines,
+                     'per_result': self._per_result()}
+        else:
+            self.topics = self._update(state)
+        self.lda, self._lda_terms = state['lda'], state['terms']
+        if self.state is not None:
+            state['topics'].update(zip(self._document_keys(), self.topics))
+            joblib.dump(state, self._state_path())
+        self.se_dist, self.query_dist = self._topic_dist(self.topics)
 
     def plot(self, visual, query_category):
         """
@@ -93,28 +135,144 @@ class LDA(Model):
         visual.draw_se_clusters(self.se_dist, query_category,
                                 self._search_engines)
 
-    def _topic_dist(self, docs):
+    def perplexity(self):
+        """
+        Compute the perplexity of the fitted LDA on the documents of model;
+        the lower the perplexity, the better the topics fit the documents.
+        """
+        return self.lda.perplexity(self._lda_documents())
+
+    def held_out_perplexity(self, bows):
+        """
+        Compute the perplexity of the fitted LDA on held-out bag of words
+        matrices (with the terms of model) by document completion (see
+        `completion_terms`); the lower the perplexity, the better the topics
+        generalize.
+
+        :param bows: List of `BagOfWordsOutput` objects.
+
+        :return: Perplexity of the scored terms of documents.
+        """
+        documents = sparse.vstack(
+            [sparse.csr_matrix(bow.matrix) for bow in bows]).tocsr()
+        if self._lda_terms is not None and self._lda_terms != self._terms:
+            documents = self._map_terms(documents, self._lda_terms)
+        fitted = completion_terms(documents.shape[1])
+        mask = sparse.diags(fitted.astype(documents.dtype))
+        theta = self.lda.transform(documents.dot(mask))
+        scored = documents[:, np.flatnonzero(~fitted)].tocoo()
+        beta = self.lda.components_[:, ~fitted] /\
+            self.lda.components_.sum(axis=1)[:, np.newaxis]
+        likelihood = np.einsum('ij,ji->i', theta[scored.row],
+                               beta[:, scored.col])
+        return float(np.exp(-np.dot(scored.data, np.log(likelihood)) /
+                            scored.data.sum()))
+
+    def score(self, bows, queries, keys=None):
+        """
+        Allocate new results to the topics of the fitted LDA and find the
+        query and search engine frequency distribution on each topic.
+
+        :return: Numpy array (n_topics, search_engines) with frequency
+        distribution of each search engine on each topic.
+        """
+        self.bows = bows
+        self._queries = queries
+        self._search_engines = [bow.se for bow in bows]
+        self._terms = self.vocabulary
+        self.construct()
+        self.X = self.lda.transform(self._lda_documents())
+        self.topics = np.argmax(self.X, axis=1)
+        self.se_dist, self.query_dist = self._topic_dist(self.topics)
+        return self.se_dist
+
+    def _lda_documents(self):
+        """ Documents of model mapped to the terms of the fitted LDA. """
+        if self._lda_terms is None or self._lda_terms == self._terms:
+            return self._documents
+        return self._map_terms(self._documents, self._lda_terms)
+
+    def _state_path(self):
+        if self._keys is None or self._category is None:
+            raise SEAnalysisException(
+                'LDA state requires the keys of results and the category')
+        return join(self.state, STATE_FILE % self._category)
+
+    def _document_keys(self):
+        """ Keys identifying every document, i.e. (se, [index,] date, query).
+        """
+        return [(se,) + tuple(key) for se in self._search_engines
+                for key in self._keys]
+
+    def _load_state(self):
+        """
+        Load the persisted state of the query category.
+
+        A state is compatible if it has the number of topics, the search
+        engines and the kind of documents (per day or per result) of model.
+        Its terms may differ, as documents are mapped to them.
+
+        :return: Dictionary with the fitted LDA, its terms and the topic of
+        every allocated document or `None` if there is not any compatible
+        state.
+        """
+        if self.state is None or not isfile(self._state_path()):
+            return None
+        state = joblib.load(self._state_path())
+        if state['lda'].n_components != self.components\
+                or state.get('search_engines') != self._search_engines\
+                or state.get('per_result') != self._per_result()\
+                or (state['terms'] is None) != (self._terms is None):
+            return None
+        return state
+
+    def _per_result(self):
+        """ True if documents are results, i.e. keys include their index. """
+        return len(self._keys[0]) > 2 if self._keys else None
+
+    def _update(self, state):
+        """
+        Update the persisted LDA with the documents which have not been
+        allocated yet and allocate them to topics.
+
+        Documents are mapped to the terms of the persisted LDA; terms which
+        are unknown to the persisted LDA are ignored. The topic distribution
+        of every document (`X`) is computed with the updated LDA.
+
+        :return: Array with the topic of every document.
+        """
+        topics = state['topics']
+        keys = self._document_keys()
+        new = np.array([key not in topics for key in keys], dtype=bool)
+        allocation = np.array([topics.get(key, -1) for key in keys],
+                              dtype=int)
+        documents = self._documents
+        if state['terms'] is not None and state['terms'] != self._terms:
+            documents = self._map_terms(documents, state['terms'])
+        if new.any():
+            state['lda'].n_jobs = self.jobs
+            state['lda'].partial_fit(documents[new])
+        self.X = state['lda'].transform(documents)
+        allocation[new] = np.argmax(self.X[new], axis=1)
+        return allocation
+
+    def _map_terms(self, documents, terms):
+        """
+        Map the columns of documents to the given terms.
+        """
+        return map_terms(documents, self._terms, terms)
+
+    def _topic_dist(self, topics):
         """
         Find the query and search engine frequency distribution on each topic.
 
+        :param topics: Array with the topic of every document.
+
         :return: 1) Numpy array (n_topics, search_engines) with frequency
                  distribution of each search engine on each topic.
                  2) List of list of tuples (query, dist) with the frequency
                  distribution of each query on each topic.
         """
-        non_empty_topics = [doc for doc in docs if doc]
-        se_memberships = np.zeros(
-            (len(non_empty_topics), len(self._search_engines)), dtype=float)
-        query_dist = []
-        for i, doc in enumerate(non_empty_topics):
-            doc_len = len(doc)
-            se, se_counts = np.unique(self._se_query[doc, 0],
-                                      return_counts=True)
-            queries, q_counts = np.unique(self._se_query[doc, 1],
-                                          return_counts=True)
-            query_dist.append(
-                zip(queries, [float(x) / doc_len for x in q_counts]))
-            se_indexes = [self._search_engines.index(s) for s in se]
-            scores = [float(s) / doc_len for s in se_counts]
-            se_memberships[i, se_indexes] = scores
-        return se_memberships.transpose(), query_dist
+        return topic_distributions(
+            topics, self.components, self._se_codes,
+            len(self._search_engines), self._query_codes, self._query_labels)
@@ -0,0 +1,184 @@
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import NMF, non_negative_factorization
+from seanalysis.models import Model, completion_terms, topic_distributions
+from seanalysis.utils import SEAnalysisException
+
+# Solver used for every supported loss of the factorization.
+LOSSES = {
+    'frobenius': 'cd',
+    'kullback-leibler': 'mu'
+}
+
+
+class NMFCompare(Model):
+    """
+    This class represents a technique that uses Non-negative Matrix
+    Factorization to allocate results of search engines into topics.
+
+    The stacked bag of words matrix of all search engines (documents X terms)
+    is factorized into a documents X topics and a topics X terms matrix and
+    every document is allocated to the topic with the largest weight. As in
+    LDA, if one topic contains results produced by a uniformly number of
+    search engines, then we can infer that search engines are similar.
+
+    The factorization works directly on the sparse matrix and it is usually
+    much faster than LDA and CP-APR.
+
+    A saved model allocates the results of new days to the topics of the
+    fitted factorization, without fitting it again.
+    """
+    fitted = ('components', 'loss', 'nmf')
+
+    def __init__(self, bows, queries, components=20, loss='frobenius',
+                 max_iter=200, seed=None):
+        self.X = None
+        self.se_dist = None
+        self.query_dist = None
+        self.bows = bows
+        self.components = components
+        self.loss = loss
+        self.max_iter = max_iter
+        self.seed = seed
+        self.topics = None
+        self.nmf = None
+        self.reconstruction_error = None
+        self._search_engines = [bow.se for bow in bows]
+        self._documents = None
+        self._queries = queries
+        self._se_codes = None
+        self._query_codes = None
+        self._query_labels = None
+
+    def construct(self):
+        """
+        Construct the sparse documents X terms matrix to be factorized.
+
+        Dataset contains the bag of words representation of a result produced
+        by a specific search engine on a specific date.
+        """
+        if self.loss not in LOSSES:
+            raise SEAnalysisException(
+                'Unsupported loss: %s' % repr(self.loss))
+        self._documents = sparse.vstack(
+            [sparse.csr_matrix(bow.matrix, dtype=float)
+             for bow in self.bows]).tocsr()
+        rows = self.bows[0].matrix.shape[0]
+        self._query_labels, query_codes = np.unique(
+            self._queries, return_inverse=True)
+        self._se_codes = np.repeat(np.arange(len(self.bows)), rows)
+        self._query_codes = np.tile(query_codes, len(self.bows))
+
+    def evaluate(self):
+        """
+        Factorize the documents and allocate every document to the topic
+        with the largest weight.
+
+        Then find, the query and search engine frequency distribution on each
+        topic.
+        """
+        self.nmf = NMF(n_components=self.components,
+                       solver=LOSSES[self.loss], beta_loss=self.loss,
+                       max_iter=self.max_iter,
+                       init='nndsvda' if self.loss != 'frobenius'
+                       else 'nndsvd', random_state=self.seed)
+        self.X = self.nmf.fit_transform(self._documents)
+        self.reconstruction_error = self.nmf.reconstruction_err_
+        self._allocate()
+
+    def score(self, bows, queries, keys=None):
+        """
+        Allocate new results to the topics of the fitted factorization and
+        find the query and search engine frequency distribution on each
+        topic.
+
+        :return: Numpy array (n_topics, search_engines) with frequency
+        distribution of each search engine on each topic.
+        """
+        self.bows = bows
+        self._queries = queries
+        self._search_engines = [bow.se for bow in bows]
+        self.construct()
+        self.X = self.nmf.transform(self._documents)
+        self._allocate()
+        return self.se_dist
+
+    def held_out_error(self, bows):
+        """
+        Compute the error of the fitted factorization on held-out bag of
+        words matrices (with the terms of model) by document completion (see
+        `completion_terms`), as `reconstruction_error` is computed, i.e. the
+        square root of twice the beta divergence of the loss.
+
+        The topic weights of documents are fitted to the fitted terms with
+        the topics X terms matrix fixed, and the divergence is computed on
+        the scored terms only. It is computed from the non-zero entries of
+        documents and the sums of the factorization, so the dense
+        reconstruction is never allocated.
+
+        :param bows: List of `BagOfWordsOutput` objects.
+
+        :return: Error of the scored terms of documents.
+        """
+        documents = sparse.vstack(
+            [sparse.csr_matrix(bow.matrix, dtype=float)
+             for bow in bows]).tocsr()
+        fitted = completion_terms(documents.shape[1])
+        H = self.nmf.components_
+        W = non_negative_factorization(
+            documents[:, np.flatnonzero(fitted)], H=H[:, fitted],
+            n_components=self.components, update_H=False,
+            solver=LOSSES[self.loss], beta_loss=self.loss,
+            max_iter=self.max_iter)[0]
+        scored = documents[:, np.flatnonzero(~fitted)].tocoo()
+        H = H[:, ~fitted]
+        reconstructed = np.einsum('ij,ji->i', W[scored.row], H[:, scored.col])
+        if self.loss == 'frobenius':
+            divergence = (np.dot(scored.data, scored.data) -
+                          2 * np.dot(scored.data, reconstructed) +
+                          np.sum(np.dot(W.T, W) * np.dot(H, H.T))) / 2
+        else:
+            divergence = np.dot(scored.data, np.log(
+                scored.data / np.maximum(reconstructed, 1e-10))) -\
+                scored.data.sum() + np.dot(W.sum(axis=0), H.sum(axis=1))
+        return float(np.sqrt(2 * max(divergence, 0.)))
+
+    def plot(self, visual, query_category):
+        """
+        This method plots the distribution of every search engine to every
+        topic.
+
+        If the search engines are similar, it is expected that their
+        distribution to every cluster is also similar.
+
+        :param visual: Visualization obj responsible for the plotting of
+        resutlts.
+        :param query_category: Category of queries which were used for the
+        analysis.
+        """
+        visual.draw_se_clusters(self.se_dist, query_category,
+                                self._search_engines)
+
+    def _allocate(self):
+        """
+        Allocate every document to the topic with the largest weight and find
+        the query and search engine frequency distribution on each topic.
+        """
+        self.topics = np.argmax(self.X, axis=1)
+        self.se_dist, self.query_dist = topic_distributions(
+            self.topics, self.components, self._se_codes,
+            len(self._search_engines), self._query_codes, self._query_labels)
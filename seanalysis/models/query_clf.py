@@ -13,13 +13,71 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import itertools
+import numpy as np
+from joblib import Parallel, delayed
 from sklearn.metrics import auc, roc_curve
 from sklearn.preprocessing import label_binarize
 import seanalysis.algorithms.classifiers as clfs
-from seanalysis.models import Evaluation, Model
+from seanalysis.models import Evaluation, Model, stack_matrices
 from seanalysis.utils import SEAnalysisException
 
 
+def held_out(bows):
+    """
+    Split the results of search engines into the results of every search
+    engine and the results of the remaining search engines.
+
+    :param bows: List of bag of words representation objects.
+
+    :return: List of lists of the bag of words representation objects of
+    the remaining search engines, one for each search engine.
+    """
+    return [[bow for bow in bows if bow is not a] for a in bows]
+
+
+def cross_learn_results(bows, classifiers, Y):
+    """
+    Test the classifier of every search engine with the results of every
+    other search engine.
+
+    :param bows: List of bag of words representation objects.
+    :param classifiers: List of fitted classifiers, one for each search
+    engine.
+    :param Y: Binarized queries associated with the rows of matrices.
+
+    :return: List of evaluations, one for each permutation of search engines.
+    """
+    results = []
+    for (i, a), (j, b) in itertools.permutations(enumerate(bows), 2):
+        pred = clfs.scores(classifiers[j], a.matrix)
+        fpr, tpr, _ = roc_curve(Y.ravel(), pred.ravel())
+        results.append(Evaluation(
+            b.se + '->' + a.se, (fpr, tpr, auc(fpr, tpr)), 'clc'))
+    return results
+
+
+def held_out_results(bows, classifiers, Y):
+    """
+    Test the classifier of the remaining search engines of every search
+    engine with its results.
+
+    :param bows: List of bag of words representation objects.
+    :param classifiers: List of fitted classifiers, one for each search
+    engine.
+    :param Y: Binarized queries associated with the rows of matrices.
+
+    :return: List of evaluations, one for each search engine.
+    """
+    results = []
+    for a, rest, clf in zip(bows, held_out(bows), classifiers):
+        pred = clfs.scores(clf, a.matrix)
+        fpr, tpr, _ = roc_curve(Y.ravel(), pred.ravel())
+        results.append(Evaluation(
+            ','.join(bow.se for bow in rest) + '->' + a.se,
+            (fpr, tpr, auc(fpr, tpr)), 'hoc'))
+    return results
+
+
 class QueryClassificationModel(Model):
     """
     This model is based on a classification problem, having queries as labels.
@@ -34,14 +92,30 @@ class QueryClassificationModel(Model):
     search engine A can achieve high score predicting the results of search
     engine B.
 
+    Alternatively, the held out compare technique uses the results of all
+    search engines but one as train data and the results of the remnant
+    search engine as test data.
+
     Receiver object characteristic metric is used for the evaluation.
+    Classifiers are fitted by `jobs` worker processes.
+
+    A saved model evaluates the fitted classifiers with the results of new
+    days.
     """
-    def __init__(self, bows, queries, classifier='SVC', evaluation=None):
+    fitted = ('classifier', 'evaluation', '_labels', '_search_engines',
+              '_classifiers')
+
+    def __init__(self, bows, queries, classifier='SVC', evaluation=None,
+                 jobs=1):
         self.bows = bows
         self.classifier = classifier
         self.evaluation = evaluation
+        self.jobs = jobs
         self._queries = queries
         self.results = None
+        self._labels = None
+        self._search_engines = None
+        self._classifiers = None
 
     def construct(self):
         """
@@ -55,7 +129,8 @@ class QueryClassificationModel(Model):
         method.
         """
         evaluation_methods = {
-            'clc': self.cross_learn_compare
+            'clc': self.cross_learn_compare,
+            'hoc': self.held_out_compare
         }
         try:
             evaluation_methods[self.evaluation]()
@@ -72,7 +147,8 @@ class QueryClassificationModel(Model):
         the produced diagram.
         """
         plot_methods = {
-            'clc': self.plot_cross_learn_compare
+            'clc': self.plot_cross_learn_compare,
+            'hoc': self.plot_cross_learn_compare
         }
         try:
             plot_methods[self.evaluation](visual, query_category)
@@ -93,18 +169,65 @@ class QueryClassificationModel(Model):
 
         It uses the Receiver Object Characterstic metric to evaluate every
         instance.
+
+        The classifier of every search engine is fitted once and it is tested
+        with the results of every other search engine, i.e. `n` fits for `n`
+        search engines.
         """
-        # TODO In case of n search engines try to use the results of n-1 search
-        # engines as train data in order to predict the results of the remnant
-        # search engine.
-        self.results = []
-        for a, b in itertools.permutations(self.bows, 2):
-            Y = label_binarize(self._queries, classes=list(set(self._queries)))
-            pred = clfs.classify(b.matrix, Y, a.matrix,
-                                 classifier=self.classifier, oneVSrest=True)
-            fpr, tpr, _ = roc_curve(Y.ravel(), pred.ravel())
-            self.results.append(Evaluation(
-                b.se + '->' + a.se, (fpr, tpr, auc(fpr, tpr)), 'clc'))
+        self._labels = sorted(set(self._queries))
+        self._search_engines = [bow.se for bow in self.bows]
+        Y = label_binarize(self._queries, classes=self._labels)
+        self._classifiers = Parallel(n_jobs=self.jobs)(
+            delayed(clfs.fit)(bow.matrix, Y, self.classifier, oneVSrest=True)
+            for bow in self.bows)
+        self.results = cross_learn_results(self.bows, self._classifiers, Y)
+
+    def held_out_compare(self):
+        """
+        This method uses the held out compare technique which for every
+        search engine, it trains a classifier with the results of the
+        remaining search engines and tests it with the results of the held
+        out search engine.
+
+        It expected that if the held out search engine is similar to the
+        rest, then classifier can achieve high score on predicting its
+        results.
+
+        It uses the Receiver Object Characterstic metric to evaluate every
+        instance.
+        """
+        self._labels = sorted(set(self._queries))
+        self._search_engines = [bow.se for bow in self.bows]
+        Y = label_binarize(self._queries, classes=self._labels)
+        self._classifiers = Parallel(n_jobs=self.jobs)(
+            delayed(clfs.fit)(
+                stack_matrices([bow.matrix for bow in rest]),
+                np.tile(Y, (len(rest), 1)), self.classifier, oneVSrest=True)
+            for rest in held_out(self.bows))
+        self.results = held_out_results(self.bows, self._classifiers, Y)
+
+    def score(self, bows, queries, keys=None):
+        """
+        Evaluate the fitted classifiers with new results based on the
+        evaluation method of model.
+
+        Results of queries which are unknown to the classifiers belong to
+        none of their classes.
+        """
+        se_bows = {bow.se: bow for bow in bows}
+        if set(se_bows) != set(self._search_engines):
+            raise SEAnalysisException(
+                'Scoring requires the search engines of the model')
+        self.bows = [se_bows[se] for se in self._search_engines]
+        self._queries = queries
+        Y = label_binarize(queries, classes=self._labels)
+        evaluation_results = {
+            'clc': cross_learn_results,
+            'hoc': held_out_results
+        }
+        self.results = evaluation_results[self.evaluation](
+            self.bows, self._classifiers, Y)
+        return self.results
 
     def plot_cross_learn_compare(self, visual, query_category):
         """
@@ -14,11 +14,11 @@
 
 import numpy as np
 from scipy import interp
-from sklearn.model_selection import KFold
 from sklearn.preprocessing import label_binarize
 from sklearn.metrics import auc, confusion_matrix, roc_curve
-from seanalysis.models import Evaluation, Model
-from seanalysis.algorithms.classifiers import classify
+from seanalysis.models import Evaluation, Model, query_codes,\
+    stack_train_set
+from seanalysis.algorithms.classifiers import cross_validate, fit, scores
 from seanalysis.utils import SEAnalysisException
 
 BINARIZED_LABELS = {
@@ -58,16 +58,30 @@ class SEClassificationModel(Model):
     a result (bag-of-words represenation) of a specific query.
     If search engines are similar, classifier should not be able to achieve
     a high score of classification.
+
+    Folds of cross validation are fitted by `jobs` worker processes and
+    `seed` makes the evaluation deterministic.
+
+    A saved model evaluates a classifier fitted with the whole train set
+    with the results of new days.
     """
-    def __init__(self, bows, queries, classifier='SVC', metric='roc', folds=3):
+    fitted = ('classifier', 'metric', 'seed', 'estimator', '_classes',
+              '_query_index')
+
+    def __init__(self, bows, queries, classifier='SVC', metric='roc', folds=3,
+                 jobs=1, seed=None):
         self.bows = bows
         self.classifier = classifier
         self.metric = metric
         self.folds = folds
+        self.jobs = jobs
+        self.seed = seed
         self._queries = queries
         self._classes = [bow.se for bow in self.bows]
         self.X, self.Y = None, None
         self.results = None
+        self.estimator = None
+        self._query_index = None
 
     def construct(self):
         """
@@ -121,7 +135,58 @@ class SEClassificationModel(Model):
             visual.plot_heatmap(
                 self.results.metrics, self.results.labels, query_category)
 
-    def construct_train_set(self, binarize_labels):
+    def save(self, path, vocabulary=None):
+        """
+        Persist the fitted state of model.
+
+        Cross validation does not keep any fitted classifier, so a classifier
+        is fitted with the whole train set before model is persisted.
+
+        :param path: Path of the persisted model.
+        :param vocabulary: List of terms associated with the columns of the
+        bag of words representation which model was fitted with.
+        """
+        if self.estimator is None:
+            self.estimator = fit(self.X, self.Y, self.classifier,
+                                 oneVSrest=BINARIZED_LABELS[self.metric],
+                                 random_state=self.seed)
+        Model.save(self, path, vocabulary)
+
+    def score(self, bows, queries, keys=None):
+        """
+        Evaluate the fitted classifier with new results based on the metric
+        of model.
+
+        Queries which are unknown to the classifier are encoded with new
+        codes.
+        """
+        se_bows = {bow.se: bow for bow in bows}
+        if set(se_bows) != set(self._classes):
+            raise SEAnalysisException(
+                'Scoring requires the search engines of the model')
+        self.bows = [se_bows[se] for se in self._classes]
+        self._queries = queries
+        index = dict(self._query_index)
+        for query in queries:
+            if query not in index:
+                index[query] = max(index.values()) + 1
+        self.construct_train_set(BINARIZED_LABELS[self.metric], np.array(
+            [index[query] for query in queries], dtype=int))
+        if self.metric == 'roc':
+            fpr, tpr = roc_per_class(
+                self.Y, scores(self.estimator, self.X), self._classes)
+            self.results = [Evaluation(
+                se, (fpr[se], tpr[se], auc(fpr[se], tpr[se])), 'se')
+                for se in self._classes]
+        else:
+            N = len(self._classes)
+            cm = confusion_matrix(self.Y, self.estimator.predict(self.X),
+                                  labels=range(N)).astype('float')
+            self.results = Evaluation(
+                self._classes, cm / cm.sum(axis=1)[:, np.newaxis], 'se')
+        return self.results
+
+    def construct_train_set(self, binarize_labels, codes=None):
         """
         Construct classification model.
 
@@ -130,26 +195,22 @@ class SEClassificationModel(Model):
 
         :param binarize_labels: True if labels should be binarized; False
         otherwise.
+        :param codes: Array with the query code of every row of a matrix. By
+        default, queries are encoded by `query_codes`.
         """
-        train_set = []
-        Y = []
-        for bow in self.bows:
-            se_train = bow.matrix
-            query_column = np.array(
-                [self._queries.index(q) for q in self._queries]).reshape(
-                    se_train.shape[0], 1)
-            se_column = [self._classes.index(bow.se)] *\
-                se_train.shape[0]
-            train_set += [np.append(se_train, query_column, 1)]
-            Y += se_column
+        rows = self.bows[0].matrix.shape[0]
+        Y = np.repeat(np.arange(len(self.bows)), rows)
         if binarize_labels:
-            labels = label_binarize(np.array(Y), classes=range(
-                len(self._classes)))
+            labels = label_binarize(Y, classes=range(len(self._classes)))
             if len(self._classes) == 2:
                 labels = np.hstack((labels, 1 - labels))
         else:
-            labels = np.vstack(Y).ravel()
-        self.X, self.Y = np.vstack(train_set), labels
+            labels = Y
+        if codes is None:
+            codes = query_codes(self._queries)
+            self._query_index = dict(zip(self._queries, codes))
+        self.X = stack_train_set(self.bows, codes)
+        self.Y = labels
 
     def roc_curve_analysis(self):
         """
@@ -163,12 +224,9 @@ class SEClassificationModel(Model):
         mean_tpr = {se: 0.0 for se in self._classes}
         mean_fpr = {se: np.linspace(0, 1, 100) for se in self._classes}
         self.results = []
-        kf = KFold(n_splits=self.folds, shuffle=True,
-                   random_state=None)
-        for train_index, test_index in kf.split(self.X):
-            pred = classify(self.X[train_index], self.Y[train_index, :],
-                            self.X[test_index], classifier=self.classifier,
-                            oneVSrest=True)
+        for test_index, pred in cross_validate(
+                self.X, self.Y, self.classifier, folds=self.folds,
+                jobs=self.jobs, seed=self.seed, oneVSrest=True):
             fpr, tpr = roc_per_class(
                 self.Y[test_index, :], pred, self._classes)
             for se in self._classes:
@@ -187,13 +245,11 @@ class SEClassificationModel(Model):
         """
         N = len(self._classes)
         total_cm = np.zeros((N, N), dtype=float)
-        kf = KFold(n_splits=self.folds, shuffle=True,
-                   random_state=None)
-        for train_index, test_index in kf.split(self.X):
-            pred = classify(self.X[train_index], self.Y[train_index],
-                            self.X[test_index], classifier=self.classifier,
-                            oneVSrest=False, prob=False)
-            cm = confusion_matrix(self.Y[test_index], pred)
+        for test_index, pred in cross_validate(
+                self.X, self.Y, self.classifier, folds=self.folds,
+                jobs=self.jobs, seed=self.seed, prob=False):
+            cm = confusion_matrix(self.Y[test_index], pred,
+                                  labels=range(N))
             total_cm += cm
         norm_cm = total_cm.astype('float') / total_cm.sum(
             axis=1)[:, np.newaxis]
@@ -0,0 +1,179 @@
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import label_binarize
+from sklearn.metrics import confusion_matrix, roc_auc_score
+import seanalysis.algorithms.classifiers as clfs
+from seanalysis.algorithms.bag_of_words import HashingBagOfWords
+from seanalysis.models import Evaluation, Model
+from seanalysis.utils import SEAnalysisException
+
+TARGETS = ['se', 'query', 'index']
+
+METRICS = ['roc', 'cm']
+
+
+class StreamingClassificationModel(Model):
+    """
+    This model is an out-of-core variant of the classification models.
+
+    Instead of constructing the whole train set, the results of every day
+    are represented (with a fixed, hashed feature space) and streamed as a
+    mini-batch to a classifier which supports incremental learning
+    (`partial_fit`). The classes of the model are the search engines, the
+    queries or the indexes of results depending on the specified target.
+
+    Every day is a fold of the evaluation: the results of a day are first
+    used to test the classifier fitted by the results of all the previous
+    days, and then they are used to update the classifier. Thus, the AUC
+    (or the confusion matrix) of every day shows how the separability of
+    the classes evolves as the classifier warms up.
+    """
+    streaming = True
+
+    def __init__(self, batches, classifier='SGD', target='se', metric='roc',
+                 features=2 ** 18, seed=None):
+        self.batches = batches
+        self.classifier = classifier
+        self.target = target
+        self.metric = metric
+        self.features = features
+        self.seed = seed
+        self._classes = None
+        self.results = None
+
+    def construct(self):
+        """
+        Validates the configuration of model and specifies the classes of
+        the classification problem.
+
+        Classes are found without loading any result.
+        """
+        if self.target not in TARGETS:
+            raise SEAnalysisException(
+                'Unsupported target: %s' % repr(self.target))
+        if self.metric not in METRICS:
+            raise SEAnalysisException(
+                'Unsupported metric: %s' % repr(self.metric))
+        if not hasattr(clfs.get_classifier(self.classifier), 'partial_fit'):
+            raise SEAnalysisException(
+                'Classifier %s does not support streaming' % repr(
+                    self.classifier))
+        if self.target == 'se':
+            self._classes = list(self.batches.search_engines)
+        elif self.target == 'query':
+            self._classes = self.batches.queries()
+        else:
+            if self.batches.per_day:
+                raise SEAnalysisException(
+                    'Target "index" is not supported by --per-day option.')
+            self._classes = list(range(1, self.batches.N + 1))
+
+    def evaluate(self):
+        """
+        Stream the results of every day to the classifier.
+
+        The results of a day are evaluated with the classifier fitted by the
+        results of the previous days before they are used to update it.
+        """
+        clf = clfs.get_classifier(self.classifier, self.seed)
+        classes = np.arange(len(self._classes))
+        self.results = []
+        fitted = False
+        for date, snippets in self.batches:
+            X, y = self._batch(snippets)
+            if not X.shape[0]:
+                continue
+            if fitted:
+                self.results.append(Evaluation(
+                    date, self._day_metric(clf, X, y), self.metric))
+            clf.partial_fit(X, y, classes=classes)
+            fitted = True
+
+    def plot(self, visual, query_category):
+        """
+        Plot the metric of every day.
+
+        For ROC metric, the AUC of every day is plotted. For confusion
+        matrix, the true positive rate of every class of every day is
+        plotted.
+
+        :param visual: Visualization object used to plot the results.
+        :param query_category: Category of queries used as identifier of
+        the produced diagram.
+        """
+        dates = [result.labels for result in self.results]
+        metrics = np.array([result.metrics for result in self.results])
+        if self.metric == 'roc':
+            labels = self._classes if self.target == 'se' else ['micro']
+            ylabel = 'AUC'
+        else:
+            labels = self._classes
+            ylabel = 'True Positive Rate'
+            metrics = np.array([np.diag(cm) for cm in metrics])
+        visual.plot_day_metric(metrics.reshape(len(dates), -1), dates,
+                               labels, ylabel, query_category)
+
+    def _batch(self, snippets):
+        """
+        Represent the results of a day and find their classes.
+
+        :param snippets: Dictionary keyed by search engine containing the
+        snippets of results of a day.
+
+        :return: Sparse binary matrix with the bag of words representation of
+        results and array with their classes.
+        """
+        codes = {c: i for i, c in enumerate(self._classes)}
+        keys = [(se, key) for se, se_snippet in snippets.items()
+                for key in se_snippet]
+        if self.target == 'se':
+            y = [codes[se] for se, _ in keys]
+        elif self.target == 'query':
+            y = [codes[key[-1]] for _, key in keys]
+        else:
+            y = [codes[key[0]] for _, key in keys]
+        bows = HashingBagOfWords(snippets, self.features).build_bows()
+        return sparse.vstack([bow.matrix for bow in bows]).tocsr(),\
+            np.array(y, dtype=int)
+
+    def _day_metric(self, clf, X, y):
+        """
+        Evaluate the classifier with the results of a day.
+
+        :return: Array with the AUC of every class (search engine) or the
+        micro-average AUC of all classes for the ROC metric, or the
+        normalized confusion matrix for the confusion matrix metric.
+        Undefined values are `nan`.
+        """
+        N = len(self._classes)
+        if self.metric == 'cm':
+            cm = confusion_matrix(y, clf.predict(X), labels=range(N))
+            totals = cm.sum(axis=1)[:, np.newaxis].astype(float)
+            return np.divide(cm, totals, out=np.full(cm.shape, np.nan),
+                             where=totals > 0)
+        Y = label_binarize(y, classes=range(N))
+        scores = clfs.scores(clf, X)
+        if N == 2:
+            Y = np.hstack((1 - Y, Y))
+            if scores.ndim == 1:
+                scores = np.column_stack((-scores, scores))
+        if self.target != 'se':
+            Y, scores = Y.ravel()[np.newaxis].T, scores.ravel()[np.newaxis].T
+        return np.array([
+            roc_auc_score(Y[:, i], scores[:, i])
+            if 0 < Y[:, i].sum() < Y.shape[0] else np.nan
+            for i in range(Y.shape[1])])
@@ -13,27 +13,101 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import division
+from collections import namedtuple
 from itertools import chain
+from os.path import join, isfile
+import joblib
+from joblib import Parallel, delayed
 import numpy as np
-from sktensor import ktensor, dtensor
-from sktensor.core import khatrirao
-from seanalysis.models import Model
+from scipy import sparse
+from sktensor import ktensor, dtensor, sptensor
+from seanalysis.models import Model, completion_terms, map_terms
+from seanalysis.utils import SEAnalysisException
+
+TENSOR_FORMATS = ['dense', 'coo']
+
+STATE_FILE = '%s.cp'
+
+# Telemetry of an outer iteration of CP-APR, i.e. the maximum violation of
+# KKT conditions (over all modes) before the multiplicative updates of the
+# iteration and the number of inner iterations that were performed.
+Iteration = namedtuple('Iteration', ['kkt_violation', 'inner_iterations'])
+
+
+def query_day_codes(queries):
+    """
+    Encode the queries associated with the rows of bag of words matrices and
+    find the day (position along the date mode) of every row.
+
+    Rows are ordered by date, so the `i`-th row associated with a query
+    refers to the `i`-th day of this query.
+
+    :param queries: List of queries.
+
+    :return: 1) Array with the query code of every row.
+             2) Array with the day of every row.
+             3) Number of queries.
+             4) Number of days.
+    """
+    _, codes = np.unique(queries, return_inverse=True)
+    counts = np.bincount(codes)
+    order = np.argsort(codes, kind='stable')
+    days = np.empty(len(codes), dtype=int)
+    days[order] = np.arange(len(codes)) - np.repeat(
+        np.cumsum(counts) - counts, counts)
+    return codes, days, len(counts), counts.max()
 
 
 class TensorCompare(Model):
     """
     Tensor compare model uses tensors to represent results and then using
     CP APR algorithm tries to decomposes initial tensor to components.
+
+    If a state directory is given, the decomposition is persisted per query
+    category along with the date slices it covers. Then, the next analysis
+    of the query category is warm-started from the persisted factor
+    matrices: only the rows of the date mode which refer to new slices are
+    fitted, while the factor matrices of the other modes are kept fixed.
+    Every `refine` updates, the whole tensor is decomposed again starting
+    from the updated model, so that the other modes also follow the new
+    results.
+
+    A saved model fits only the date mode to the results of new days, with
+    the factor matrices of the other modes fixed, and reports the
+    log-likelihood of the new results.
     """
+    incremental = True
+
+    fitted = ('components', 'format', 'outer_iter', 'inner_iter',
+              'decomposition', '_search_engines', '_query_labels')
 
-    def __init__(self, bows, queries, components=20):
+    def __init__(self, bows, queries, components=20, format='dense',
+                 starts=1, jobs=1, seed=None, outer_iter=1000, inner_iter=10,
+                 state=None, refine=7, keys=None, terms=None, category=None):
         self.X = None
         self.bows = bows
         self.components = components
+        self.format = format
+        self.starts = starts
+        self.jobs = jobs
+        self.seed = seed
+        self.outer_iter = outer_iter
+        self.inner_iter = inner_iter
+        self.state = state
+        self.refine = refine
         self._queries = queries
         self._search_engines = [bow.se for bow in bows]
+        self._keys = keys
+        self._terms = terms
+        self._category = category
+        self._query_labels = None
+        self._slices = None
+        self._saved = None
         self.se_dist = None
         self.query_dist = None
+        self.log_likelihood = None
+        self.history = None
+        self.decomposition = None
 
     def construct(self):
         """
@@ -44,48 +118,59 @@ class TensorCompare(Model):
         matrices; one for each search engine. These matrices have the following
         shape: (number of query X date, number of terms).
 
-        The idea is to construct the required tensor from a tensor which has
-        3 modes (query, date, term).
-
-        :param snippets: Dictionary keyed by search engine that contains the
-        concatenation of snippets for every result for every query.
-        :param queries: Set of queries.
-
-        :return: Tensor with the four modes (search engine, query, date, term)
-        """
-        # Get a the first value of dictionary.
-        # Any other value could be used instead.
-        query_index = {query: i for i, query in enumerate(
-            set(self._queries))}
-
-        query_columns = np.zeros((self.bows[0].matrix.shape[0], 1), dtype=int)
-        arrays_3d = []
-        se_bows = [bow.matrix for bow in self.bows]
-        for i, bow in enumerate(se_bows):
-            # Add a new column to the the bag of words representation matrix.
-            # This new column refers to the query which this representation is
-            # associated with. This is going to be used to split array in a
-            # list of sub-arrays. Each sub array has the same query column and
-            # obviously has as many rows as the number of days.
-            bow = np.append(bow, query_columns, 1)
-            for j, row in enumerate(bow):
-                query = self._queries[j]
-                row[-1] = query_index[query]
-            bow = bow[bow[:, -1].argsort()]
-            splits = np.split(bow, np.where(
-                np.diff(np.array(bow[:, -1], dtype=int)))[0] + 1)
-            # Adds a new 3d array with the following shape (query, term, date).
-            # This list contains the 3d array for every search engine.
-            arrays_3d.append(np.concatenate(splits).reshape(
-                (len(splits),) + splits[0].shape))
-            se_bows[i] = bow
-        new_shape = (len(arrays_3d),) + arrays_3d[0].shape
-        self.X = dtensor(
-            np.concatenate(se_bows).reshape(new_shape)[:, :, :, :-1])
+        Every row of a matrix is placed to the tensor according to the search
+        engine, the query and the day associated with it. The tensor is
+        either dense (allocated once) or sparse (COO format), depending on
+        the format of model.
+
+        When the keys of rows are known, the day of a row is its date slice,
+        i.e. its key without the query. Slices of a persisted decomposition
+        keep their position and new slices are appended to the date mode.
+        The columns of matrices are also mapped to the terms of the persisted
+        decomposition; terms which are unknown to it are ignored.
+        """
+        if self.format not in TENSOR_FORMATS:
+            raise SEAnalysisException(
+                'Unsupported tensor format: %s' % repr(self.format))
+        if self._keys is None:
+            codes, days, n_queries, n_days = query_day_codes(self._queries)
+            self._query_labels = np.unique(self._queries)
+        else:
+            self._saved = self._load_state()
+            if self._saved is not None and \
+                    self._saved['terms'] != self._terms:
+                self.bows = [bow._replace(matrix=map_terms(
+                    bow.matrix, self._terms, self._saved['terms']))
+                    for bow in self.bows]
+                self._terms = self._saved['terms']
+            codes, days, n_queries, n_days = self._slice_codes()
+        self.X = self._tensor(self.bows, codes, days, n_queries, n_days)
 
     def evaluate(self):
-        """ This method fits created tensor using CP APR algorithm. """
-        M = cp_apr(self.X, self.components)
+        """
+        This method fits created tensor using CP APR algorithm.
+
+        The decomposition with the best log-likelihood among the random
+        starts is kept, along with the telemetry of its iterations. If there
+        is a persisted decomposition, it is updated with the new date slices
+        instead.
+        """
+        if self._saved is None:
+            M, self.log_likelihood, self.history = cp_apr_multistart(
+                self.X, self.components, self.starts, self.jobs, self.seed,
+                outer_iter=self.outer_iter, inner_iter=self.inner_iter)
+            updates = 0
+        else:
+            M, updates = self._update(self._saved)
+            self.log_likelihood = log_likelihood(self.X, M)
+        self.decomposition = M
+        if self.state is not None:
+            joblib.dump({
+                'U': M.U, 'lmbda': M.lmbda, 'updates': updates,
+                'search_engines': self._search_engines,
+                'queries': list(self._query_labels), 'terms': self._terms,
+                'slices': self._slices
+            }, self._state_path())
         self.se_dist = M.U[0]
         self.query_dist = M.U[2]
 
@@ -105,14 +190,284 @@ class TensorCompare(Model):
         visual.draw_se_clusters(self.se_dist, query_category,
                                 self._search_engines)
 
+    def score(self, bows, queries, keys=None):
+        """
+        Fit the date mode of the decomposition to new results, keeping the
+        factor matrices of the other modes fixed.
+
+        Results of queries which are unknown to the decomposition are
+        ignored. The days of results are their date slices if keys are
+        given.
+
+        :return: Log-likelihood of the new results.
+        """
+        self.bows, self._queries, self.X = self._known_tensor(
+            bows, queries, keys)
+        self.history = []
+        M = self._fit_dates(self.X, self.decomposition, self.history)
+        self.log_likelihood = log_likelihood(self.X, M)
+        self.se_dist = M.U[0]
+        self.query_dist = M.U[2]
+        return self.log_likelihood
+
+    def held_out_log_likelihood(self, bows, queries, keys=None):
+        """
+        Compute the log-likelihood of held-out results by document
+        completion (see `completion_terms`), without changing the model.
+
+        The date mode is fitted to the fitted terms of results (as `score`
+        does), and the log-likelihood of the scored terms is computed. The
+        factor matrix of the term mode is split accordingly, i.e. its
+        restrictions to the fitted and to the scored terms are normalized
+        and their sums are moved to the weights.
+
+        :return: Log-likelihood of the scored terms of results.
+        """
+        _, _, X = self._known_tensor(bows, queries, keys)
+        fitted = completion_terms(X.shape[3])
+        M = self.decomposition
+        fitted_sum = np.maximum(M.U[3][fitted].sum(axis=0), 1e-10)
+        scored_sum = np.maximum(M.U[3][~fitted].sum(axis=0), 1e-10)
+        partial = self._fit_dates(_term_slices(X, fitted), ktensor(
+            [M.U[0], M.U[1], M.U[2], M.U[3][fitted] / fitted_sum],
+            M.lmbda * fitted_sum))
+        return log_likelihood(_term_slices(X, ~fitted), ktensor(
+            [partial.U[0], partial.U[1], partial.U[2],
+             M.U[3][~fitted] / scored_sum],
+            partial.lmbda / fitted_sum * scored_sum))
+
+    def _known_tensor(self, bows, queries, keys):
+        """
+        Place the results of the queries known to the decomposition to a
+        tensor, whose days are the date slices of results if keys are given.
+
+        :return: Bag of words matrices and queries of the known results and
+        their tensor.
+        """
+        if [bow.se for bow in bows] != list(self._search_engines):
+            raise SEAnalysisException(
+                'Scoring requires the search engines of the decomposition')
+        position = {query: i for i, query in enumerate(self._query_labels)}
+        known = np.flatnonzero([query in position for query in queries])
+        codes = np.array([position[queries[i]] for i in known], dtype=int)
+        if keys is None:
+            _, days, _, n_days = query_day_codes(
+                [queries[i] for i in known])
+        else:
+            slices = [tuple(keys[i][:-1]) for i in known]
+            order = {s: day for day, s in enumerate(sorted(set(slices)))}
+            days = np.array([order[s] for s in slices], dtype=int)
+            n_days = len(order)
+        bows = [bow._replace(matrix=bow.matrix[known]) for bow in bows]
+        return bows, [queries[i] for i in known], self._tensor(
+            bows, codes, days, len(self._query_labels), n_days)
+
+    def _tensor(self, bows, codes, days, n_queries, n_days):
+        """
+        Place every row of the bag of words matrices to a tensor according to
+        the search engine, the query and the day associated with it.
+
+        :return: Dense or sparse tensor, depending on the format of model.
+        """
+        shape = (len(bows), n_queries, n_days, bows[0].matrix.shape[1])
+        if self.format == 'coo':
+            subs = [[], [], [], []]
+            vals = []
+            for i, bow in enumerate(bows):
+                matrix = sparse.coo_matrix(bow.matrix)
+                subs[0].append(np.full(matrix.nnz, i, dtype=int))
+                subs[1].append(codes[matrix.row])
+                subs[2].append(days[matrix.row])
+                subs[3].append(matrix.col)
+                vals.append(matrix.data)
+            return sptensor(tuple(np.concatenate(sub) for sub in subs),
+                            np.concatenate(vals).astype(float), shape=shape)
+        X = np.zeros(shape)
+        for i, bow in enumerate(bows):
+            X[i, codes, days] = bow.matrix.toarray()\
+                if sparse.issparse(bow.matrix) else bow.matrix
+        return dtensor(X)
+
+    def _fit_dates(self, X, M, history=None):
+        """
+        Fit the date mode of a decomposition to the given tensor, keeping the
+        factor matrices of the other modes fixed.
+
+        :param history: List where the telemetry of iterations is appended
+        (optional).
+
+        :return: Decomposition with the fitted factor matrix of the date
+        mode.
+        """
+        decompose = cp_apr_sparse if self.format == 'coo' else cp_apr
+        r = self.components
+        partial = ktensor([M.U[0], M.U[1], np.full(
+            (X.shape[2], r), 1. / X.shape[2]), M.U[3]], M.lmbda.copy())
+        decompose(X, r, M=partial, outer_iter=self.outer_iter,
+                  inner_iter=self.inner_iter, history=history, modes=[2])
+        return partial
+
+    def _state_path(self):
+        if self._category is None:
+            raise SEAnalysisException(
+                'Tensor state requires the keys of results and the category')
+        return join(self.state, STATE_FILE % self._category)
+
+    def _load_state(self):
+        """
+        Load the persisted decomposition of the query category.
+
+        :return: Dictionary with the factor matrices, the weights and the
+        date slices of the decomposition or `None` if there is not any
+        compatible state, i.e. a decomposition of the same search engines,
+        queries and number of components, whose slices are all still
+        present. The terms of the decomposition may differ, as long as both
+        are known.
+        """
+        if self.state is None or not isfile(self._state_path()):
+            return None
+        state = joblib.load(self._state_path())
+        slices = {tuple(key[:-1]) for key in self._keys}
+        if state['lmbda'].shape[0] != self.components\
+                or state['search_engines'] != self._search_engines\
+                or state['queries'] != sorted(set(self._queries))\
+                or (state['terms'] is None) != (self._terms is None)\
+                or not slices.issuperset(state['slices']):
+            return None
+        return state
+
+    def _slice_codes(self):
+        """
+        Encode the queries and the date slices associated with the rows of
+        bag of words matrices.
+
+        :return: 1) Array with the query code of every row.
+                 2) Array with the date slice of every row.
+                 3) Number of queries.
+                 4) Number of date slices.
+        """
+        self._query_labels, codes = np.unique(
+            self._queries, return_inverse=True)
+        slices = [tuple(key[:-1]) for key in self._keys]
+        self._slices = [] if self._saved is None\
+            else list(self._saved['slices'])
+        position = {s: i for i, s in enumerate(self._slices)}
+        for s in sorted(set(slices).difference(position)):
+            position[s] = len(self._slices)
+            self._slices.append(s)
+        days = np.array([position[s] for s in slices], dtype=int)
+        return codes, days, len(self._query_labels), len(self._slices)
+
+    def _update(self, state):
+        """
+        Update the persisted decomposition with the new date slices.
+
+        The rows of the date mode which refer to the new slices are fitted
+        with CP-APR on the new slices only, keeping the factor matrices of
+        the other modes fixed. Since the subproblem of a mode is separable
+        by row, the fitted rows are then stacked to the (weighted) persisted
+        ones.
+
+        :return: Updated decomposition and number of updates since the last
+        full decomposition.
+        """
+        decompose = cp_apr_sparse if self.format == 'coo' else cp_apr
+        start = len(state['slices'])
+        M = ktensor([np.array(U) for U in state['U']], state['lmbda'].copy())
+        self.history = []
+        if start == len(self._slices):
+            return M, state['updates']
+        partial = self._fit_dates(self._date_slices(start), M, self.history)
+        b = np.vstack((M.U[2] * M.lmbda, partial.U[2] * partial.lmbda))
+        M.lmbda = np.maximum(b.sum(axis=0), 1e-10)
+        M.U[2] = b / M.lmbda
+        updates = state['updates'] + 1
+        if self.refine and updates >= self.refine:
+            M = decompose(self.X, self.components, M=M,
+                          outer_iter=self.outer_iter,
+                          inner_iter=self.inner_iter, history=self.history)
+            updates = 0
+        return M, updates
+
+    def _date_slices(self, start):
+        """
+        Get the sub-tensor of the date slices from the given position onwards.
+        """
+        if self.format == 'dense':
+            return dtensor(np.asarray(self.X)[:, :, start:])
+        subs = [np.asarray(sub) for sub in self.X.subs]
+        new = subs[2] >= start
+        shape = self.X.shape[:2] + (self.X.shape[2] - start,) +\
+            self.X.shape[3:]
+        return sptensor(
+            (subs[0][new], subs[1][new], subs[2][new] - start, subs[3][new]),
+            np.asarray(self.X.vals)[new], shape=shape)
+
+
+def _term_slices(X, terms):
+    """
+    Get the sub-tensor of the given terms, i.e. of the slices of the last
+    mode selected by a boolean mask.
+    """
+    if isinstance(X, sptensor):
+        subs = [np.asarray(sub) for sub in X.subs]
+        selected = terms[subs[3]]
+        position = np.cumsum(terms) - 1
+        return sptensor(
+            (subs[0][selected], subs[1][selected], subs[2][selected],
+             position[subs[3][selected]]), np.asarray(X.vals)[selected],
+            shape=X.shape[:3] + (int(terms.sum()),))
+    return dtensor(np.asarray(X)[..., terms])
+
+
+def khatrirao(matrices):
+    """
+    Compute the columnwise Khatri-Rao product of matrices, where the rows
+    of the first matrix vary slowest (as in the Kronecker product).
+
+    Rows are expanded with broadcasting instead of a Kronecker product for
+    every column.
+
+    :param matrices: List of matrices with the same number of columns.
+
+    :return: Khatri-Rao product.
+    """
+    P = matrices[0]
+    for U in matrices[1:]:
+        P = (P[:, np.newaxis, :] * U[np.newaxis, :, :]).reshape(
+            -1, P.shape[1])
+    return P
+
+
+def random_model(shape, r, random_state=None):
+    """
+    Create a random R-Component model with column stochastic factor
+    matrices, as CP-APR assumes.
+
+    :param shape: Shape of tensor.
+    :param r: Number of R components.
+    :param random_state: `RandomState` object; the global one by default.
+
+    :return: Initial model.
+    """
+    rng = np.random if random_state is None else random_state
+    U = [rng.rand(size, r) for size in shape]
+    return ktensor([u / u.sum(axis=0) for u in U])
+
 
 def cp_apr(X, r, M=None, outer_iter=1000, inner_iter=10, t=1e-4, k=0.01,
-           k_tol=1e-10, e=1e-10):
+           k_tol=1e-10, e=1e-10, history=None, modes=None):
     """
     Implementation of CP-APR algorithm.
 
     http://arxiv.org/pdf/1112.2414.pdf
 
+    The unfoldings of tensor do not depend on the model, so they are computed
+    once and kept in the data type of tensor. The model values and the
+    multiplicative updates of every inner iteration are computed in a single
+    preallocated buffer, shared by all modes (every unfolding has the size of
+    tensor).
+
     :param X: tensor to decompose.
     :param r: Number of R components.
     :param M: Initial guess of R-Component model.
@@ -122,37 +477,201 @@ def cp_apr(X, r, M=None, outer_iter=1000, inner_iter=10, t=1e-4, k=0.01,
     :param k: Inadmissible zero avoidance adjustment.
     :param k_tol: Tolerance of identifying a potentional inadmissible zero.
     :param e: Minimum divisor to prevent divide-by-zero.
+    :param history: List where an `Iteration` object is appended for every
+    outer iteration (optional).
+    :param modes: Modes whose factor matrices are updated; all modes by
+    default. The factor matrices of the other modes are kept fixed.
+
+    :returns: Decomposition of tensor to `N` components.
+    """
+    N = len(X.shape)
+    if M is None:
+        M = random_model(X.shape, r)
+    if modes is None:
+        modes = range(N)
+    phi = np.empty([N, ], dtype=object)
+    unfoldings = {n: np.asarray(X.unfold(n)) for n in modes}
+    scratch = np.empty(int(np.prod(X.shape)))
+
+    for i in range(outer_iter):
+        is_converged = True
+        violation, inner = 0., 0
+        for n in modes:
+            b = M.U[n].copy()
+            if i > 0:
+                b[(phi[n] > 1) & (b < k_tol)] += k
+            b *= M.lmbda
+            pi = khatrirao([M.U[m] for m in range(N - 1, -1, -1) if m != n])
+            values = scratch.reshape(unfoldings[n].shape)
+            for j in range(inner_iter):
+                np.dot(b, pi.T, out=values)
+                np.maximum(values, e, out=values)
+                np.divide(unfoldings[n], values, out=values)
+                phi[n] = np.dot(values, pi)
+                kkt = np.amax(np.abs(np.minimum(b, 1 - phi[n])))
+                if j == 0:
+                    violation = max(violation, kkt)
+                if kkt < t:
+                    break
+
+                is_converged = False
+                inner += 1
+                b *= phi[n]
+            # A collapsed component (zero column) keeps a tiny weight
+            # instead of producing NaN factors.
+            M.lmbda = np.maximum(b.sum(axis=0), e)
+            b /= M.lmbda
+            M.U[n] = b
+
+        if history is not None:
+            history.append(Iteration(violation, inner))
+        if is_converged:
+            break
+    return M
+
+
+def cp_apr_sparse(X, r, M=None, outer_iter=1000, inner_iter=10, t=1e-4,
+                  k=0.01, k_tol=1e-10, e=1e-10, history=None, modes=None):
+    """
+    Implementation of CP-APR algorithm for sparse tensors.
+
+    http://arxiv.org/pdf/1112.2414.pdf (Section 5)
+
+    The model is evaluated only at the coordinates of the non-zero entries
+    of tensor, i.e. the rows of the Khatri-Rao product which are required by
+    the multiplicative updates are computed only for the non-zero entries.
+    Thus, memory and time scale with the number of non-zero entries instead
+    of the size of tensor.
+
+    :param X: Sparse tensor (`sptensor`) to decompose.
+    :param r: Number of R components.
+    :param M: Initial guess of R-Component model.
+    :param outer_iter: Number of maximum outer iterations.
+    :param inner_iter: Number of maximum inner iterations.
+    :param t: Convergence tolerance of KKT conditions.
+    :param k: Inadmissible zero avoidance adjustment.
+    :param k_tol: Tolerance of identifying a potentional inadmissible zero.
+    :param e: Minimum divisor to prevent divide-by-zero.
+    :param history: List where an `Iteration` object is appended for every
+    outer iteration (optional).
+    :param modes: Modes whose factor matrices are updated; all modes by
+    default. The factor matrices of the other modes are kept fixed.
 
     :returns: Decomposition of tensor to `N` components.
     """
     N = len(X.shape)
     if M is None:
-        M = ktensor([np.random.rand(X.shape[i], r) for i in range(N)])
+        M = random_model(X.shape, r)
+    subs = [np.asarray(sub) for sub in X.subs]
+    vals = np.asarray(X.vals, dtype=float)
+    nnz = len(vals)
+    if modes is None:
+        modes = range(N)
     phi = np.empty([N, ], dtype=object)
 
     for i in range(outer_iter):
         is_converged = True
-        for n in range(N):
+        violation, inner = 0., 0
+        for n in modes:
             S = np.zeros((X.shape[n], r))
             if i > 0:
                 S[(phi[n] > 1) & (M.U[n] < k_tol)] = k
-            b = np.dot((M.U[n] + S), np.diag(M.lmbda))
-            pi = khatrirao(tuple(
-                [M.U[i] for i in chain(range(n), range(n + 1, N))]),
-                reverse=True).transpose()
-            pi_transpose = pi.transpose()
-            X_unfold = X.unfold(n)
+            b = (M.U[n] + S) * M.lmbda
+            # Rows of the Khatri-Rao product of the factor matrices of the
+            # other modes, for the non-zero entries only.
+            pi = np.ones((nnz, r))
+            for m in chain(range(n), range(n + 1, N)):
+                pi *= M.U[m][subs[m]]
             for j in range(inner_iter):
-                phi[n] = np.dot(X_unfold / np.maximum(np.dot(b, pi), e),
-                                pi_transpose)
-                if np.amax(np.abs(np.ravel(np.minimum(b, 1 - phi[n])))) < t:
+                v = vals / np.maximum(np.einsum('ij,ij->i', b[subs[n]], pi), e)
+                phi[n] = sparse.csr_matrix(
+                    (v, (subs[n], np.arange(nnz))),
+                    shape=(X.shape[n], nnz)).dot(pi)
+                kkt = np.amax(np.abs(np.minimum(b, 1 - phi[n])))
+                if j == 0:
+                    violation = max(violation, kkt)
+                if kkt < t:
                     break
 
                 is_converged = False
+                inner += 1
                 b *= phi[n]
-            M.lmbda = np.dot(np.ones(b.shape[0]).transpose(), b)
-            M.U[n] = np.dot(b, np.linalg.inv(np.diag(M.lmbda)))
+            M.lmbda = np.maximum(b.sum(axis=0), e)
+            M.U[n] = b / M.lmbda
 
+        if history is not None:
+            history.append(Iteration(violation, inner))
         if is_converged:
             break
     return M
+
+
+def log_likelihood(X, M, e=1e-10):
+    """
+    Compute the log-likelihood of tensor given a model, under the Poisson
+    assumption of CP-APR (the constant terms are omitted).
+
+    The sum of model values is computed from the sums of the columns of
+    factor matrices, i.e. the sum of weights for column stochastic ones.
+
+    :param X: Dense (`dtensor`) or sparse (`sptensor`) tensor.
+    :param M: Decomposition of tensor.
+    :param e: Minimum model value to prevent the log of zero.
+
+    :return: Log-likelihood.
+    """
+    N = len(X.shape)
+    if isinstance(X, sptensor):
+        vals = np.asarray(X.vals, dtype=float)
+        values = np.tile(M.lmbda, (len(vals), 1))
+        for n, sub in enumerate(X.subs):
+            values *= M.U[n][np.asarray(sub)]
+        values = values.sum(axis=1)
+    else:
+        vals = np.asarray(X.unfold(0), dtype=float)
+        values = np.dot(M.U[0] * M.lmbda, khatrirao(M.U[:0:-1]).T)
+    total = np.dot(M.lmbda, np.prod([U.sum(axis=0) for U in M.U], axis=0))
+    return np.sum(vals * np.log(np.maximum(values, e))) - total
+
+
+def _cp_apr_start(X, r, seed, options):
+    """
+    Decompose a tensor starting from a random model.
+
+    :return: Decomposition, log-likelihood and telemetry of iterations.
+    """
+    M = random_model(X.shape, r, np.random.RandomState(seed))
+    history = []
+    decompose = cp_apr_sparse if isinstance(X, sptensor) else cp_apr
+    M = decompose(X, r, M=M, history=history, **options)
+    return M, log_likelihood(X, M), history
+
+
+def cp_apr_multistart(X, r, starts=1, jobs=1, seed=None, **options):
+    """
+    Decompose a tensor with CP-APR starting from several random models.
+
+    CP-APR converges to a local maximum of the likelihood which depends on
+    the initial model. Thus, the starts are run in parallel processes and
+    the decomposition with the best log-likelihood is kept.
+
+    :param X: Dense (`dtensor`) or sparse (`sptensor`) tensor.
+    :param r: Number of R components.
+    :param starts: Number of random initial models.
+    :param jobs: Number of parallel processes.
+    :param seed: Seed of initial models, so that the decomposition is
+    reproducible.
+    :param options: Keyword arguments of `cp_apr` (`cp_apr_sparse`).
+
+    :return: 1) Decomposition with the best log-likelihood.
+             2) Its log-likelihood.
+             3) List of `Iteration` objects of its outer iterations.
+    """
+    if starts < 1:
+        raise SEAnalysisException(
+            'Number of starts must be positive: %s' % repr(starts))
+    seeds = np.random.RandomState(seed).randint(
+        np.iinfo(np.int32).max, size=starts)
+    results = Parallel(n_jobs=jobs)(
+        delayed(_cp_apr_start)(X, r, s, options) for s in seeds)
+    return max(results, key=lambda result: result[1])
@@ -0,0 +1,61 @@
+import shutil
+import tempfile
+import unittest
+import joblib
+import numpy as np
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput
+from seanalysis.models.lda import LDA
+
+
+class TestLDA(unittest.TestCase):
+    def setUp(self):
+        self.state = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.state)
+        self.bows = [
+            BagOfWordsOutput(np.array([[2, 1, 0, 0], [0, 0, 1, 2],
+                                       [1, 2, 0, 0], [0, 0, 2, 1]]), 'a'),
+            BagOfWordsOutput(np.array([[0, 0, 2, 1], [1, 2, 0, 0],
+                                       [0, 0, 1, 2], [2, 1, 0, 0]]), 'b')
+        ]
+        self.queries = ['x', 'y', 'x', 'y']
+        self.keys = [('d1', 'x'), ('d1', 'y'), ('d2', 'x'), ('d2', 'y')]
+
+    def fit(self, rows, search_engines=('a', 'b'), keys=None):
+        keys = self.keys if keys is None else keys
+        model = LDA([bow._replace(matrix=bow.matrix[:rows])
+                     for bow in self.bows if bow.se in search_engines],
+                    self.queries[:rows], components=2, state=self.state,
+                    keys=keys[:rows], terms=['s', 't', 'u', 'v'],
+                    category='c')
+        model.construct()
+        model.evaluate()
+        return model
+
+    def test_online_update(self):
+        self.fit(2)
+        model = self.fit(4)
+        self.assertEqual(model.X.shape, (8, 2))
+        np.testing.assert_array_equal(model.topics,
+                                      np.argmax(model.X, axis=1))
+        saved = joblib.load(self.state + '/c.lda')
+        self.assertEqual(len(saved['topics']), 8)
+
+    def test_incompatible_state(self):
+        self.fit(2)
+        # States of other search engines or of results (instead of days)
+        # are fitted again.
+        self.fit(4, search_engines=('a',))
+        saved = joblib.load(self.state + '/c.lda')
+        self.assertEqual(saved['search_engines'], ['a'])
+        self.assertEqual(len(saved['topics']), 4)
+        self.fit(4, search_engines=('a',),
+                 keys=[(0,) + key for key in self.keys])
+        saved = joblib.load(self.state + '/c.lda')
+        self.assertTrue(saved['per_result'])
+        self.assertEqual(len(saved['topics']), 4)
+
+    def test_stateless(self):
+        model = LDA(self.bows, self.queries, components=2)
+        model.construct()
+        model.evaluate()
+        self.assertEqual(model.X.shape, (8, 2))
@@ -0,0 +1,80 @@
+from os.path import join
+import shutil
+import tempfile
+import unittest
+import mock
+import numpy as np
+import seanalysis.models.nmf as nmf
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput
+from seanalysis.feature_store import Features
+from seanalysis.models import align_features
+from seanalysis.utils import SEAnalysisException
+
+
+class TestNMFCompare(unittest.TestCase):
+    def setUp(self):
+        self.bows = [
+            mock.MagicMock(se='a', matrix=np.array(
+                [[1, 1, 0, 0], [1, 1, 0, 0], [1, 0, 0, 0]], dtype=np.uint8)),
+            mock.MagicMock(se='b', matrix=np.array(
+                [[0, 0, 1, 1], [0, 0, 1, 1], [0, 0, 0, 1]], dtype=np.uint8))
+        ]
+        self.queries = ['x', 'y', 'x']
+
+    def test_evaluate(self):
+        model = nmf.NMFCompare(self.bows, self.queries, components=2, seed=0)
+        model.construct()
+        model.evaluate()
+        self.assertEqual(model.se_dist.shape, (2, 2))
+        # Every topic contains the results of a single search engine.
+        np.testing.assert_array_equal(np.sort(model.se_dist, axis=1),
+                                      [[0, 1], [0, 1]])
+        self.assertEqual(len(model.query_dist), 2)
+        for dist in model.query_dist:
+            self.assertEqual([q for q, _ in dist], ['x', 'y'])
+            self.assertAlmostEqual(sum(d for _, d in dist), 1)
+
+    def test_construct(self):
+        model = nmf.NMFCompare(self.bows, self.queries, loss='foo')
+        self.assertRaises(SEAnalysisException, model.construct)
+
+    def test_save_score(self):
+        bows = [BagOfWordsOutput(bow.matrix, bow.se) for bow in self.bows]
+        model = nmf.NMFCompare(bows, self.queries, components=2, seed=0)
+        model.construct()
+        model.evaluate()
+        directory = tempfile.mkdtemp()
+        try:
+            model.save(join(directory, 'model'), ['s', 't', 'u', 'v'])
+            saved = nmf.NMFCompare.load(join(directory, 'model'))
+        finally:
+            shutil.rmtree(directory)
+        # New results use the terms in another order and an unknown term.
+        features = align_features(Features(
+            [BagOfWordsOutput(np.hstack((bow.matrix[:, ::-1], np.ones(
+                (3, 1), dtype=np.uint8))), bow.se) for bow in bows],
+            self.queries, None, None, ['v', 'u', 't', 's', 'w']),
+            saved.vocabulary)
+        for bow, aligned in zip(bows, features.bows):
+            np.testing.assert_array_equal(aligned.matrix, bow.matrix)
+        np.testing.assert_array_equal(
+            saved.score(features.bows, features.queries), model.se_dist)
+        self.assertEqual(saved.query_dist, model.query_dist)
+
+    def test_held_out_error(self):
+        bows = [BagOfWordsOutput(bow.matrix, bow.se) for bow in self.bows]
+        errors = {}
+        for loss in ('frobenius', 'kullback-leibler'):
+            model = nmf.NMFCompare(bows, self.queries, components=2, seed=0,
+                                   loss=loss)
+            model.construct()
+            model.evaluate()
+            errors[loss] = model.held_out_error(bows)
+            self.assertGreaterEqual(errors[loss], 0)
+        # Results unlike the fitted ones are scored worse.
+        model = nmf.NMFCompare(bows, self.queries, components=2, seed=0)
+        model.construct()
+        model.evaluate()
+        unlike = [bow._replace(matrix=1 - bow.matrix) for bow in bows]
+        self.assertGreater(model.held_out_error(unlike),
+                           errors['frobenius'])
@@ -1,6 +1,7 @@
 import unittest
 import mock
 import numpy as np
+from scipy import sparse
 import seanalysis.models.query_clf as q
 from seanalysis.utils import SEAnalysisException
 
@@ -44,6 +45,7 @@ class TestQueryClassificationModel(unittest.TestCase):
         self.mockModel.bows = [bow1, bow2]
         self.mockModel._queries = ['a', 'b', 'c']
         self.mockModel.classifier = 'SVC'
+        self.mockModel.jobs = 1
         self.mockModel.cross_learn_compare(self.mockModel)
         self.assertEqual(len(self.mockModel.results), 2)
         evaluation = self.mockModel.results[0]
@@ -57,3 +59,20 @@ class TestQueryClassificationModel(unittest.TestCase):
         _, _, auc = evaluation.metrics
         self.assertEqual(auc, 0.5)
         self.assertEqual(evaluation.type, 'clc')
+
+    def test_held_out_compare(self):
+        # Sparse bag of words matrices are consumed as dense ones.
+        for matrix in (np.eye(3, dtype=np.uint8),
+                       sparse.identity(3, dtype=np.uint8, format='csr')):
+            bows = [mock.MagicMock(se=se, matrix=matrix)
+                    for se in ['a', 'b', 'c']]
+            model = q.QueryClassificationModel(bows, ['a', 'b', 'c'],
+                                               classifier='LOGREG',
+                                               evaluation='hoc')
+            model.evaluate()
+            self.assertEqual([result.labels for result in model.results],
+                             ['b,c->a', 'a,c->b', 'a,b->c'])
+            for result in model.results:
+                _, _, auc = result.metrics
+                self.assertEqual(auc, 1.0)
+                self.assertEqual(result.type, 'hoc')
@@ -1,6 +1,9 @@
 import unittest
 import mock
+import numpy as np
+from scipy import sparse
 import seanalysis.models.se_clf as se
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput
 from seanalysis.utils import SEAnalysisException
 
 
@@ -45,3 +48,23 @@ class TestSEClassificationModel(unittest.TestCase):
         self.mockModel.plot(self.mockModel, mock_visual, '')
         self.assertEqual(mock_visual.plot_roc.call_count, 1)
         self.assertEqual(mock_visual.plot_confusion_matrix.call_count, 1)
+
+    def test_construct_train_set(self):
+        bow1 = BagOfWordsOutput(np.array([[1, 0], [0, 1]]), 'a')
+        bow2 = BagOfWordsOutput(np.array([[0, 0], [1, 1]]), 'b')
+        model = se.SEClassificationModel([bow1, bow2], ['x', 'x'],
+                                         metric='cm')
+        model.construct_train_set(False)
+        np.testing.assert_array_equal(
+            model.X, [[1, 0, 0], [0, 1, 0], [0, 0, 0], [1, 1, 0]])
+        np.testing.assert_array_equal(model.Y, [0, 0, 1, 1])
+        model.construct_train_set(True)
+        np.testing.assert_array_equal(
+            model.Y, [[0, 1], [0, 1], [1, 0], [1, 0]])
+        dense = model.X
+
+        model.bows = [bow._replace(matrix=sparse.csr_matrix(bow.matrix))
+                      for bow in model.bows]
+        model.construct_train_set(False)
+        self.assertTrue(sparse.isspmatrix_csr(model.X))
+        np.testing.assert_array_equal(model.X.toarray(), dense)
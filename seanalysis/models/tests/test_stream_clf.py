@@ -0,0 +1,55 @@
+import unittest
+from collections import OrderedDict
+import mock
+import numpy as np
+import seanalysis.models.stream_clf as st
+from seanalysis.utils import SEAnalysisException
+
+
+def day_batch(date):
+    return date, {
+        'a': OrderedDict([((date, 'x'), 'foo bar'), ((date, 'y'), 'foo')]),
+        'b': OrderedDict([((date, 'x'), 'baz qux'), ((date, 'y'), 'qux')])
+    }
+
+
+@mock.patch('seanalysis.algorithms.bag_of_words.word_tokenize',
+            side_effect=str.split)
+class TestStreamingClassificationModel(unittest.TestCase):
+    def setUp(self):
+        self.batches = mock.MagicMock(search_engines=['a', 'b'],
+                                      per_day=True)
+        self.batches.__iter__.side_effect = lambda: iter(
+            [day_batch('d1'), day_batch('d2'), day_batch('d3')])
+        self.batches.queries.return_value = ['x', 'y']
+
+    def test_construct(self, _):
+        model = st.StreamingClassificationModel(self.batches)
+        model.construct()
+        self.assertEqual(model._classes, ['a', 'b'])
+        model.target = 'query'
+        model.construct()
+        self.assertEqual(model._classes, ['x', 'y'])
+        model.target = 'index'
+        self.assertRaises(SEAnalysisException, model.construct)
+        model = st.StreamingClassificationModel(self.batches,
+                                                classifier='SVC')
+        self.assertRaises(SEAnalysisException, model.construct)
+
+    def test_evaluate(self, _):
+        model = st.StreamingClassificationModel(self.batches, seed=0)
+        model.construct()
+        model.evaluate()
+        self.assertEqual([result.labels for result in model.results],
+                         ['d2', 'd3'])
+        for result in model.results:
+            np.testing.assert_array_equal(result.metrics, [1.0, 1.0])
+
+        model = st.StreamingClassificationModel(self.batches, metric='cm',
+                                                seed=0)
+        model.construct()
+        model.evaluate()
+        np.testing.assert_array_equal(model.results[-1].metrics, np.eye(2))
+        mock_visual = mock.MagicMock()
+        model.plot(mock_visual, '')
+        self.assertEqual(mock_visual.plot_day_metric.call_count, 1)
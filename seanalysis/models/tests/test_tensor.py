@@ -0,0 +1,209 @@
+from os.path import join
+import shutil
+import tempfile
+import unittest
+import joblib
+import mock
+import numpy as np
+from scipy import sparse
+from sktensor import dtensor, ktensor, sptensor
+import seanalysis.models.tensor as tn
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput
+from seanalysis.models.lda import LDA
+from seanalysis.utils import SEAnalysisException
+
+
+class TestTensorCompare(unittest.TestCase):
+    def setUp(self):
+        self.bows = [
+            mock.MagicMock(se='a', matrix=np.array(
+                [[1, 0], [0, 1], [1, 1], [0, 0]], dtype=np.uint8)),
+            mock.MagicMock(se='b', matrix=np.array(
+                [[0, 0], [1, 0], [0, 1], [1, 1]], dtype=np.uint8))
+        ]
+        self.queries = ['y', 'x', 'y', 'x']
+
+    def test_query_day_codes(self):
+        codes, days, n_queries, n_days = tn.query_day_codes(self.queries)
+        np.testing.assert_array_equal(codes, [1, 0, 1, 0])
+        np.testing.assert_array_equal(days, [0, 0, 1, 1])
+        self.assertEqual((n_queries, n_days), (2, 2))
+
+    def test_construct(self):
+        model = tn.TensorCompare(self.bows, self.queries)
+        model.construct()
+        X = np.asarray(model.X)
+        self.assertEqual(X.shape, (2, 2, 2, 2))
+        self.assertEqual(X.dtype, np.float64)
+        np.testing.assert_array_equal(X[0, 1], [[1, 0], [1, 1]])
+        np.testing.assert_array_equal(X[0, 0], [[0, 1], [0, 0]])
+        np.testing.assert_array_equal(X[1, 0], [[1, 0], [1, 1]])
+
+        model = tn.TensorCompare(self.bows, self.queries, format='coo')
+        model.construct()
+        np.testing.assert_array_equal(model.X.toarray(), X)
+
+        # Sparse bag of words matrices build the same tensors.
+        bows = [BagOfWordsOutput(sparse.csr_matrix(bow.matrix), bow.se)
+                for bow in self.bows]
+        for tensor_format in tn.TENSOR_FORMATS:
+            model = tn.TensorCompare(bows, self.queries, format=tensor_format)
+            model.construct()
+            np.testing.assert_array_equal(
+                model.X.toarray() if tensor_format == 'coo'
+                else np.asarray(model.X), X)
+
+        model.format = 'foo'
+        self.assertRaises(SEAnalysisException, model.construct)
+
+    def test_cp_apr_sparse(self):
+        rng = np.random.RandomState(0)
+        X = (rng.rand(3, 4, 5) > 0.6).astype(float)
+        U = [rng.rand(size, 2) for size in X.shape]
+        dense = tn.cp_apr(dtensor(X), 2, M=ktensor([u.copy() for u in U]),
+                          outer_iter=20)
+        subs = X.nonzero()
+        sparse = tn.cp_apr_sparse(
+            sptensor(subs, X[subs], shape=X.shape), 2,
+            M=ktensor([u.copy() for u in U]), outer_iter=20)
+        np.testing.assert_allclose(sparse.lmbda, dense.lmbda)
+        for sparse_u, dense_u in zip(sparse.U, dense.U):
+            np.testing.assert_allclose(sparse_u, dense_u)
+        # Unfoldings keep the data type of tensor.
+        counts = tn.cp_apr(dtensor(X.astype(np.uint8)), 2,
+                           M=ktensor([u.copy() for u in U]), outer_iter=20)
+        np.testing.assert_allclose(counts.lmbda, dense.lmbda)
+
+    def test_cp_apr_collapsed_component(self):
+        rng = np.random.RandomState(0)
+        X = (rng.rand(3, 4, 5) > 0.6).astype(float)
+        U = [rng.rand(size, 2) for size in X.shape]
+        U[0][:, 1] = 0
+        subs = X.nonzero()
+        for M in (tn.cp_apr(dtensor(X), 2, M=ktensor([u.copy() for u in U]),
+                            outer_iter=5),
+                  tn.cp_apr_sparse(sptensor(subs, X[subs], shape=X.shape), 2,
+                                   M=ktensor([u.copy() for u in U]),
+                                   outer_iter=5)):
+            self.assertFalse(any(np.isnan(u).any() for u in M.U))
+            self.assertFalse(np.isnan(M.lmbda).any())
+            np.testing.assert_allclose(M.lmbda.sum(), X.sum())
+
+    def test_cp_apr_multistart(self):
+        rng = np.random.RandomState(0)
+        X = dtensor((rng.rand(3, 4, 5) > 0.6).astype(float))
+        M, likelihood, history = tn.cp_apr_multistart(
+            X, 2, starts=3, seed=1, outer_iter=20)
+        self.assertAlmostEqual(likelihood, tn.log_likelihood(X, M))
+        self.assertTrue(0 < len(history) <= 20)
+        self.assertTrue(all(isinstance(it, tn.Iteration) for it in history))
+        np.testing.assert_allclose(M.lmbda.sum(), np.asarray(X).sum())
+        same = tn.cp_apr_multistart(X, 2, starts=3, seed=1, outer_iter=20)
+        self.assertEqual(same[1], likelihood)
+
+        self.assertRaises(SEAnalysisException, tn.cp_apr_multistart, X, 2,
+                          starts=0)
+
+    def test_online_update(self):
+        state = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state)
+        keys = [('d1', 'y'), ('d1', 'x'), ('d2', 'y'), ('d2', 'x')]
+        first_day = [mock.MagicMock(se=bow.se, matrix=bow.matrix[:2])
+                     for bow in self.bows]
+        model = tn.TensorCompare(
+            first_day, self.queries[:2], components=2, seed=0, state=state,
+            refine=0, keys=keys[:2], terms=['t1', 't2'], category='c',
+            outer_iter=20)
+        model.construct()
+        model.evaluate()
+
+        model2 = tn.TensorCompare(
+            self.bows, self.queries, components=2, seed=0, state=state,
+            refine=0, keys=keys, terms=['t1', 't2'], category='c',
+            outer_iter=20)
+        model2.construct()
+        self.assertEqual(model2.X.shape, (2, 2, 2, 2))
+        model2.evaluate()
+        np.testing.assert_allclose(model2.se_dist, model.se_dist)
+        saved = joblib.load(state + '/c.cp')
+        self.assertEqual(saved['slices'], [('d1',), ('d2',)])
+        self.assertEqual(saved['updates'], 1)
+        self.assertEqual(saved['U'][2].shape, (2, 2))
+
+    def test_online_update_new_terms(self):
+        state = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state)
+        keys = [('d1', 'y'), ('d1', 'x'), ('d2', 'y'), ('d2', 'x')]
+        bows = [BagOfWordsOutput(bow.matrix, bow.se) for bow in self.bows]
+        model = tn.TensorCompare(
+            [bow._replace(matrix=bow.matrix[:2]) for bow in bows],
+            self.queries[:2], components=2, seed=0, state=state, refine=0,
+            keys=keys[:2], terms=['t1', 't2'], category='c', outer_iter=20)
+        model.construct()
+        model.evaluate()
+
+        # The vocabulary of the second run has a new term and another order.
+        new_bows = [bow._replace(matrix=np.hstack((
+            bow.matrix[:, ::-1], np.ones((4, 1), dtype=np.uint8))))
+            for bow in bows]
+        model2 = tn.TensorCompare(
+            new_bows, self.queries, components=2, seed=0, state=state,
+            refine=0, keys=keys, terms=['t2', 't1', 't3'], category='c',
+            outer_iter=20)
+        model2.construct()
+        np.testing.assert_array_equal(np.asarray(model2.X)[:, :, 0],
+                                      np.asarray(model.X)[:, :, 0])
+        model2.evaluate()
+        np.testing.assert_allclose(model2.se_dist, model.se_dist)
+        saved = joblib.load(state + '/c.cp')
+        self.assertEqual(saved['terms'], ['t1', 't2'])
+        self.assertEqual(saved['updates'], 1)
+
+    def test_save_score(self):
+        bows = [BagOfWordsOutput(bow.matrix, bow.se) for bow in self.bows]
+        model = tn.TensorCompare(bows, self.queries, components=2, seed=0)
+        model.construct()
+        model.evaluate()
+        directory = tempfile.mkdtemp()
+        try:
+            model.save(join(directory, 'model'), ['u', 'v'])
+            saved = tn.TensorCompare.load(join(directory, 'model'))
+            self.assertEqual(saved.vocabulary, ['u', 'v'])
+            self.assertRaises(SEAnalysisException, LDA.load,
+                              join(directory, 'model'))
+        finally:
+            shutil.rmtree(directory)
+        # The date mode of the training results is fitted again, so their
+        # log-likelihood is (almost) the one of the fit.
+        ll = saved.score(bows, self.queries)
+        self.assertAlmostEqual(ll, model.log_likelihood, places=2)
+        np.testing.assert_array_equal(saved.se_dist, model.se_dist)
+        # Results of unknown queries are ignored.
+        new = [bow._replace(matrix=np.vstack((bow.matrix, [[1, 1]])))
+               for bow in bows]
+        self.assertAlmostEqual(saved.score(new, self.queries + ['z']), ll,
+                               places=2)
+        self.assertRaises(SEAnalysisException, saved.score, bows[::-1],
+                          self.queries)
+
+    def test_held_out_log_likelihood(self):
+        bows = [BagOfWordsOutput(np.tile(bow.matrix, 2), bow.se)
+                for bow in self.bows]
+        model = tn.TensorCompare(bows, self.queries, components=2, seed=0)
+        model.construct()
+        model.evaluate()
+        se_dist = model.se_dist.copy()
+        ll = model.held_out_log_likelihood(bows, self.queries)
+        # The model is not changed.
+        np.testing.assert_array_equal(model.se_dist, se_dist)
+        self.assertLessEqual(ll, 0)
+        unlike = [bow._replace(matrix=1 - bow.matrix) for bow in bows]
+        self.assertLess(model.held_out_log_likelihood(unlike, self.queries),
+                        ll)
+        X = model.X
+        fitted = np.array([True, False, True, False])
+        subs = np.asarray(X).nonzero()
+        np.testing.assert_array_equal(
+            tn._term_slices(sptensor(subs, np.asarray(X)[subs],
+                                     shape=X.shape), fitted).toarray(),
+            np.asarray(tn._term_slices(X, fitted)))
@@ -0,0 +1,398 @@
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import namedtuple, OrderedDict
+from itertools import combinations
+import json
+import numpy as np
+from joblib import Parallel, delayed
+from seanalysis import profiling
+from seanalysis.compare_sorting import find_distance, plot_distance
+from seanalysis.controller import controller as ctrl
+from seanalysis.corpus import Corpus
+from seanalysis.drawing.visualization import Visualization
+from seanalysis.feature_store import FeatureStore
+from seanalysis.utils import SEAnalysisException
+
+COMMANDS = ['cont', 'rank', 'metrict']
+
+RANK_METRICS = ['LEV', 'DAM-LEV', 'HAM', 'JAR', 'JAR-WIN', 'PYTHON',
+                'KENDALL', 'SPEARMAN', 'G', 'M']
+
+# A stage of the analysis graph: its function is called with the outputs of
+# the stages it depends on followed by its own arguments.
+Stage = namedtuple('Stage', ['func', 'deps', 'args'])
+
+# An output of an analysis, i.e. a fitted model or the distances of a pair
+# of search engines, for a query category.
+Output = namedtuple('Output', ['analysis', 'category', 'search_engines',
+                               'key'])
+
+
+def load_plan(path):
+    """
+    Load a JSON analysis plan.
+
+    :param path: Path of plan.
+
+    :return: Dictionary with the plan.
+    """
+    try:
+        with open(path) as plan_file:
+            plan = json.load(plan_file)
+    except (IOError, ValueError) as e:
+        raise SEAnalysisException('Invalid plan %s: %s' % (repr(path), e))
+    if not isinstance(plan.get('analyses'), list) or not plan['analyses']:
+        raise SEAnalysisException('Plan must contain a list of analyses')
+    return plan
+
+
+def _config_pairs(config):
+    """ Convert a configuration dictionary to a list of key-value pairs. """
+    if isinstance(config, dict):
+        return ['%s=%s' % (key, value) for key, value in config.items()]
+    return list(config)
+
+
+def _load_snippets(corpus, category, search_engines, N, per_day):
+    return corpus.snippets(category, list(search_engines), N=N,
+                           per_day=per_day).load()
+
+
+def _load_titles(corpus, category, search_engines, N):
+    return corpus.titles(category, list(search_engines), N=N,
+                         per_day=False).load()
+
+
+def _load_urls(corpus, category, search_engines, N):
+    return corpus.urls(category, list(search_engines), N=N).load()
+
+
+def _build_features(snippets, category, vocabulary, store, reduction):
+    return ctrl.Controller(None, None, None).build_features(
+        category, snippets, vocabulary, store, reduction)
+
+
+def _fit(features, method, model, config, category, index, batches=None):
+    controller = ctrl.Controller(method, model, config)
+    models = [ctrl.SUPPORTED_MODELS[model], ctrl.IndexClassificationModel]\
+        if index else [ctrl.SUPPORTED_MODELS[model]]
+    return controller.fit_category(category, batches, models,
+                                   controller.parse_config(), None,
+                                   features=features)
+
+
+def _rank_distance(urls, search_engines, category, metric, N):
+    return find_distance(None, urls, None, None, list(search_engines),
+                         category, metric, None, N, None, None, None)
+
+
+def _metrict_distance(urls, snippets, titles, search_engines, category,
+                      evolution, N, weights):
+    return find_distance(None, urls, snippets, titles, list(search_engines),
+                         category, 'T', evolution, N, *weights)
+
+
+class Plan(object):
+    """
+    This class compiles an analysis plan into a graph of stages and executes
+    it.
+
+    A plan is the matrix of query categories X search engines X analyses,
+    where an analysis is the equivalent of a `cont`, `rank` or `metrict`
+    command. Every analysis is compiled into the following stages:
+    load (snippets, titles or urls of results), features (bag of words
+    representation), fit (models) or metric (distances of search engines)
+    and finally plot or export.
+
+    Stages are identified by their inputs, so intermediate results shared by
+    analyses (e.g. the snippets of a query category or its bag of words
+    representation) are computed once. Stages whose dependencies have been
+    computed run in parallel processes, while plotting and exporting are
+    done by the current process in the order of the plan.
+
+    Results are loaded from `corpus` (see `Corpus`), so its filters restrict
+    every analysis of the plan.
+    """
+    def __init__(self, plan, results_dir, search_engines, categories, N=10,
+                 merge=False, corpus=None):
+        self.plan = plan
+        self.results_dir = results_dir
+        self.corpus = Corpus(results_dir) if corpus is None else corpus
+        self.search_engines = plan.get('search_engines', search_engines)
+        self.categories = plan.get('categories', categories)
+        self.N = plan.get('N', N)
+        self.merge = plan.get('merge', merge)
+        self.stages = OrderedDict()
+        self.outputs = []
+
+    def compile(self):
+        """
+        Compile the plan into the graph of stages.
+
+        :return: Dictionary of stages keyed by their identifier.
+        """
+        self.stages = OrderedDict()
+        self.outputs = []
+        for i, analysis in enumerate(self.plan['analyses']):
+            command = analysis.get('command')
+            if command not in COMMANDS:
+                raise SEAnalysisException(
+                    'Unsupported command %s of analysis %d' % (
+                        repr(command), i))
+            if command == 'cont':
+                self._compile_cont(i, analysis)
+            else:
+                self._compile_metric(i, analysis)
+        return self.stages
+
+    def run(self, jobs=1):
+        """
+        Execute the stages of the compiled plan.
+
+        Stages are executed in waves; every wave contains all the stages
+        whose dependencies have been computed. The output of a stage is
+        released as soon as all its dependent stages have been executed.
+
+        :param jobs: Maximum number of stages executed in parallel.
+
+        :return: Dictionary with the output of every analysis output keyed
+        by its stage identifier.
+        """
+        if not self.stages:
+            self.compile()
+        dependents = {key: 0 for key in self.stages}
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                dependents[dep] += 1
+        keep = {output.key for output in self.outputs}
+        results = {}
+        pending = list(self.stages)
+        with Parallel(n_jobs=jobs) as parallel:
+            while pending:
+                wave = [key for key in pending if all(
+                    dep in results for dep in self.stages[key].deps)]
+                outputs = profiling.gather(parallel(
+                    delayed(profiling.remote(self.stages[key].func))(
+                        *([results[dep] for dep in self.stages[key].deps] +
+                          list(self.stages[key].args))) for key in wave))
+                results.update(zip(wave, outputs))
+                pending = [key for key in pending if key not in results]
+                for key in wave:
+                    for dep in self.stages[key].deps:
+                        dependents[dep] -= 1
+                        if not dependents[dep] and dep not in keep:
+                            del results[dep]
+        return results
+
+    def plot(self, results):
+        """
+        Plot the outputs of every analysis; every analysis is plotted in its
+        own figures (or diagram, if outputs are merged) and they are shown
+        as if the analyses were run one after the other.
+
+        :param results: Outputs returned by `run`.
+        """
+        for i, analysis in enumerate(self.plan['analyses']):
+            outputs = [output for output in self.outputs
+                       if output.analysis == i]
+            if analysis['command'] == 'cont':
+                models = [model for output in outputs
+                          for model in results[output.key]]
+                visual = Visualization(self.merge, len(models))
+                for output in outputs:
+                    for model in results[output.key]:
+                        model.plot(visual, output.category)
+            else:
+                visual = Visualization(self.merge, len(outputs))
+                for output in outputs:
+                    plot_distance(visual, results[output.key],
+                                  output.search_engines, output.category,
+                                  analysis.get('evol', False),
+                                  *self._weights(analysis))
+            visual.show()
+            visual.close()
+
+    def export(self, results, path):
+        """
+        Export the outputs of every analysis to a JSON file (see
+        `export_result`).
+
+        :param results: Outputs returned by `run`.
+        :param path: Path of the JSON file.
+        """
+        report = []
+        for output in self.outputs:
+            analysis = self.plan['analyses'][output.analysis]
+            report.append({
+                'analysis': output.analysis,
+                'command': analysis['command'],
+                'category': output.category,
+                'search_engines': list(output.search_engines),
+                'result': export_result(analysis['command'],
+                                        results[output.key])
+            })
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+    def _engine_sets(self, analysis, pairs):
+        sets = analysis.get('search_engines')
+        if sets is None:
+            sets = list(combinations(self.search_engines, 2)) if pairs\
+                else [self.search_engines]
+        sets = [tuple(engines) for engines in sets]
+        if pairs and any(len(engines) != 2 for engines in sets):
+            raise SEAnalysisException(
+                'Command %s requires pairs of search engines' % repr(
+                    analysis['command']))
+        return sets
+
+    def _add(self, key, func, deps=(), args=()):
+        if key not in self.stages:
+            self.stages[key] = Stage(func, tuple(deps), tuple(args))
+        return key
+
+    def _add_snippets(self, category, engines, per_day):
+        return self._add(
+            ('snippets', category, engines, self.N, per_day),
+            _load_snippets,
+            args=(self.corpus, category, engines, self.N, per_day))
+
+    def _compile_cont(self, i, analysis):
+        method, model = analysis.get('method'), analysis.get('model')
+        config = _config_pairs(analysis.get('config', []))
+        controller = ctrl.Controller(method, model, config)
+        controller.validate()
+        controller.parse_config()
+        index = analysis.get('index', False)
+        per_day = analysis.get('per_day', False)
+        if index and (per_day or model != 'se'):
+            raise SEAnalysisException(
+                'index is only supported by "se" model per result')
+        vocabulary = analysis.get('vocabulary')
+        reduction = analysis.get('reduction')
+        if reduction is not None:
+            reduction = (reduction, analysis.get('components', 100))
+        store = self.plan.get('store')
+        for engines in self._engine_sets(analysis, pairs=False):
+            for category in self.categories:
+                key = ('fit', i, category, engines)
+                if model == 'stream':
+                    self._add(key, _fit, args=(
+                        None, method, model, config, category, index,
+                        self.corpus.batches(category, list(engines), self.N,
+                                            per_day)))
+                else:
+                    feature_store = None if store is None else FeatureStore(
+                        store, self.results_dir, list(engines), N=self.N,
+                        per_day=per_day, corpus=self.corpus)
+                    deps = [] if feature_store is not None and \
+                        feature_store.contains(category, vocabulary) else [
+                            self._add_snippets(category, engines, per_day)]
+                    args = (category, vocabulary, feature_store, reduction)
+                    features = self._add(
+                        ('features', category, engines, self.N, per_day,
+                         vocabulary, reduction), _build_features, deps,
+                        args if deps else (None,) + args)
+                    self._add(key, _fit, [features], (
+                        method, model, config, category, index))
+                self.outputs.append(Output(i, category, engines, key))
+
+    def _compile_metric(self, i, analysis):
+        command = analysis['command']
+        metric = analysis.get('metric')
+        if command == 'rank' and metric not in RANK_METRICS:
+            raise SEAnalysisException(
+                'Unsupported metric %s of analysis %d' % (repr(metric), i))
+        evolution = analysis.get('evol', False) if command == 'metrict'\
+            else None
+        categories = '*' if evolution else self.categories
+        weights = self._weights(analysis)
+        for engines in self._engine_sets(analysis, pairs=True):
+            for category in categories:
+                deps = [self._add(
+                    ('urls', category, engines, self.N), _load_urls,
+                    args=(self.corpus, category, engines, self.N))]
+                key = ('metric', i, category, engines)
+                if command == 'rank':
+                    self._add(key, _rank_distance, deps,
+                              (engines, category, metric, self.N))
+                else:
+                    deps.append(self._add_snippets(category, engines, False))
+                    deps.append(self._add(
+                        ('titles', category, engines, self.N), _load_titles,
+                        args=(self.corpus, category, engines, self.N)))
+                    self._add(key, _metrict_distance, deps,
+                              (engines, category, evolution, self.N,
+                               weights))
+                self.outputs.append(Output(i, category, engines, key))
+
+    def _weights(self, analysis):
+        if analysis['command'] != 'metrict':
+            return None, None, None
+        return metric_weights(analysis.get('weights', {}))
+
+
+def metric_weights(weights):
+    """
+    Get the weights of the metric T.
+
+    :param weights: Dictionary with the lists of weights `a` (transpositions),
+    `b` (snippets) and `c` (titles); missing weights take their default.
+
+    :return: Tuple of arrays (a, b, c).
+    """
+    values = [np.asarray(weights.get(name, default), dtype=float)
+              for name, default in (('a', [0.8]), ('b', [1]), ('c', [0.33]))]
+    if not len(values[0]) == len(values[1]) == len(values[2]):
+        raise SEAnalysisException(
+            'The weights a, b, c should have the same length.')
+    return tuple(values)
+
+
+def export_result(command, result):
+    """
+    Convert the output of an analysis to a JSON serializable object.
+
+    For component based models, the contribution of every search engine to
+    every component is exported, for classification models their evaluation
+    and for metrics the distances of every day and query.
+
+    :param command: Command of analysis; `cont`, `rank` or `metrict`.
+    :param result: Output of analysis, i.e. the list of fitted models or the
+    distances.
+    """
+    if command == 'cont':
+        result = [{'se_dist': model.se_dist}
+                  if getattr(model, 'se_dist', None) is not None
+                  else {'results': getattr(model, 'results', None)}
+                  for model in result]
+    return _jsonable(result)
+
+
+def _jsonable(value):
+    """ Convert the outputs of analyses to JSON serializable objects. """
+    if isinstance(value, np.ndarray):
+        return _jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return _jsonable(sorted(value))
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, float) and value != value:
+        return None
+    return value
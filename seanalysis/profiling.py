@@ -0,0 +1,244 @@
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+import cProfile
+from functools import wraps
+import json
+import os
+import resource
+import time
+
+# The active profiler; `None` if stages are not profiled.
+_profiler = None
+
+
+def peak_rss():
+    """ Peak resident set size of process so far (in kilobytes). """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageProfiler(object):
+    """
+    This class records the wall time, the CPU time, the number of calls and
+    the peak resident set size of every stage of an analysis, e.g. the
+    parsing of documents or the fit of a model, per query category.
+
+    Stages may be nested, e.g. the vectorization of snippets includes their
+    tokenization, so the times of nested stages are also included in the
+    times of the outer ones. The peak resident set size of a stage is the
+    peak of process at the end of the stage.
+
+    If `cprofile` is True, every outermost stage is also run under a
+    `cProfile` profiler of its own, so that the profile of the slowest stage
+    can be dumped.
+    """
+    def __init__(self, cprofile=False):
+        self.cprofile = cprofile
+        self.category = None
+        self.stats = {}
+        self._profiles = {}
+        self._depth = 0
+        self._start = time.time()
+
+    @contextmanager
+    def measure(self, name):
+        """
+        Measure a call of a stage.
+
+        :param name: Name of stage.
+        """
+        profile = None
+        if self.cprofile and not self._depth:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+        self._depth += 1
+        wall, cpu = time.time(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.time() - wall, time.process_time() - cpu
+            self._depth -= 1
+            if profile is not None:
+                profile.disable()
+            self.record(name, self.category, 1, wall, cpu, peak_rss())
+
+    def record(self, name, category, calls, wall, cpu, rss):
+        """
+        Add calls of a stage to the statistics of the stage.
+        """
+        stats = self.stats.setdefault((name, category), [0, 0., 0., 0])
+        stats[0] += calls
+        stats[1] += wall
+        stats[2] += cpu
+        stats[3] = max(stats[3], rss)
+
+    def merge(self, stats):
+        """
+        Merge the statistics of another profiler, e.g. of a worker process.
+
+        :param stats: `stats` of the other profiler.
+        """
+        for (name, category), values in stats.items():
+            self.record(name, category, *values)
+
+    def report(self):
+        """
+        Get the statistics of every stage.
+
+        :return: Dictionary with the total wall time of the profiled run and
+        a list with the statistics of every stage and query category, the
+        slowest first.
+        """
+        stages = [{
+            'stage': name, 'category': category, 'calls': calls,
+            'wall_time': wall, 'cpu_time': cpu, 'peak_rss': rss
+        } for (name, category), (calls, wall, cpu, rss) in self.stats.items()]
+        stages.sort(key=lambda stage: -stage['wall_time'])
+        return {'wall_time': time.time() - self._start,
+                'peak_rss': peak_rss(), 'stages': stages}
+
+    def dump(self, path):
+        """
+        Write the statistics of every stage to a JSON file.
+        """
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+    def dump_cprofile(self, path):
+        """
+        Write the `cProfile` statistics of the slowest outermost stage, in
+        the format of `pstats`.
+
+        :return: Name of the slowest stage or `None` if no stage was run
+        under `cProfile`.
+        """
+        if not self._profiles:
+            return None
+        wall = {}
+        for (name, _), values in self.stats.items():
+            if name in self._profiles:
+                wall[name] = wall.get(name, 0.) + values[1]
+        slowest = max(wall, key=wall.get)
+        self._profiles[slowest].dump_stats(path)
+        return slowest
+
+
+def enable(cprofile=False):
+    """
+    Start profiling the stages of the analysis.
+
+    :param cprofile: True to run every outermost stage under `cProfile`.
+
+    :return: `StageProfiler` object.
+    """
+    global _profiler
+    _profiler = StageProfiler(cprofile)
+    return _profiler
+
+
+def disable():
+    """ Stop profiling the stages of the analysis. """
+    global _profiler
+    _profiler = None
+
+
+@contextmanager
+def stage(name):
+    """
+    Profile the enclosed code as a call of the given stage, if profiling is
+    enabled.
+    """
+    if _profiler is None:
+        yield
+        return
+    with _profiler.measure(name):
+        yield
+
+
+def profiled(name):
+    """ Profile every call of the decorated function as the given stage. """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.measure(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def category(query_category):
+    """
+    Attribute the stages of the enclosed code to the given query category.
+    """
+    if _profiler is None:
+        yield
+        return
+    previous = _profiler.category
+    _profiler.category = query_category
+    try:
+        yield
+    finally:
+        _profiler.category = previous
+
+
+class _Remote(object):
+    """
+    Function run by a worker process, which returns its result along with
+    the statistics of the stages profiled in the worker. If it is run by
+    the process which wrapped it (e.g. `jobs=1`), stages are recorded by the
+    active profiler directly.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.pid = os.getpid()
+
+    def __call__(self, *args, **kwargs):
+        global _profiler
+        if os.getpid() == self.pid:
+            return self.func(*args, **kwargs), {}
+        parent = _profiler
+        _profiler = StageProfiler()
+        try:
+            return self.func(*args, **kwargs), _profiler.stats
+        finally:
+            _profiler = parent
+
+
+def remote(func):
+    """
+    Wrap a function run by worker processes (e.g. with joblib), so that the
+    stages profiled in workers are merged into the active profiler by
+    `gather`. The function is returned as is if profiling is disabled.
+    """
+    return func if _profiler is None else _Remote(func)
+
+
+def gather(results):
+    """
+    Merge the statistics returned by functions wrapped by `remote` into the
+    active profiler.
+
+    :param results: List of results of the wrapped functions.
+
+    :return: List of the actual results.
+    """
+    if _profiler is None:
+        return results
+    for _, stats in results:
+        _profiler.merge(stats)
+    return [result for result, _ in results]
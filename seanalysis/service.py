@@ -0,0 +1,488 @@
+# Copyright (c) 2016-2020 AUEB BaLab
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict, defaultdict, namedtuple
+import http.client
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import inspect
+import json
+import os
+from os.path import exists
+import re
+import socket
+import socketserver
+import stat
+import time
+import traceback
+from seanalysis import utils
+from seanalysis.compare_sorting import find_distance
+from seanalysis.controller import controller as ctrl
+from seanalysis.corpus import Corpus
+from seanalysis.plan import RANK_METRICS, export_result, metric_weights
+from seanalysis.utils import SEAnalysisException
+
+# A parsed document of results, i.e. the query, the date and the search
+# engine of the document along with the N urls, snippets and titles of its
+# results.
+Document = namedtuple('Document', ['query', 'date', 'se', 'urls', 'snippets',
+                                   'titles'])
+
+# Address of a TCP service; any other address is the path of a Unix socket.
+TCP_ADDRESS = re.compile(r'^([\w.-]*):(\d+)$')
+
+# Requests answered by the service, i.e. path and method of
+# `ResidentCorpus` which answers the (JSON) body of request.
+ROUTES = {
+    '/status': 'status',
+    '/refresh': 'refresh',
+    '/rank': 'rank',
+    '/metrict': 'metrict',
+    '/model': 'model'
+}
+
+
+class ResidentCorpus(object):
+    """
+    This class keeps the results of query categories in memory, so that
+    analyses are answered without loading the corpus again.
+
+    Every document is parsed once; the urls, the snippets and the titles of
+    its results are kept, and the inputs of analyses (e.g. the urls of
+    `utils.load_urls` or the bag of words representation) are built from the
+    parsed documents. Inputs and outputs of analyses are cached until new
+    documents of their query category are loaded.
+
+    Documents are loaded incrementally by `refresh`, i.e. only the day
+    directories which are new, or the latest day which may be still written,
+    are scanned and only documents not loaded yet are parsed. Directories
+    are scanned by `corpus` (see `Corpus`), so its filters restrict the
+    loaded documents.
+    """
+    def __init__(self, results_dir, categories, search_engines, N=10,
+                 corpus=None):
+        self.results_dir = results_dir
+        self.corpus = Corpus(results_dir) if corpus is None else corpus
+        self.categories = list(categories)
+        self.search_engines = list(search_engines)
+        self.N = N
+        self.documents = {category: {} for category in self.categories}
+        self.versions = {category: 0 for category in self.categories}
+        self.refreshed = None
+        self._dates = []
+        self._cache = {}
+
+    def refresh(self):
+        """
+        Load the documents of the new results.
+
+        :return: Dictionary keyed by query category with the number of
+        loaded documents.
+        """
+        dates = self.corpus.dates()
+        scanned = [date for date in dates if date not in self._dates]
+        if self._dates:
+            scanned.insert(0, self._dates[-1])
+        loaded = {}
+        for category in self.categories:
+            documents = self.documents[category]
+            paths = [path for path in self.corpus.paths(
+                category, self.search_engines, scanned)
+                if path not in documents]
+            for path in paths:
+                documents[path] = self._parse(category, path)
+            if paths:
+                self.versions[category] += 1
+                self._cache = {key: value
+                               for key, value in self._cache.items()
+                               if key[0] != category}
+            loaded[category] = len(paths)
+        self._dates = dates
+        self.refreshed = time.time()
+        return loaded
+
+    def status(self):
+        """
+        Get the loaded dates and the number of loaded documents of every
+        query category.
+        """
+        return {
+            'results': self.results_dir,
+            'search_engines': self.search_engines,
+            'N': self.N,
+            'categories': {category: {
+                'version': self.versions[category],
+                'documents': len(self.documents[category]),
+                'dates': sorted({document.date for document in
+                                 self.documents[category].values()})
+            } for category in self.categories}
+        }
+
+    def urls(self, category, search_engines=None):
+        """
+        Get the urls of results, as `utils.load_urls` does.
+        """
+        def build():
+            urls = defaultdict(lambda: defaultdict(
+                lambda: defaultdict(lambda: [])))
+            for document in self._documents(category, search_engines):
+                urls[document.se][document.date][document.query].extend(
+                    document.urls)
+            return urls
+        return self._cached(category, ('urls', search_engines), build)
+
+    def snippets(self, category, search_engines=None, per_day=False):
+        """
+        Get the snippets of results, as `utils.load_snippets` does.
+        """
+        def build():
+            snippets = {se: OrderedDict()
+                        for se in self._engines(search_engines)}
+            for document in self._documents(category, search_engines):
+                if per_day:
+                    snippets[document.se][(document.date, document.query)] =\
+                        ' ' + ' '.join(
+                            snippet for snippet in document.snippets
+                            if snippet is not utils.NO_RESULT)
+                    continue
+                for i, snippet in enumerate(document.snippets):
+                    snippets[document.se][
+                        (i + 1, document.date, document.query)] = snippet
+            return snippets
+        return self._cached(category, ('snippets', search_engines, per_day),
+                            build)
+
+    def titles(self, category, search_engines=None):
+        """
+        Get the titles of every result, as `utils.load_titles` does with
+        `per_day=False`.
+        """
+        def build():
+            titles = {se: OrderedDict()
+                      for se in self._engines(search_engines)}
+            for document in self._documents(category, search_engines):
+                for i, title in enumerate(document.titles):
+                    titles[document.se][
+                        (i + 1, document.date, document.query)] = title
+            return titles
+        return self._cached(category, ('titles', search_engines), build)
+
+    def rank(self, category, search_engines, metric):
+        """
+        Compute the distances of the rankings of two search engines, as the
+        `rank` command does.
+
+        :return: Dictionary with the dates, the queries and the distances of
+        every date and query.
+        """
+        search_engines = self._pair(search_engines)
+        if metric not in RANK_METRICS:
+            raise SEAnalysisException('Unsupported metric %s' % repr(metric))
+
+        def compute():
+            return self._distances(category, search_engines, find_distance(
+                None, self.urls(category, search_engines), None, None,
+                list(search_engines), category, metric, None, self.N, None,
+                None, None), 'rank')
+        return self._cached(category, ('rank', search_engines, metric),
+                            compute)
+
+    def metrict(self, category, search_engines, weights=None):
+        """
+        Compute the metric T of two search engines, as the `metrict` command
+        does.
+
+        :param weights: Dictionary with the lists of weights `a`, `b` and
+        `c` (see `plan.metric_weights`).
+
+        :return: Dictionary with the dates, the queries and the distances of
+        every date, query and weight.
+        """
+        search_engines = self._pair(search_engines)
+        weights = metric_weights(weights or {})
+
+        def compute():
+            return self._distances(category, search_engines, find_distance(
+                None, self.urls(category, search_engines),
+                self.snippets(category, search_engines),
+                self.titles(category, search_engines), list(search_engines),
+                category, 'T', False, self.N, *weights), 'metrict')
+        return self._cached(category, (
+            'metrict', search_engines,
+            tuple(tuple(weight) for weight in weights)), compute)
+
+    def model(self, category, model, config=None, method=None,
+              search_engines=None, vocabulary=None, per_day=False,
+              index=False):
+        """
+        Fit a model, as the `cont` command does.
+
+        The bag of words representation of the query category is built once
+        and shared by all the models fitted with the same results.
+
+        :param config: Dictionary (or list of key-value pairs) with the
+        configuration of model.
+
+        :return: Output of the model (see `plan.export_result`).
+        """
+        config = ['%s=%s' % item for item in sorted(config.items())]\
+            if isinstance(config, dict) else list(config or [])
+        if model not in ctrl.SUPPORTED_MODELS:
+            raise SEAnalysisException('Model %s not supported' % repr(model))
+        if method is None:
+            method = next(m for m, models in
+                          ctrl.SUPPORTED_MODELS_PER_METHOD.items()
+                          if model in models)
+        if index and (per_day or model != 'se'):
+            raise SEAnalysisException(
+                'index is only supported by "se" model per result')
+        controller = ctrl.Controller(method, model, config)
+        models, parsed_config = controller.prepare(index)
+        engines = self._engines(search_engines)
+
+        def compute():
+            features = None
+            if model == 'stream':
+                snippets = self.corpus.batches(category, engines, N=self.N,
+                                               per_day=per_day)
+            else:
+                snippets = self.snippets(category, search_engines, per_day)
+                features = self._cached(category, (
+                    'features', search_engines, per_day, vocabulary),
+                    lambda: controller.build_features(
+                        category, snippets, vocabulary))
+            return export_result('cont', controller.fit_category(
+                category, snippets, models, parsed_config, vocabulary,
+                features=features))
+        return self._cached(category, (
+            'model', method, model, tuple(config), search_engines,
+            vocabulary, per_day, index), compute)
+
+    def _parse(self, category, path):
+        document = utils.load_document(path)
+        query, date, se = utils.get_query_se(
+            path.replace(self.results_dir, '', 1), se=True)
+        urls = []
+        for i in range(self.N):
+            url = utils.get_url(document, category, se, index=i)
+            urls.append(url if url is utils.NO_RESULT
+                        else url.encode('ascii', 'ignore'))
+        return Document(query, date, se, urls, [
+            utils.get_snippet(document, category, se, index=i)
+            for i in range(self.N)], [
+            utils.get_title(document, category, se, index=i)
+            for i in range(self.N)])
+
+    def _engines(self, search_engines):
+        if search_engines is None:
+            return list(self.search_engines)
+        unknown = set(search_engines).difference(self.search_engines)
+        if unknown:
+            raise SEAnalysisException(
+                'Search engine %s is not loaded' % repr(unknown.pop()))
+        return list(search_engines)
+
+    def _pair(self, search_engines):
+        search_engines = tuple(self._engines(search_engines))
+        if len(search_engines) != 2:
+            raise SEAnalysisException('A pair of search engines is required')
+        return search_engines
+
+    def _documents(self, category, search_engines):
+        """ Documents of the given search engines in the order of paths. """
+        engines = set(self._engines(search_engines))
+        documents = self.documents[category]
+        return [documents[path] for path in sorted(documents)
+                if documents[path].se in engines]
+
+    def _distances(self, category, search_engines, distances, command):
+        urls = self.urls(category, search_engines)[search_engines[0]]
+        dates = sorted(urls)
+        return {'dates': dates,
+                'queries': list(urls[dates[0]]) if dates else [],
+                'distances': export_result(command, distances)}
+
+    def _cached(self, category, key, compute):
+        """
+        Get the cached value of key for the current version of a query
+        category, or compute it.
+        """
+        if category not in self.documents:
+            raise SEAnalysisException(
+                'Query category %s is not loaded' % repr(category))
+        key = (category, self.versions[category]) + tuple(
+            tuple(item) if isinstance(item, list) else item for item in key)
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    This class answers the requests of the service.
+
+    The path of a request selects the method of the resident corpus (see
+    `ROUTES`) and the JSON object of its body holds the arguments of the
+    method. The answer is a JSON object; invalid requests are answered with
+    status 400 (or 404 for unknown paths) and an `error` message, and
+    unexpected errors with status 500, after their traceback is logged.
+
+    The new results are loaded before a request is answered, if the corpus
+    has not been refreshed for `refresh_interval` seconds.
+    """
+    def do_GET(self):
+        self._answer({})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8')
+                                 or '{}')
+        except ValueError:
+            return self._send(400, {'error': 'Invalid JSON body'})
+        if not isinstance(payload, dict):
+            return self._send(400, {'error': 'Body must be a JSON object'})
+        self._answer(payload)
+
+    def address_string(self):
+        # Clients of a Unix socket have no address.
+        return self.client_address[0] if isinstance(
+            self.client_address, tuple) else self.server.server_address
+
+    def _answer(self, payload):
+        route = ROUTES.get(self.path.split('?', 1)[0])
+        if route is None:
+            return self._send(404, {
+                'error': 'Unknown request %s' % repr(self.path)})
+        corpus = self.server.corpus
+        method = getattr(corpus, route)
+        try:
+            arguments = inspect.signature(method).bind(**payload)
+        except TypeError as e:
+            return self._send(400, {'error': 'Invalid arguments: %s' % e})
+        interval = self.server.refresh_interval
+        try:
+            if route != 'refresh' and interval and \
+                    time.time() - corpus.refreshed >= interval:
+                corpus.refresh()
+            result = method(*arguments.args, **arguments.kwargs)
+        except SEAnalysisException as e:
+            return self._send(400, {'error': str(e)})
+        except Exception as e:
+            self.log_error('%s', traceback.format_exc())
+            return self._send(500, {
+                'error': 'Internal error: %s: %s' % (type(e).__name__, e)})
+        self._send(200, result)
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """ HTTP server listening on a Unix socket. """
+    def server_bind(self):
+        # A socket left by a previous service is replaced.
+        if exists(self.server_address) and stat.S_ISSOCK(
+                os.stat(self.server_address).st_mode):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+
+
+def make_server(corpus, address, refresh_interval=60):
+    """
+    Create the server of the service.
+
+    :param corpus: `ResidentCorpus` object.
+    :param address: `host:port` of a local HTTP server or path of a Unix
+    socket.
+    :param refresh_interval: Seconds after which new results are loaded
+    before a request is answered; `0` to load them only by `/refresh`.
+
+    :return: Server object.
+    """
+    match = TCP_ADDRESS.match(address)
+    if match:
+        server = HTTPServer((match.group(1) or '127.0.0.1',
+                             int(match.group(2))), ServiceHandler)
+    else:
+        server = UnixHTTPServer(address, ServiceHandler)
+    server.corpus = corpus
+    server.refresh_interval = refresh_interval
+    return server
+
+
+def serve(corpus, address, refresh_interval=60):
+    """
+    Answer the requests of the service until interrupted.
+
+    Requests are answered one at a time, so the resident corpus is never
+    accessed concurrently.
+    """
+    server = make_server(corpus, address, refresh_interval)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(server, UnixHTTPServer):
+            os.remove(address)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, 'localhost',
+                                            timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request(address, path, timeout=None, **arguments):
+    """
+    Send a request to a running service, e.g.
+    `request('127.0.0.1:8765', '/rank', category='News',
+    search_engines=['google', 'bing'], metric='KENDALL')`.
+
+    :param address: `host:port` of the service or path of its Unix socket.
+    :param path: Path of request (see `ROUTES`).
+    :param timeout: Timeout of request in seconds; `None` to wait.
+    :param arguments: Arguments of request.
+
+    :return: Answer of service.
+
+    :raises: `SEAnalysisException` if the request is invalid or the service
+    failed to answer it.
+    """
+    match = TCP_ADDRESS.match(address)
+    connection = http.client.HTTPConnection(
+        match.group(1) or '127.0.0.1', int(match.group(2)), timeout=timeout)\
+        if match else _UnixHTTPConnection(address, timeout)
+    try:
+        connection.request('POST', path, json.dumps(arguments),
+                           {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        answer = json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise SEAnalysisException(answer.get('error'))
+    return answer
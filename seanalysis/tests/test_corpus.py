@@ -0,0 +1,82 @@
+import json
+import os
+from os.path import join
+import shutil
+import tempfile
+import unittest
+import mock
+from seanalysis import utils
+from seanalysis.corpus import Corpus
+from seanalysis.utils import SEAnalysisException
+
+SEARCH_ENGINES = ['bing', 'duckduckgo']
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.results_dir)
+        for date in ['2016-10-01', '2016-10-02', '2016-10-03']:
+            for category, queries in [('x', ['a b', 'c']), ('y', ['d'])]:
+                for se in SEARCH_ENGINES + ['yahoo']:
+                    directory = join(self.results_dir, date, category, se)
+                    os.makedirs(directory)
+                    for query in queries:
+                        with open(join(directory, query + '-1'), 'w') as f:
+                            json.dump([{
+                                'url': 'http://%s/%s/%d' % (se, date, i),
+                                'title': 't%d' % i,
+                                'description': '%s %d' % (query, i)}
+                                for i in range(10)], f)
+        self.corpus = Corpus(self.results_dir, SEARCH_ENGINES)
+
+    def test_views(self):
+        self.assertEqual(self.corpus.paths('x'), utils.get_result_dirs(
+            self.results_dir, 'x', SEARCH_ENGINES))
+        for per_day in (True, False):
+            self.assertEqual(
+                dict(self.corpus.snippets('x', per_day=per_day)),
+                utils.load_snippets(self.results_dir, 'x', SEARCH_ENGINES,
+                                    per_day=per_day))
+            self.assertEqual(
+                dict(self.corpus.titles('x', per_day=per_day)),
+                utils.load_titles(self.results_dir, 'x', SEARCH_ENGINES,
+                                  per_day=per_day))
+        self.assertEqual(
+            self.corpus.urls('x')['bing']['2016-10-02']['c'],
+            utils.load_urls(self.results_dir, 'x', SEARCH_ENGINES)[
+                'bing']['2016-10-02']['c'])
+
+    @mock.patch('seanalysis.utils.load_document')
+    def test_filters(self, mock_load):
+        mock_load.return_value = []
+        corpus = self.corpus.filter(since='2016-10-02', queries=['a b', 'd'])
+        snippets = corpus.snippets('x', ['bing'], per_day=True)
+        # Views are loaded on first access.
+        self.assertFalse(mock_load.called)
+        self.assertEqual(list(snippets['bing']), [
+            ('2016-10-02', 'a b'), ('2016-10-03', 'a b')])
+        self.assertEqual(mock_load.call_count, 2)
+        self.assertEqual(corpus.filter(until='2016-10-02').dates(),
+                         ['2016-10-02'])
+        self.assertEqual(len(corpus.paths('*')), 8)
+        self.assertEqual(Corpus(self.results_dir).engines('y'),
+                         ['bing', 'duckduckgo', 'yahoo'])
+
+    def test_batches(self):
+        corpus = self.corpus.filter(until='2016-10-02')
+        batches = corpus.batches('x')
+        with mock.patch.object(corpus, 'paths', wraps=corpus.paths) as paths:
+            self.assertEqual(batches.dates(), ['2016-10-01', '2016-10-02'])
+            self.assertEqual(batches.queries(), ['a b', 'c'])
+            date, snippets = next(iter(batches))
+            # The paths of documents are scanned once.
+            self.assertEqual(paths.call_count, 1)
+        self.assertEqual(date, '2016-10-01')
+        self.assertEqual(list(snippets['duckduckgo']), [
+            ('2016-10-01', 'a b'), ('2016-10-01', 'c')])
+
+    def test_invalid(self):
+        corpus = self.corpus.filter(categories=['x'])
+        self.assertRaises(SEAnalysisException, corpus.urls, 'y')
+        self.assertRaises(SEAnalysisException, corpus.urls, 'x', ['yahoo'])
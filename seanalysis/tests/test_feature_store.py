@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+from os.path import join
+import numpy as np
+from scipy import sparse
+from seanalysis.algorithms.bag_of_words import BagOfWordsOutput
+from seanalysis.feature_store import Features, FeatureStore, \
+    corpus_fingerprint
+
+
+class TestFeatureStore(unittest.TestCase):
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        self.store_dir = tempfile.mkdtemp()
+        self.document = join(self.results_dir, '2016-10-01', 'cat', 'a',
+                             'foo-1')
+        os.makedirs(os.path.dirname(self.document))
+        with open(self.document, 'w') as f:
+            json.dump([], f)
+        self.store = FeatureStore(self.store_dir, self.results_dir, ['a'])
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+        shutil.rmtree(self.store_dir)
+
+    def test_save_load(self):
+        self.assertIsNone(self.store.load('cat', 100))
+        self.assertFalse(self.store.contains('cat', 100))
+        bows = [BagOfWordsOutput(np.array([[1, 0], [0, 1]]), 'a')]
+        self.store.save('cat', 100, Features(
+            bows, ['foo', 'bar'], [1, 2], [(1, 'd', 'foo'), (2, 'd', 'bar')],
+            ['x', 'y']))
+        self.assertTrue(self.store.contains('cat', 100))
+        self.assertFalse(self.store.contains('cat', None))
+        loaded_bows, queries, indexes, keys, terms = self.store.load(
+            'cat', 100)
+        self.assertEqual(loaded_bows[0].se, 'a')
+        self.assertTrue(sparse.isspmatrix_csr(loaded_bows[0].matrix))
+        np.testing.assert_array_equal(loaded_bows[0].matrix.toarray(),
+                                      bows[0].matrix)
+        self.assertEqual(queries, ['foo', 'bar'])
+        self.assertEqual(indexes, [1, 2])
+        self.assertEqual(keys, [(1, 'd', 'foo'), (2, 'd', 'bar')])
+        self.assertEqual(terms, ['x', 'y'])
+
+    @mock.patch('seanalysis.feature_store.corpus_fingerprint',
+                return_value='f')
+    def test_key_computed_once(self, mock_fingerprint):
+        self.assertFalse(self.store.contains('cat', 100))
+        self.assertIsNone(self.store.load('cat', 100))
+        self.store.key('cat', 100)
+        self.assertEqual(mock_fingerprint.call_count, 1)
+        self.store.key('cat', None)
+        self.assertEqual(mock_fingerprint.call_count, 2)
+
+    def test_corpus_fingerprint(self):
+        fingerprint = corpus_fingerprint(self.results_dir, 'cat', ['a'])
+        self.assertEqual(
+            fingerprint, corpus_fingerprint(self.results_dir, 'cat', ['a']))
+        with open(self.document, 'w') as f:
+            json.dump([{'url': 'foo'}], f)
+        self.assertNotEqual(
+            fingerprint, corpus_fingerprint(self.results_dir, 'cat', ['a']))
+        # Documents of the same size rewritten within the same second.
+        fingerprint = corpus_fingerprint(self.results_dir, 'cat', ['a'])
+        mtime = os.stat(self.document).st_mtime_ns
+        os.utime(self.document, ns=(mtime, mtime + 1000))
+        self.assertNotEqual(
+            fingerprint, corpus_fingerprint(self.results_dir, 'cat', ['a']))
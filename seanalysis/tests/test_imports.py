@@ -0,0 +1,25 @@
+import subprocess
+import sys
+import unittest
+
+# Libraries which must not be imported by the startup of the tool.
+HEAVY_MODULES = ['sklearn', 'nltk', 'sktensor', 'matplotlib', 'seaborn',
+                 'requests', 'joblib']
+
+
+def imported_modules(code):
+    """ Top-level modules imported by running code in a new interpreter. """
+    output = subprocess.check_output([
+        sys.executable, '-c', code + '\nimport sys\n'
+        'print("\\n".join(sys.modules))'], universal_newlines=True)
+    return {module.split('.')[0] for module in output.split()}
+
+
+class TestImports(unittest.TestCase):
+    def test_cli(self):
+        modules = imported_modules('import seanalysis.cli.cmd')
+        self.assertFalse(modules.intersection(HEAVY_MODULES))
+
+    def test_rank_metrics(self):
+        modules = imported_modules('import seanalysis.compare_sorting')
+        self.assertFalse(modules.intersection(HEAVY_MODULES))
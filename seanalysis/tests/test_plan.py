@@ -0,0 +1,57 @@
+import operator
+import unittest
+import mock
+from seanalysis import plan as pl
+from seanalysis.utils import SEAnalysisException
+
+
+@mock.patch('seanalysis.controller.controller.Controller.parse_config')
+@mock.patch('seanalysis.controller.controller.Controller.validate')
+class TestPlan(unittest.TestCase):
+    def setUp(self):
+        self.plan = {'analyses': [
+            {'command': 'cont', 'method': 'cmp', 'model': 'lda',
+             'config': {'components': 3}},
+            {'command': 'cont', 'method': 'cmp', 'model': 'nmf',
+             'config': ['components=3']},
+            {'command': 'rank', 'metric': 'KENDALL'}
+        ]}
+
+    def test_compile(self, mock_validate, mock_parse):
+        analysis_plan = pl.Plan(self.plan, 'results', ['a', 'b', 'c'],
+                                ['x', 'y'])
+        stages = analysis_plan.compile()
+        kinds = [key[0] for key in stages]
+        # Snippets and features are shared by the two models.
+        self.assertEqual(kinds.count('snippets'), 2)
+        self.assertEqual(kinds.count('features'), 2)
+        self.assertEqual(kinds.count('fit'), 4)
+        # Every pair of search engines is compared for every category.
+        self.assertEqual(kinds.count('urls'), 6)
+        self.assertEqual(kinds.count('metric'), 6)
+        self.assertEqual(len(analysis_plan.outputs), 10)
+        fit = stages[('fit', 1, 'y', ('a', 'b', 'c'))]
+        self.assertEqual(fit.deps, (
+            ('features', 'y', ('a', 'b', 'c'), 10, False, None, None),))
+        self.assertEqual(fit.args[2], ['components=3'])
+
+    def test_compile_invalid(self, mock_validate, mock_parse):
+        self.plan['analyses'].append({'command': 'foo'})
+        self.assertRaises(SEAnalysisException,
+                          pl.Plan(self.plan, 'r', ['a'], ['x']).compile)
+        self.plan['analyses'][-1] = {'command': 'rank', 'metric': 'KENDALL',
+                                     'search_engines': [['a', 'b', 'c']]}
+        self.assertRaises(SEAnalysisException,
+                          pl.Plan(self.plan, 'r', ['a'], ['x']).compile)
+
+    def test_run(self, mock_validate, mock_parse):
+        analysis_plan = pl.Plan(self.plan, 'results', ['a'], ['x'])
+        analysis_plan.stages = {
+            'a': pl.Stage(int, (), ('3',)),
+            'b': pl.Stage(operator.add, ('a',), (4,)),
+            'c': pl.Stage(operator.mul, ('a', 'b'), ())
+        }
+        analysis_plan.outputs = [pl.Output(0, 'x', ('a',), 'b'),
+                                 pl.Output(0, 'x', ('a',), 'c')]
+        # Intermediate outputs are released.
+        self.assertEqual(analysis_plan.run(), {'b': 7, 'c': 21})
@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from joblib import Parallel, delayed
+from seanalysis import profiling
+
+
+@profiling.profiled('square')
+def square(x):
+    return x * x
+
+
+def squares(x):
+    with profiling.category(str(x)):
+        return square(x)
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(profiling.disable)
+
+    def test_disabled(self):
+        self.assertIs(profiling.remote(squares), squares)
+        self.assertEqual(profiling.gather([1, 4]), [1, 4])
+        self.assertEqual(square(3), 9)
+
+    def test_stages(self):
+        profiler = profiling.enable()
+        with profiling.category('a'):
+            with profiling.stage('outer'):
+                square(2)
+                square(3)
+        square(4)
+        self.assertEqual(profiler.stats[('outer', 'a')][0], 1)
+        self.assertEqual(profiler.stats[('square', 'a')][0], 2)
+        self.assertEqual(profiler.stats[('square', None)][0], 1)
+        outer, inner = profiler.stats[('outer', 'a')],\
+            profiler.stats[('square', 'a')]
+        self.assertGreaterEqual(outer[1], inner[1])
+        report = profiler.report()
+        self.assertEqual(len(report['stages']), 3)
+        self.assertEqual(set(report['stages'][0]), {
+            'stage', 'category', 'calls', 'wall_time', 'cpu_time',
+            'peak_rss'})
+
+    def test_workers(self):
+        for jobs in [1, 2]:
+            profiler = profiling.enable()
+            results = profiling.gather(Parallel(n_jobs=jobs)(
+                delayed(profiling.remote(squares))(x) for x in [1, 2, 3]))
+            self.assertEqual(results, [1, 4, 9])
+            self.assertEqual(sorted(profiler.stats), [
+                ('square', '1'), ('square', '2'), ('square', '3')])
+
+    def test_dump(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        profiler = profiling.enable(cprofile=True)
+        with profiling.stage('outer'):
+            square(2)
+        profiler.dump(os.path.join(directory, 'profile.json'))
+        with open(os.path.join(directory, 'profile.json')) as report_file:
+            report = json.load(report_file)
+        self.assertEqual({stage['stage'] for stage in report['stages']},
+                         {'outer', 'square'})
+        self.assertEqual(profiler.dump_cprofile(
+            os.path.join(directory, 'profile.out')), 'outer')
+        self.assertTrue(os.path.isfile(os.path.join(directory,
+                                                    'profile.out')))
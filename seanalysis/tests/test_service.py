@@ -0,0 +1,123 @@
+import json
+import os
+from os.path import join
+import shutil
+import tempfile
+import threading
+import unittest
+import mock
+import numpy as np
+from seanalysis import service, utils
+from seanalysis.compare_sorting import find_distance
+from seanalysis.utils import SEAnalysisException
+
+SEARCH_ENGINES = ['bing', 'duckduckgo']
+
+
+def write_day(results_dir, date, queries=('a b', 'c d')):
+    for se in SEARCH_ENGINES:
+        directory = join(results_dir, date, 'x', se)
+        os.makedirs(directory)
+        for query in queries:
+            with open(join(directory, query + '-1'), 'w') as f:
+                json.dump([{'url': 'http://%s/%d' % (
+                    query.replace(' ', ''), (i * 7 + len(se)) % 12),
+                    'title': 't%d' % i, 'description': 's%d' % i}
+                    for i in range(10)], f)
+
+
+class TestResidentCorpus(unittest.TestCase):
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.results_dir)
+        write_day(self.results_dir, '2016-10-01')
+        write_day(self.results_dir, '2016-10-02')
+        self.corpus = service.ResidentCorpus(self.results_dir, ['x'],
+                                             SEARCH_ENGINES)
+        self.assertEqual(self.corpus.refresh(), {'x': 8})
+
+    def test_views(self):
+        self.assertEqual(self.corpus.snippets('x'), utils.load_snippets(
+            self.results_dir, 'x', SEARCH_ENGINES, per_day=False))
+        self.assertEqual(
+            self.corpus.snippets('x', per_day=True), utils.load_snippets(
+                self.results_dir, 'x', SEARCH_ENGINES, per_day=True))
+        self.assertEqual(self.corpus.titles('x'), utils.load_titles(
+            self.results_dir, 'x', SEARCH_ENGINES, per_day=False))
+        urls = utils.load_urls(self.results_dir, 'x', SEARCH_ENGINES)
+        rank = self.corpus.rank('x', SEARCH_ENGINES, 'KENDALL')
+        self.assertEqual(rank['dates'], ['2016-10-01', '2016-10-02'])
+        np.testing.assert_allclose(rank['distances'], find_distance(
+            None, urls, None, None, SEARCH_ENGINES, 'x', 'KENDALL', None, 10,
+            None, None, None))
+
+    def test_refresh(self):
+        rank = self.corpus.rank('x', SEARCH_ENGINES, 'KENDALL')
+        self.assertEqual(self.corpus.refresh(), {'x': 0})
+        self.assertIs(self.corpus.rank('x', SEARCH_ENGINES, 'KENDALL'), rank)
+        write_day(self.results_dir, '2016-10-03')
+        self.assertEqual(self.corpus.refresh(), {'x': 4})
+        self.assertEqual(self.corpus.status()['categories']['x']['version'],
+                         2)
+        self.assertEqual(len(self.corpus.rank(
+            'x', SEARCH_ENGINES, 'KENDALL')['distances']), 3)
+
+    def test_invalid(self):
+        self.assertRaises(SEAnalysisException, self.corpus.rank, 'y',
+                          SEARCH_ENGINES, 'KENDALL')
+        self.assertRaises(SEAnalysisException, self.corpus.rank, 'x',
+                          ['bing'], 'KENDALL')
+        self.assertRaises(SEAnalysisException, self.corpus.rank, 'x',
+                          ['bing', 'google'], 'KENDALL')
+        self.assertRaises(SEAnalysisException, self.corpus.model, 'x', 'foo')
+
+    def serve(self, refresh_interval=0):
+        address = join(self.results_dir, 'service.sock')
+        server = service.make_server(self.corpus, address, refresh_interval)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return address
+
+    def test_service(self):
+        address = self.serve()
+        status = service.request(address, '/status')
+        self.assertEqual(status['categories']['x']['documents'], 8)
+        rank = service.request(address, '/rank', category='x',
+                               search_engines=SEARCH_ENGINES, metric='G')
+        self.assertEqual(np.array(rank['distances']).shape, (2, 2, 1))
+        self.assertRaises(SEAnalysisException, service.request, address,
+                          '/rank', category='x')
+        self.assertRaises(SEAnalysisException, service.request, address,
+                          '/foo')
+
+    @mock.patch.dict('seanalysis.service.ctrl.SUPPORTED_MODELS',
+                     {'nmf': mock.MagicMock()})
+    @mock.patch('seanalysis.service.ctrl.Controller.fit_category')
+    @mock.patch('seanalysis.service.ctrl.Controller.build_features')
+    @mock.patch('seanalysis.service.ctrl.Controller.prepare')
+    def test_service_model(self, mock_prepare, mock_features, mock_fit):
+        address = self.serve(refresh_interval=3600)
+        mock_prepare.return_value = ([], {'components': 2})
+        mock_fit.return_value = [mock.MagicMock(se_dist=np.eye(2))]
+        answer = service.request(address, '/model', category='x',
+                                 model='nmf', method='cont',
+                                 config={'components': 2})
+        self.assertEqual(answer, [{'se_dist': [[1, 0], [0, 1]]}])
+        self.assertEqual(mock_features.call_count, 1)
+
+        # Unexpected errors are answered and the service keeps running.
+        mock_fit.side_effect = ValueError('foo')
+        with self.assertRaises(SEAnalysisException) as context:
+            service.request(address, '/model', category='x', model='nmf',
+                            method='cont', config={'components': 3})
+        self.assertIn('ValueError: foo', str(context.exception))
+        # As are errors of the refresh before a request.
+        self.corpus.refreshed = 0
+        with mock.patch.object(self.corpus, 'refresh',
+                               side_effect=OSError('bar')):
+            self.assertRaises(SEAnalysisException, service.request, address,
+                              '/status')
+        self.assertEqual(service.request(address, '/refresh'), {'x': 0})
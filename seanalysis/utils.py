@@ -19,10 +19,10 @@ import json
 import glob
 import io
 import re
-import requests
 import jsonschema
 from os import listdir
 from jsonschema import validate
+from seanalysis import profiling
 
 
 SCHEMA = {
@@ -125,6 +125,7 @@ def load_config(path=None):
             'Your configuration file is not valid, {!s}'.format(e.message))
 
 
+@profiling.profiled('load_document')
 def load_document(path):
     """
     Loads document of results in a JSON format.
@@ -159,6 +160,7 @@ def get_url(document, query_category, se, index=0, edit=True, redirection=False)
         return NO_RESULT
 
     if redirection:
+        import requests
         r = requests.get(url)
         if r.history and (r.history[-1].status_code == requests.codes.moved or
                           r.history[-1].status_code == requests.codes.found or
@@ -280,6 +282,7 @@ def get_query_se(path, se=False):
         else (fname.rsplit('-', 1)[0], date)
 
 
+@profiling.profiled('get_result_dirs')
 def get_result_dirs(results_dir, query_category, search_engines, date=False):
     """
     Gets a list of directories of the results based on the given query category
@@ -355,7 +358,18 @@ def load_snippets(results_dir, query_category, search_engines, N=10,
     snippets of results.
     """
     dirs = get_result_dirs(results_dir, query_category, search_engines)
+    return _load_snippets(dirs, results_dir, query_category, search_engines,
+                          N, per_day)
 
+
+def _load_snippets(dirs, results_dir, query_category, search_engines, N,
+                   per_day):
+    """
+    Collect the snippets of the given documents of results.
+
+    :returns: Initialized dictionary keyed by search engine containing the
+    snippets of results.
+    """
     snippets = {se: OrderedDict() for se in search_engines}
     for path in dirs:
         stripped_path = path.replace(results_dir, '', 1)
@@ -366,6 +380,78 @@ def load_snippets(results_dir, query_category, search_engines, N=10,
     return snippets
 
 
+class DayBatches(object):
+    """
+    This class represents the snippets of the results of a query category
+    as a sequence of batches; one for each date when results were retrieved.
+
+    Documents of results are loaded lazily, i.e. the documents of a date are
+    only loaded when its batch is requested, so the results of a query
+    category are never fully loaded in memory. The paths of documents are
+    scanned once, when they are first needed.
+    """
+    def __init__(self, results_dir, query_category, search_engines, N=10,
+                 per_day=True):
+        self.results_dir = results_dir
+        self.query_category = query_category
+        self.search_engines = search_engines
+        self.N = N
+        self.per_day = per_day
+        self._paths = None
+
+    def _scan(self):
+        """
+        Scan the paths of the documents of every date.
+
+        :return: `OrderedDict` keyed by date (sorted) containing the sorted
+        paths of documents; dates without documents are omitted.
+        """
+        paths = OrderedDict()
+        for date in sorted(listdir(self.results_dir)):
+            dirs = sorted(sum((glob.glob(
+                join(self.results_dir, date, self.query_category, se, '*'))
+                for se in self.search_engines), []))
+            if dirs:
+                paths[date] = dirs
+        return paths
+
+    def _date_paths(self):
+        if self._paths is None:
+            self._paths = self._scan()
+        return self._paths
+
+    def dates(self):
+        """
+        Get the dates when results were retrieved.
+
+        :return: Sorted list of dates.
+        """
+        return list(self._date_paths())
+
+    def queries(self):
+        """
+        Get the queries of the query category without loading any document.
+
+        :return: Sorted list of queries.
+        """
+        return sorted({
+            get_query_se(path.replace(self.results_dir, '', 1))[0]
+            for paths in self._date_paths().values() for path in paths})
+
+    def __iter__(self):
+        """
+        Iterate over the batches of snippets.
+
+        :return: Generator of tuples (date, snippets), where snippets is a
+        dictionary keyed by search engine containing the snippets of results
+        retrieved on date.
+        """
+        for date, paths in self._date_paths().items():
+            yield date, _load_snippets(
+                paths, self.results_dir, self.query_category,
+                self.search_engines, self.N, self.per_day)
+
+
 def set_titles(titles, document, query_category, se, date, query, N, per_day):
     """
     This function sets the titles to the given dictionary according to the
@@ -415,6 +501,18 @@ def load_titles(results_dir, query_category, search_engines, N=10,
     titles of results.
     """
     dirs = get_result_dirs(results_dir, query_category, search_engines)
+    return _load_titles(dirs, results_dir, query_category, search_engines, N,
+                        per_day)
+
+
+def _load_titles(dirs, results_dir, query_category, search_engines, N,
+                 per_day):
+    """
+    Collect the titles of the given documents of results.
+
+    :returns: Initialized dictionary keyed by search engine containing the
+    titles of results.
+    """
     titles = {se: OrderedDict() for se in search_engines}
     for path in dirs:
         stripped_path = path.replace(results_dir, '', 1)
@@ -442,6 +540,16 @@ def load_urls(results_dir, query_category, search_engines, N=10):
     the N urls of results.
     """
     dirs = get_result_dirs(results_dir, query_category, search_engines)
+    return _load_urls(dirs, results_dir, query_category, N)
+
+
+def _load_urls(dirs, results_dir, query_category, N):
+    """
+    Collect the urls of the given documents of results.
+
+    :returns: A dictionary keyed by search engine, date and query containing
+    the N urls of results.
+    """
     urls = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: [])))
     for path in dirs:
         stripped_path = path.replace(results_dir, '', 1)
@@ -5,7 +5,7 @@ PACKAGE_NAME = "seanalysis"
 SHORT_DESCRIPTION = 'Tools for Search Engine Similarity Analysis'
 
 PACKAGES_ROOT = '.'
-PACKAGES = find_packages(PACKAGES_ROOT)
+PACKAGES = find_packages(PACKAGES_ROOT, exclude=['benchmarks'])
 
 # Package meta
 CLASSIFIERS = []